@@ -0,0 +1,98 @@
+"""
+A recurring series booked with one book_appointments_batch request versus the
+same slots booked with one book_appointment request each. Reports series/s and
+per-series latency for both.
+
+    python benchmarks/bench_batch_booking.py --series 200 --size 8 --workers 8
+
+Needs a scratch Postgres: TEST_DATABASE_URL, or the pgserver package. Tables are truncated.
+"""
+
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from datetime import date, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "tests"))
+from support import database_dsn, apply_schema, reset_tables, use_database, load_http_function, make_request
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--series", type=int, default=200, help="Series booked per mode, one patient each")
+    parser.add_argument("--size", type=int, default=8, help="Weekly appointments per series")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    dsn = database_dsn()
+    if dsn is None:
+        sys.exit("No Postgres: set TEST_DATABASE_URL or install pgserver")
+    apply_schema(dsn)
+    book = load_http_function("bookAppointment")
+    first_day = date.today() + timedelta(days=7)
+
+    def series_start(i):
+        # Every series gets its own weekday/time column, so no two series collide
+        return first_day + timedelta(days=i // 20 * 7 * args.size + i % 20 // 10), f"{8 + i % 10:02d}:00"
+
+    def batch(i):
+        start_date, slot_time = series_start(i)
+        _, status, _ = book.book_appointments_batch(make_request({
+            "patientId": f"patient-{i}", "serviceType": "Physiotherapy",
+            "recurrence": {"startDate": start_date.isoformat(), "time": slot_time, "frequency": "weekly", "count": args.size},
+        }, uid=f"patient-{i}"))
+        return [status]
+
+    def singles(i):
+        start_date, slot_time = series_start(i)
+        statuses = []
+        for week in range(args.size):
+            _, status, _ = book.book_appointment(make_request({
+                "patientId": f"patient-{i}", "serviceType": "Physiotherapy",
+                "appointmentDate": (start_date + timedelta(weeks=week)).isoformat(), "appointmentTime": slot_time,
+            }, uid=f"patient-{i}"))
+            statuses.append(status)
+        return statuses
+
+    results = {}
+    for mode, book_series in (("batch", batch), ("singles", singles)):
+        reset_tables(dsn)
+        db = use_database(dsn, max_size=args.workers)
+
+        def timed(i):
+            started = time.perf_counter()
+            statuses = book_series(i)
+            return statuses, time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            outcomes = list(pool.map(timed, range(args.series)))
+        elapsed = time.perf_counter() - started
+
+        conn = db.get_connection()
+        with conn.cursor() as cur:
+            cur.execute("SELECT count(*) FROM appointments;")
+            booked = cur.fetchone()[0]
+        db.release_connection(conn)
+
+        latencies = sorted(seconds for _, seconds in outcomes)
+        results[mode] = {
+            "requests": sum(len(statuses) for statuses, _ in outcomes),
+            "errors": sum(1 for statuses, _ in outcomes for status in statuses if status != 200),
+            "appointments_booked": booked,
+            "series_per_second": round(args.series / elapsed, 1),
+            "p50_series_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+            "p99_series_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 1),
+        }
+
+    results["speedup"] = round(results["batch"]["series_per_second"] / results["singles"]["series_per_second"], 1)
+    print(json.dumps(dict({"series": args.series, "size": args.size, "workers": args.workers}, **results), indent=2))
+    expected = args.series * args.size
+    sys.exit(0 if all(results[mode]["appointments_booked"] == expected for mode in ("batch", "singles")) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Concurrency benchmark for book_appointment: many patients race for a few slots.
+Reports bookings/s and verifies there are zero double-bookings.
+
+    python benchmarks/bench_booking_contention.py --workers 32 --attempts 2000 --slots 16
+
+Needs a scratch Postgres: TEST_DATABASE_URL, or the pgserver package. Tables are truncated.
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+from pathlib import Path
+from datetime import date, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "tests"))
+from support import database_dsn, apply_schema, reset_tables, use_database, load_http_function, make_request
+
+SERVICES = ["Physiotherapy", "Dentistry", "Radiology"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--attempts", type=int, default=2000)
+    parser.add_argument("--slots", type=int, default=16, help="Distinct slots the attempts compete for")
+    args = parser.parse_args()
+
+    dsn = database_dsn()
+    if dsn is None:
+        sys.exit("No Postgres: set TEST_DATABASE_URL or install pgserver")
+    apply_schema(dsn)
+    reset_tables(dsn)
+    db = use_database(dsn, max_size=args.workers)
+    book = load_http_function("bookAppointment")
+
+    first_day = date.today() + timedelta(days=7)
+    slot_grid = [(first_day + timedelta(days=i // 16), f"{9 + (i % 16) // 2:02d}:{(i % 2) * 30:02d}")
+                 for i in range(args.slots)]
+    rng = random.Random(7)
+    attempts = [(f"patient-{i}", *rng.choice(slot_grid), rng.choice(SERVICES)) for i in range(args.attempts)]
+
+    def attempt(args_):
+        uid, slot_date, slot_time, service = args_
+        started = time.perf_counter()
+        _, status, _ = book.book_appointment(make_request({
+            "patientId": uid, "appointmentDate": slot_date.isoformat(),
+            "appointmentTime": slot_time, "serviceType": service,
+        }, uid=uid))
+        return status, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(attempt, attempts))
+    elapsed = time.perf_counter() - started
+
+    conn = db.get_connection()
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT count(*) FROM (
+                SELECT 1 FROM appointments WHERE status != 'cancelled'
+                GROUP BY appointment_date, appointment_time HAVING count(*) > 1
+            ) dup;
+        """)
+        double_booked = cur.fetchone()[0]
+        cur.execute("SELECT count(*) FROM appointments WHERE status != 'cancelled';")
+        booked = cur.fetchone()[0]
+    db.release_connection(conn)
+
+    statuses = [status for status, _ in results]
+    latencies = sorted(seconds for _, seconds in results)
+    print(json.dumps({
+        "workers": args.workers,
+        "attempts": len(attempts),
+        "slots": len(slot_grid),
+        "booked": booked,
+        "conflicts_409": statuses.count(409),
+        "errors": len(statuses) - statuses.count(200) - statuses.count(409),
+        "double_booked_slots": double_booked,
+        "requests_per_second": round(len(attempts) / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 1),
+    }, indent=2))
+    sys.exit(1 if double_booked or booked != len(slot_grid) else 0)
+
+
+if __name__ == "__main__":
+    main()
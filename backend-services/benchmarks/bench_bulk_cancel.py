@@ -0,0 +1,115 @@
+"""
+A clinic closure cancelled with one bulk_cancel_appointments request versus one
+cancel_appointment request per appointment. Reports appointments/s for both and
+checks that every appointment is cancelled with exactly one outbox event.
+
+    python benchmarks/bench_bulk_cancel.py --appointments 1000 --workers 8
+
+Needs a scratch Postgres: TEST_DATABASE_URL, or the pgserver package. Tables are truncated.
+"""
+
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from datetime import date, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "tests"))
+from support import (database_dsn, apply_schema, reset_tables, use_database, load_http_function,
+                     make_request, fake_verify_firebase_token)
+
+
+def seed_appointments(db, count, first_day):
+    """One appointment per patient, 32 slots a day from first_day on. Returns the ids."""
+    conn = db.get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.executemany("""
+                INSERT INTO appointments (patient_id, patient_email, appointment_date, appointment_time, service_type)
+                VALUES (%s, %s, %s, %s, 'Physiotherapy');
+            """, [(f"patient-{i}", f"patient-{i}@example.com", first_day + timedelta(days=i // 32),
+                   f"{8 + i % 32 // 4:02d}:{i % 4 * 15:02d}") for i in range(count)])
+            cur.execute("SELECT id, patient_id FROM appointments ORDER BY id;")
+            rows = cur.fetchall()
+        conn.commit()
+        return rows
+    finally:
+        db.release_connection(conn)
+
+
+def counts(db):
+    conn = db.get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT count(*) FILTER (WHERE status = 'cancelled') FROM appointments;")
+            cancelled = cur.fetchone()[0]
+            cur.execute("SELECT count(*) FROM appointment_event_outbox;")
+            return cancelled, cur.fetchone()[0]
+    finally:
+        db.release_connection(conn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--appointments", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent single cancellations")
+    args = parser.parse_args()
+
+    dsn = database_dsn()
+    if dsn is None:
+        sys.exit("No Postgres: set TEST_DATABASE_URL or install pgserver")
+    apply_schema(dsn)
+    cancel = load_http_function("cancel_appointment")
+    staff_token = lambda request: dict(fake_verify_firebase_token(request), **{cancel.STAFF_CLAIM: True})
+    first_day = date.today() + timedelta(days=7)
+    last_day = first_day + timedelta(days=(args.appointments - 1) // 32)
+
+    def bulk(rows):
+        cancel.verify_firebase_token = staff_token
+        _, status, _ = cancel.bulk_cancel_appointments(make_request({
+            "startDate": first_day.isoformat(), "endDate": last_day.isoformat(), "reason": "Clinic closed",
+        }, uid="staff-1"))
+        return [status]
+
+    def singles(rows):
+        cancel.verify_firebase_token = fake_verify_firebase_token
+
+        def one(row):
+            appointment_id, patient_id = row
+            _, status, _ = cancel.cancel_appointment(make_request(
+                {"appointmentId": appointment_id, "patientId": patient_id}, uid=patient_id))
+            return status
+
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            return list(pool.map(one, rows))
+
+    results = {}
+    for mode, cancel_all in (("bulk", bulk), ("singles", singles)):
+        reset_tables(dsn)
+        db = use_database(dsn, max_size=args.workers)
+        rows = seed_appointments(db, args.appointments, first_day)
+
+        started = time.perf_counter()
+        statuses = cancel_all(rows)
+        elapsed = time.perf_counter() - started
+
+        cancelled, events = counts(db)
+        results[mode] = {
+            "requests": len(statuses),
+            "errors": sum(1 for status in statuses if status != 200),
+            "cancelled": cancelled,
+            "outbox_events": events,
+            "seconds": round(elapsed, 3),
+            "appointments_per_second": round(cancelled / elapsed),
+        }
+
+    results["speedup"] = round(results["bulk"]["appointments_per_second"] / results["singles"]["appointments_per_second"], 1)
+    print(json.dumps(dict({"appointments": args.appointments, "workers": args.workers}, **results), indent=2))
+    sys.exit(0 if all(results[mode]["cancelled"] == results[mode]["outbox_events"] == args.appointments
+                      for mode in ("bulk", "singles")) else 1)
+
+
+if __name__ == "__main__":
+    main()
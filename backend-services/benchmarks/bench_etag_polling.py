@@ -0,0 +1,123 @@
+"""
+A polling client pattern against get_appointments: every poll re-fetches the first
+page, either unconditionally or with If-None-Match carrying the last ETag. Some
+polls follow a change to the patient's appointments. Reports requests/s, latency,
+bytes sent and the share of 304s for both modes.
+
+    python benchmarks/bench_etag_polling.py --patients 50 --appointments 200 --polls 4000 --change-rate 0.05
+
+Needs a scratch Postgres: TEST_DATABASE_URL, or the pgserver package. Tables are truncated.
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "tests"))
+from support import database_dsn, apply_schema, reset_tables, use_database, load_http_function, make_request
+
+# One row per (patient, n), each in its own slot: 32 quarter-hours a day from 08:00
+SEED_QUERY = """
+INSERT INTO appointments (patient_id, patient_email, appointment_date, appointment_time, service_type, notes)
+SELECT 'patient-' || (n / %(per_patient)s), 'patient-' || (n / %(per_patient)s) || '@example.com',
+       current_date + 7 + (n / 32), time '08:00' + make_interval(mins => (n %% 32) * 15),
+       'Physiotherapy', 'Bring previous scans'
+FROM generate_series(0, %(total)s - 1) AS n;
+"""
+
+# A change a poll should notice: the appointment notes are edited
+TOUCH_QUERY = """
+UPDATE appointments SET notes = notes || '.'
+WHERE id = (SELECT id FROM appointments WHERE patient_id = %s ORDER BY id LIMIT 1);
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--patients", type=int, default=50)
+    parser.add_argument("--appointments", type=int, default=200, help="Appointments per patient")
+    parser.add_argument("--polls", type=int, default=4000, help="Polls per mode")
+    parser.add_argument("--change-rate", type=float, default=0.05, help="Share of polls preceded by a change")
+    parser.add_argument("--limit", type=int, default=50, help="Page size")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    dsn = database_dsn()
+    if dsn is None:
+        sys.exit("No Postgres: set TEST_DATABASE_URL or install pgserver")
+    apply_schema(dsn)
+    reset_tables(dsn)
+    db = use_database(dsn, max_size=args.workers + 1)
+    appointments = load_http_function("get_appointments")
+
+    conn = db.get_connection()
+    with conn.cursor() as cur:
+        cur.execute(SEED_QUERY, {"per_patient": args.appointments, "total": args.patients * args.appointments})
+    conn.commit()
+    db.release_connection(conn)
+
+    rng = random.Random(7)
+    polls = [(f"patient-{rng.randrange(args.patients)}", rng.random() < args.change_rate) for _ in range(args.polls)]
+
+    def touch(patient_id):
+        conn = db.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(TOUCH_QUERY, (patient_id,))
+            conn.commit()
+        finally:
+            db.release_connection(conn)
+
+    results = {}
+    for mode in ("unconditional", "if_none_match"):
+        etags = {} # What each patient's client last saw
+
+        def poll(args_):
+            patient_id, changed = args_
+            if changed:
+                touch(patient_id)
+            headers = {}
+            if mode == "if_none_match" and patient_id in etags:
+                headers["If-None-Match"] = etags[patient_id]
+            started = time.perf_counter()
+            body, status, response_headers = appointments.get_appointments(make_request(
+                uid=patient_id, method="GET", headers=headers, query_string={"limit": args.limit}))
+            elapsed = time.perf_counter() - started
+            etags[patient_id] = response_headers.get("ETag")
+            return status, len(body), elapsed
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            outcomes = list(pool.map(poll, polls))
+        total = time.perf_counter() - started
+
+        latencies = sorted(elapsed for _, _, elapsed in outcomes)
+        statuses = [status for status, _, _ in outcomes]
+        results[mode] = {
+            "requests_per_second": round(len(polls) / total, 1),
+            "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+            "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 2),
+            "bytes_sent": sum(size for _, size, _ in outcomes),
+            "responses_304": statuses.count(304),
+            "errors": len(statuses) - statuses.count(200) - statuses.count(304),
+        }
+
+    plain, conditional = results["unconditional"], results["if_none_match"]
+    print(json.dumps({
+        "patients": args.patients,
+        "appointments_per_patient": args.appointments,
+        "polls": args.polls,
+        "change_rate": args.change_rate,
+        **results,
+        "bytes_saved": f"{100 * (1 - conditional['bytes_sent'] / plain['bytes_sent']):.1f}%",
+        "speedup": round(conditional["requests_per_second"] / plain["requests_per_second"], 1),
+    }, indent=2))
+    sys.exit(1 if plain["errors"] or conditional["errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Throughput and publish-to-ack latency of the streaming pull consumer
+(sendNotification/consumer.py). Messages go through consumer.process_message on a
+pool of CONSUMER_WORKERS threads, as the subscriber client runs it. Emails go to a
+local aiosmtpd server that requires STARTTLS and AUTH. Pushes go to a fake FCM.
+
+    python benchmarks/bench_notification_consumer.py --messages 2000 --workers 32 --smtp-pool-size 4 --smtp-delay-ms 20
+
+By default the Pub/Sub client itself is not measured: messages are handed to the
+callback directly, and its batched acks happen off the callback threads anyway.
+With --emulator the messages are published to a Pub/Sub emulator instead and pulled
+by consumer.run_forever(), flow control and ack batching included:
+
+    gcloud beta emulators pubsub start --project=bench-project &
+    export PUBSUB_EMULATOR_HOST=localhost:8085
+    python benchmarks/bench_notification_consumer.py --emulator --messages 2000
+
+Each --emulator run creates its own topic and subscription. Needs the sendNotification
+requirements plus aiosmtpd and cryptography.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from pathlib import Path
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "tests"))
+from support import load_function_module, FakeMessaging, FakeTokenRegistry, FakePubsubMessage, LocalSmtpServer
+
+
+def run_in_process(args, consumer, payloads):
+    """Hands every message to process_message on a worker pool. Returns (ack latencies, nacked, processing times, seconds)."""
+    messages = [FakePubsubMessage(message_data, f"msg-{i}") for i, message_data in enumerate(payloads)]
+
+    def timed_process(message):
+        began = time.perf_counter()
+        consumer.process_message(message)
+        return time.perf_counter() - began
+
+    # Everything is published at once, as by a reminder sweep: ack latency includes the backlog wait
+    started = time.time()
+    for message in messages:
+        message.publish_time = datetime.fromtimestamp(started, timezone.utc)
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="notify") as pool:
+        service_times = sorted(pool.map(timed_process, messages))
+    elapsed = time.time() - started
+
+    latencies = sorted(message.settled_at - started for message in messages if message.outcome == "ack")
+    nacked = sum(1 for message in messages if message.outcome == "nack")
+    return latencies, nacked, service_times, elapsed
+
+
+def run_with_emulator(args, consumer, payloads):
+    """
+    Publishes every message to a fresh topic on the emulator, then runs consumer.run_forever()
+    on a daemon thread until all are acked (redeliveries of nacked ones included) or the
+    timeout passes. Returns (ack latencies, nacks, processing times, seconds).
+    """
+    from google.cloud import pubsub_v1
+
+    publisher = pubsub_v1.PublisherClient()
+    subscriber = pubsub_v1.SubscriberClient()
+    # The topic is named after the subscription, so each run gets both fresh
+    topic_path = publisher.topic_path(consumer.PROJECT_ID, consumer.NOTIFICATION_SUBSCRIPTION_ID)
+    subscription_path = subscriber.subscription_path(consumer.PROJECT_ID, consumer.NOTIFICATION_SUBSCRIPTION_ID)
+    # No retries, so a missing emulator fails at once instead of after the default deadline
+    publisher.create_topic(request={"name": topic_path}, retry=None, timeout=30)
+    subscriber.create_subscription(request={"name": subscription_path, "topic": topic_path, "ack_deadline_seconds": 60},
+                                   retry=None, timeout=30)
+
+    futures = [publisher.publish(topic_path, json.dumps(message_data).encode("utf-8")) for message_data in payloads]
+    for future in futures:
+        future.result(timeout=60)
+    print(f"Published {len(futures)} messages to {topic_path}.")
+
+    latencies = []
+    service_times = []
+    outcomes = {"nacked": 0}
+    lock = threading.Lock()
+    all_acked = threading.Event()
+    process_message = consumer.process_message
+
+    def timed_process(message):
+        began = time.perf_counter()
+        process_message(message)
+        with lock:
+            service_times.append(time.perf_counter() - began)
+
+    def record_settled(message, acked=True):
+        # publish_time is stamped by the emulator, so this is the real publish-to-ack latency
+        with lock:
+            if acked:
+                latencies.append(time.time() - message.publish_time.timestamp())
+                if len(latencies) >= len(payloads):
+                    all_acked.set()
+            else:
+                outcomes["nacked"] += 1
+
+    consumer.process_message = timed_process # run_forever() passes this as the subscriber callback
+    consumer.record_settled = record_settled
+    started = time.time()
+    threading.Thread(target=consumer.run_forever, name="bench-consumer", daemon=True).start()
+    all_acked.wait(args.timeout)
+    elapsed = time.time() - started
+
+    with lock:
+        return sorted(latencies), outcomes["nacked"], sorted(service_times), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=32, help="CONSUMER_WORKERS")
+    parser.add_argument("--smtp-pool-size", type=int, default=4, help="SMTP_POOL_SIZE")
+    parser.add_argument("--smtp-delay-ms", type=float, default=20.0, help="Simulated provider latency per email")
+    parser.add_argument("--fcm-latency-ms", type=float, default=20.0, help="Simulated FCM round trip per call")
+    parser.add_argument("--emulator", action="store_true",
+                        help="Publish to the Pub/Sub emulator at PUBSUB_EMULATOR_HOST and pull with run_forever()")
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds to wait for every ack with --emulator")
+    args = parser.parse_args()
+    if args.emulator and not os.environ.get("PUBSUB_EMULATOR_HOST"):
+        sys.exit("--emulator needs PUBSUB_EMULATOR_HOST (gcloud beta emulators pubsub start)")
+    if args.emulator:
+        # run_forever() reads these at import
+        os.environ.setdefault("GCP_PROJECT", "bench-project")
+        os.environ["NOTIFICATION_SUBSCRIPTION_ID"] = f"bench-notifications-{int(time.time())}"
+
+    with LocalSmtpServer(delay=args.smtp_delay_ms / 1000) as smtp_server:
+        os.environ.update({
+            "CONSUMER_WORKERS": str(args.workers), "SMTP_POOL_SIZE": str(args.smtp_pool_size),
+            "DEDUP_BACKEND": "memory", "PROFILE_CACHE_LISTENER": "false",
+        })
+        notifications = load_function_module("sendNotification", "main", alias="main")
+        consumer = load_function_module("sendNotification", "consumer")
+        from push import PushSender
+        from shared import patient_profiles
+
+        patients = [f"patient-{i}" for i in range(args.messages)]
+        for patient_id in patients: # A warm profile cache, so Firestore isn't needed
+            patient_profiles.cache.put(patient_id, {"email": f"{patient_id}@example.com", "firstName": "Sam"})
+        backend = FakeMessaging(latency=args.fcm_latency_ms / 1000)
+        notifications.push_sender = PushSender(
+            backend=backend, token_registry=FakeTokenRegistry({patient_id: [f"{patient_id}-phone"] for patient_id in patients}),
+        )
+
+        payloads = [
+            {
+                "eventId": f"evt-{i}", "eventType": "appointmentBooked", "appointmentId": i,
+                "patientId": patient_id, "appointmentDate": "2026-11-02", "appointmentTime": "09:30",
+                "serviceType": "Physiotherapy", "notes": "",
+            }
+            for i, patient_id in enumerate(patients)
+        ]
+        run = run_with_emulator if args.emulator else run_in_process
+        latencies, nacked, service_times, elapsed = run(args, consumer, payloads)
+
+    def percentile(values, p):
+        return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 1) if values else None
+
+    print(json.dumps({
+        "messages": args.messages,
+        "workers": args.workers,
+        "smtp_pool_size": args.smtp_pool_size,
+        "mode": "emulator" if args.emulator else "in_process",
+        "acked": len(latencies),
+        "nacked": nacked,
+        "emails_accepted": smtp_server.messages,
+        "smtp_connections": smtp_server.connections,
+        "pushes_delivered": len(backend.delivered),
+        "messages_per_second": round(args.messages / elapsed, 1),
+        "p50_ack_ms": percentile(latencies, 0.50),
+        "p99_ack_ms": percentile(latencies, 0.99),
+        "p50_processing_ms": percentile(service_times, 0.50),
+        "p99_processing_ms": percentile(service_times, 0.99),
+    }, indent=2))
+    sys.exit(0 if len(latencies) == args.messages else 1)
+
+
+if __name__ == "__main__":
+    main()
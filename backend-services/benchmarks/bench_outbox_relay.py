@@ -0,0 +1,102 @@
+"""
+Outbox relay throughput by batch size: fills appointment_event_outbox with N events
+and drains it with outboxRelay's drain_once() rounds into an in-process FakePublisher,
+once per OUTBOX_BATCH_SIZE. Reports rows/s and drain rounds, so the cost per round
+(advisory lock, SELECT, UPDATE, commit) shows up against the batch size.
+
+    python benchmarks/bench_outbox_relay.py --events 5000 --batch-sizes 1,10,100,500,2000
+
+Needs a scratch Postgres: TEST_DATABASE_URL, or the pgserver package. Tables are truncated.
+No Pub/Sub: publishes settle at once, so this measures the database side of the relay.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "tests"))
+from support import database_dsn, apply_schema, reset_tables, use_database, load_function_module, FakePublisher
+
+# shared.events creates its PublisherClient at import; this address needs no credentials
+os.environ.setdefault("PUBSUB_EMULATOR_HOST", "localhost:8085")
+
+
+def fill_outbox(db, outbox, count, patients):
+    conn = db.get_connection()
+    try:
+        with conn.cursor() as cur:
+            for start in range(0, count, 1000):
+                outbox.enqueue_events(cur, [
+                    {"eventType": "appointmentBooked", "patientId": f"patient-{n % patients}", "appointmentId": str(n)}
+                    for n in range(start, min(start + 1000, count))
+                ])
+        conn.commit()
+    finally:
+        db.release_connection(conn)
+
+
+def count_pending(db):
+    conn = db.get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT count(*) FROM appointment_event_outbox WHERE published_at IS NULL;")
+            return cur.fetchone()[0]
+    finally:
+        db.release_connection(conn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--patients", type=int, default=200, help="Distinct ordering keys")
+    parser.add_argument("--batch-sizes", default="1,10,100,500,2000")
+    args = parser.parse_args()
+
+    dsn = database_dsn()
+    if dsn is None:
+        sys.exit("No Postgres: set TEST_DATABASE_URL or install pgserver")
+    apply_schema(dsn)
+    db = use_database(dsn, max_size=2)
+    relay = load_function_module("outboxRelay")
+    from shared import events, outbox
+
+    results = {}
+    for batch_size in [int(size) for size in args.batch_sizes.split(",")]:
+        reset_tables(dsn)
+        fill_outbox(db, outbox, args.events, args.patients)
+        events.publisher = FakePublisher()
+        relay.OUTBOX_BATCH_SIZE = batch_size
+
+        conn = db.get_connection()
+        rounds = 0
+        published = 0
+        started = time.perf_counter()
+        try:
+            while True:
+                claimed, round_published = relay.drain_once(conn, batch_size=batch_size)
+                rounds += 1
+                published += round_published
+                if claimed < batch_size:
+                    break
+        finally:
+            db.release_connection(conn)
+        elapsed = time.perf_counter() - started
+
+        results[f"batch_{batch_size}"] = {
+            "published": published,
+            "left_pending": count_pending(db),
+            "rounds": rounds,
+            "rows_per_second": round(published / elapsed),
+            "ms_per_round": round(elapsed / rounds * 1000, 2),
+        }
+
+    print(json.dumps({"events": args.events, "patients": args.patients, **results}, indent=2))
+    sys.exit(0 if all(result["published"] == args.events and result["left_pending"] == 0
+                      for result in results.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
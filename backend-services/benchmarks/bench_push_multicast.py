@@ -0,0 +1,68 @@
+"""
+Throughput of PushSender against a local FCM stand-in with a fixed per-call latency.
+Reports msgs/s (device notifications delivered) and FCM calls, with a share of
+devices failing transiently so the retry path is measured as well.
+
+    python benchmarks/bench_push_multicast.py --patients 200 --devices 3 --latency-ms 20 --flaky 0.05
+
+Needs firebase-admin and google-cloud-firestore installed; nothing is sent to FCM.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "tests"))
+from support import load_function_module, FakeMessaging, FakeTokenRegistry
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--patients", type=int, default=200)
+    parser.add_argument("--devices", type=int, default=3, help="Devices per patient")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent sends, as CHANNEL_WORKERS in push mode")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Simulated FCM round trip per call")
+    parser.add_argument("--flaky", type=float, default=0.05, help="Share of devices failing once")
+    args = parser.parse_args()
+
+    os.environ.setdefault("PUSH_RETRY_BACKOFF_SECONDS", "0")
+    push = load_function_module("sendNotification", "push")
+
+    rng = random.Random(7)
+    tokens_by_patient = {f"patient-{p}": [f"token-{p}-{d}" for d in range(args.devices)]
+                         for p in range(args.patients)}
+    all_tokens = [token for tokens in tokens_by_patient.values() for token in tokens]
+    flaky = {token: 1 for token in all_tokens if rng.random() < args.flaky}
+    backend = FakeMessaging(flaky=flaky, latency=args.latency_ms / 1000)
+    sender = push.PushSender(backend=backend, token_registry=FakeTokenRegistry(tokens_by_patient))
+
+    def send(patient_id):
+        return sender.send_to_patient(patient_id, "Appointment booked", "See you soon", "appointmentBooked")
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(send, tokens_by_patient))
+    elapsed = time.perf_counter() - started
+
+    delivered_tokens = [token for token, _ in backend.delivered]
+    print(json.dumps({
+        "patients": args.patients,
+        "devices": len(all_tokens),
+        "flaky_devices": len(flaky),
+        "fcm_calls": len(backend.calls),
+        "delivered": len(delivered_tokens),
+        "pushed_twice": len(delivered_tokens) - len(set(delivered_tokens)),
+        "patients_failed": results.count(False),
+        "messages_per_second": round(len(delivered_tokens) / elapsed, 1),
+        "seconds": round(elapsed, 3),
+    }, indent=2))
+    sys.exit(1 if len(delivered_tokens) != len(set(delivered_tokens)) else 0)
+
+
+if __name__ == "__main__":
+    main()
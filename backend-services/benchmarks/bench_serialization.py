@@ -0,0 +1,108 @@
+"""
+Microbenchmark of turning appointment rows into a JSON response body: the
+per-row loop get_appointments used before shared/serialization.py, against
+serialization.rows_to_dicts + dumps with the stdlib json fallback and with orjson.
+
+    python benchmarks/bench_serialization.py --rows 10000 --repeat 20
+
+Needs no database: rows and cursor.description are built in memory with the
+types psycopg2 returns. orjson is optional; without it that variant is skipped.
+"""
+
+import gc
+import sys
+import json
+import time
+import argparse
+import statistics
+from pathlib import Path
+from types import SimpleNamespace
+from datetime import date, time as time_of_day, datetime, timedelta, timezone
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR)) # For `shared`
+from shared import serialization
+
+# (name, psycopg2 type code) as in cursor.description for SELECT * FROM appointments
+COLUMNS = [
+    ("id", 23), ("patient_id", 25), ("patient_email", 25), ("appointment_date", 1082),
+    ("appointment_time", 1083), ("service_type", 25), ("notes", 25), ("status", 25), ("created_at", 1184),
+]
+FIELDS = [name for name, _ in COLUMNS]
+
+
+def make_rows(count):
+    first_day = date(2026, 11, 2)
+    created = datetime(2026, 10, 1, 8, 30, tzinfo=timezone.utc)
+    return [
+        (i, "patient-1", "patient-1@example.com", first_day + timedelta(days=i // 32),
+         time_of_day(8 + (i % 32) // 4, (i % 4) * 15), "Physiotherapy", "Bring previous scans", "booked",
+         created + timedelta(minutes=i))
+        for i in range(count)
+    ]
+
+
+def before(description, rows):
+    """The loop get_appointments ran before shared/serialization.py."""
+    column_names = [column.name for column in description]
+    appointments = []
+    for row in rows:
+        appointment = {name: value for name, value in zip(column_names, row) if name in FIELDS}
+        if 'appointment_date' in appointment and isinstance(appointment['appointment_date'], date):
+            appointment['appointment_date'] = appointment['appointment_date'].isoformat()
+        if 'appointment_time' in appointment and isinstance(appointment['appointment_time'], time_of_day):
+            appointment['appointment_time'] = appointment['appointment_time'].isoformat()
+        if 'created_at' in appointment and isinstance(appointment['created_at'], datetime):
+            appointment['created_at'] = appointment['created_at'].isoformat()
+        appointments.append(appointment)
+    return json.dumps({"appointments": appointments, "nextCursor": None}).encode("utf-8")
+
+
+def with_serialization(orjson_module):
+    def run(description, rows):
+        serialization.orjson = orjson_module
+        cursor = SimpleNamespace(description=description)
+        return serialization.dumps({"appointments": serialization.rows_to_dicts(cursor, rows, FIELDS), "nextCursor": None})
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    description = [SimpleNamespace(name=name, type_code=type_code) for name, type_code in COLUMNS]
+    rows = make_rows(args.rows)
+    installed_orjson = serialization.orjson
+
+    variants = {"before": before, "serialization_stdlib_json": with_serialization(None)}
+    if installed_orjson is not None:
+        variants["serialization_orjson"] = with_serialization(installed_orjson)
+
+    reference = json.loads(before(description, rows))
+    results = {}
+    for name, run in variants.items():
+        body = run(description, rows)
+        if json.loads(body) != reference:
+            sys.exit(f"{name} produced a different response")
+        timings = []
+        gc.disable() # Collections triggered by earlier variants' garbage would land in random runs
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            run(description, rows)
+            timings.append(time.perf_counter() - started)
+            gc.collect()
+        gc.enable()
+        results[name] = {"median_ms": round(statistics.median(timings) * 1000, 2),
+                         "min_ms": round(min(timings) * 1000, 2), "bytes": len(body)}
+    serialization.orjson = installed_orjson
+
+    baseline = results["before"]["median_ms"]
+    for result in results.values():
+        result["speedup"] = round(baseline / result["median_ms"], 1)
+    print(json.dumps({"rows": args.rows, "repeat": args.repeat, **results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Emails/s through a local SMTP server that requires STARTTLS and AUTH, before and
+after session reuse: a new connection + STARTTLS + LOGIN per message (the old
+send_email), send_email over the pooled sessions, and send_emails (one session,
+back to back). Sends are sequential, so the numbers are per sender thread.
+
+    python benchmarks/bench_smtp_sessions.py --messages 500 --delay-ms 0
+
+Needs the sendNotification requirements plus aiosmtpd and cryptography. The
+server is on localhost, so a real provider's round trips would widen the gap:
+every connection costs several more of them than a message on a warm session.
+"""
+
+import os
+import ssl
+import sys
+import json
+import time
+import smtplib
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "tests"))
+from support import load_function_module, LocalSmtpServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="Simulated provider latency per message")
+    args = parser.parse_args()
+
+    with LocalSmtpServer(delay=args.delay_ms / 1000) as smtp_server:
+        os.environ.update({"SMTP_POOL_SIZE": "1", "DEDUP_BACKEND": "memory", "PROFILE_CACHE_LISTENER": "false"})
+        notifications = load_function_module("sendNotification", "main", alias="main")
+        emails = [(f"patient-{i}@example.com", "Appointment reminder", f"<p>See you tomorrow, patient {i}.</p>",
+                   f"See you tomorrow, patient {i}.") for i in range(args.messages)]
+
+        def connection_per_message():
+            # What send_email did before SmtpSession: connect, STARTTLS and LOGIN for every message
+            for email in emails:
+                with smtplib.SMTP(notifications.SMTP_HOST, notifications.SMTP_PORT) as server:
+                    server.starttls(context=ssl.create_default_context())
+                    server.login(notifications.SMTP_USERNAME, notifications.SMTP_PASSWORD)
+                    server.send_message(notifications.build_email_message(*email))
+            return len(emails)
+
+        def pooled_session():
+            return sum(notifications.send_email(*email) for email in emails)
+
+        def batched_session():
+            return sum(notifications.send_emails(emails))
+
+        results = {}
+        for name, run in (("connection_per_message", connection_per_message),
+                          ("send_email_pooled_session", pooled_session),
+                          ("send_emails_one_session", batched_session)):
+            messages_before, connections_before = smtp_server.messages, smtp_server.connections
+            started = time.perf_counter()
+            sent = run()
+            elapsed = time.perf_counter() - started
+            results[name] = {
+                "sent": sent,
+                "accepted_by_server": smtp_server.messages - messages_before,
+                "connections": smtp_server.connections - connections_before,
+                "messages_per_second": round(sent / elapsed, 1),
+            }
+
+    baseline = results["connection_per_message"]["messages_per_second"]
+    for result in results.values():
+        result["speedup"] = round(result["messages_per_second"] / baseline, 1)
+    print(json.dumps({"messages": args.messages, "delay_ms": args.delay_ms, **results}, indent=2))
+    sys.exit(0 if all(result["accepted_by_server"] == args.messages for result in results.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
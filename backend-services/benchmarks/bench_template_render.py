@@ -0,0 +1,144 @@
+"""
+Microbenchmark of rendering notification texts: the inline f-string if/elif chain
+send_appointment_notification used before templates.py, against templates.render()
+with the precompiled, auto-escaping Jinja2 templates.
+
+    python benchmarks/bench_template_render.py --events 10000 --repeat 20
+
+Needs jinja2 but no SMTP, FCM or Firestore. The events are a mix of bookings,
+cancellations, series bookings and reminders. The templates also render a
+plain-text part and escape the HTML, which the old chain did not.
+"""
+
+import gc
+import sys
+import json
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "sendNotification"))
+import templates
+
+
+def make_events(count):
+    event_types = ["appointmentBooked", "appointmentCancelled", "appointmentSeriesBooked", "appointmentReminder"]
+    events = []
+    for i in range(count):
+        event = {
+            "eventId": f"evt-{i}", "eventType": event_types[i % len(event_types)], "appointmentId": str(1000 + i),
+            "patientId": f"patient-{i % 500}", "appointmentDate": "2026-11-02", "appointmentTime": "09:30:00",
+            "serviceType": "Physiotherapy", "notes": "Bring previous scans & referral <if any>", "firstName": "Ada",
+        }
+        if event["eventType"] == "appointmentSeriesBooked":
+            event["appointments"] = [
+                {"appointmentId": str(5000 + week), "appointmentDate": f"2026-11-{2 + 7 * week:02d}", "appointmentTime": "09:30:00"}
+                for week in range(4)
+            ]
+        events.append(event)
+    return events
+
+
+def before(message_data):
+    """The if/elif chain in send_appointment_notification before templates.py."""
+    event_type = message_data.get('eventType')
+    appointment_id = message_data.get('appointmentId')
+    appointment_date = message_data.get('appointmentDate')
+    appointment_time = message_data.get('appointmentTime')
+    service_type = message_data.get('serviceType')
+    notes = message_data.get('notes', '')
+
+    if event_type == "appointmentBooked":
+        subject = f"Appointment Confirmed: {service_type} on {appointment_date} at {appointment_time}"
+        email_body_html = (
+            f"Dear Patient,<br><br>"
+            f"Your appointment for <b>{service_type}</b> is confirmed.<br>"
+            f"<b>Date:</b> {appointment_date}<br>"
+            f"<b>Time:</b> {appointment_time}<br>"
+            f"<b>Appointment ID:</b> {appointment_id}<br>"
+            f"<b>Notes:</b> {notes}<br><br>"
+            f"Thank you for choosing our clinic!"
+        )
+        fcm_title = "Appointment Confirmed!"
+        fcm_body = f"Your {service_type} appt is confirmed for {appointment_date} at {appointment_time}. ID: {appointment_id}."
+    elif event_type == "appointmentCancelled":
+        subject = f"Appointment Cancelled: {service_type} on {appointment_date} at {appointment_time}"
+        email_body_html = (
+            f"Dear Patient,<br><br>"
+            f"Your appointment for <b>{service_type}</b> on {appointment_date} at {appointment_time} "
+            f"has been successfully cancelled.<br>"
+            f"<b>Appointment ID:</b> {appointment_id}<br><br>"
+            f"If you wish to reschedule, please visit our booking page."
+        )
+        fcm_title = "Appointment Cancelled"
+        fcm_body = f"Your {service_type} appt on {appointment_date} at {appointment_time} has been cancelled. ID: {appointment_id}."
+    elif event_type == "appointmentSeriesBooked":
+        series = message_data.get('appointments', [])
+        first = series[0] if series else {}
+        subject = f"{len(series)} Appointments Confirmed: {service_type} from {first.get('appointmentDate')}"
+        series_rows = "".join(
+            f"{item.get('appointmentDate')} at {item.get('appointmentTime')} (ID: {item.get('appointmentId')})<br>"
+            for item in series
+        )
+        email_body_html = (
+            f"Dear Patient,<br><br>"
+            f"Your course of <b>{len(series)}</b> appointments for <b>{service_type}</b> is confirmed:<br>"
+            f"{series_rows}<br>"
+            f"<b>Notes:</b> {notes}<br><br>"
+            f"Thank you for choosing our clinic!"
+        )
+        fcm_title = "Appointments Confirmed!"
+        fcm_body = f"{len(series)} {service_type} appts confirmed, starting {first.get('appointmentDate')} at {first.get('appointmentTime')}."
+    elif event_type == "appointmentReminder":
+        subject = f"Reminder: Your Upcoming Appointment for {service_type}"
+        email_body_html = (
+            f"Dear Patient,<br><br>"
+            f"This is a friendly reminder for your upcoming appointment:<br>"
+            f"<b>Service:</b> {service_type}<br>"
+            f"<b>Date:</b> {appointment_date}<br>"
+            f"<b>Time:</b> {appointment_time}<br>"
+            f"<b>Appointment ID:</b> {appointment_id}<br><br>"
+            f"Please arrive on time. If you need to reschedule, please do so via the portal."
+        )
+        fcm_title = "Appointment Reminder!"
+        fcm_body = f"Reminder: Your {service_type} appt is on {appointment_date} at {appointment_time}. ID: {appointment_id}."
+    else:
+        return None
+    return subject, email_body_html, fcm_title, fcm_body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    events = make_events(args.events)
+    variants = {"before": before, "templates_render": templates.render}
+
+    results = {}
+    for name, render in variants.items():
+        if any(render(message_data) is None for message_data in events):
+            sys.exit(f"{name} left an event unrendered")
+        timings = []
+        gc.disable() # Collections triggered by earlier variants' garbage would land in random runs
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            for message_data in events:
+                render(message_data)
+            timings.append(time.perf_counter() - started)
+            gc.collect()
+        gc.enable()
+        median = statistics.median(timings)
+        results[name] = {"median_ms": round(median * 1000, 2), "min_ms": round(min(timings) * 1000, 2),
+                         "us_per_event": round(median / args.events * 1e6, 1)}
+
+    baseline = results["before"]["median_ms"]
+    for result in results.values():
+        result["relative_cost"] = round(result["median_ms"] / baseline, 1)
+    print(json.dumps({"events": args.events, "repeat": args.repeat, **results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,64 +2,103 @@ import os
 import functions_framework
 import json
 import psycopg2
-from datetime import datetime
-import firebase_admin
-from firebase_admin import credentials, auth
-from google.cloud import pubsub_v1 # Import Pub/Sub client
-
-# Database connection details from environment variables
-DB_USER = os.environ.get("DB_USER")
-DB_PASSWORD = os.environ.get("DB_PASSWORD")
-DB_HOST = os.environ.get("DB_HOST")
-DB_NAME = os.environ.get("DB_NAME")
-
-# Firebase Admin SDK key from Secret Manager
-FIREBASE_ADMIN_SDK_KEY = os.environ.get("FIREBASE_ADMIN_SDK_KEY")
-
-# Pub/Sub Topic ID for notifications
-NOTIFICATION_TOPIC_ID = os.environ.get("NOTIFICATION_TOPIC_ID", "appointment-events") # Default fallback value
-PROJECT_ID = os.environ.get("GCP_PROJECT") # Get project ID from environment
-
-# Initialize Firebase Admin SDK only once
-if not firebase_admin._apps:
-    try:
-        cred_json = json.loads(FIREBASE_ADMIN_SDK_KEY)
-        cred = credentials.Certificate(cred_json)
-        firebase_admin.initialize_app(cred)
-        print("Firebase Admin SDK initialized successfully.")
-    except Exception as e:
-        print(f"Error initializing Firebase Admin SDK: {e}")
+from shared import db # Pooled Cloud SQL connections, reused across invocations
+from shared.firebase_auth import verify_firebase_token # Cached ID-token verification
+from shared import slots # Slot grid and free-slot lookups for alternatives
+from datetime import datetime, timedelta
+from psycopg2.extras import execute_values
+from shared import outbox # Events are written in the booking transaction, relayed to Pub/Sub later
+
+# Claims the slot atomically. uq_appointments_active_slot_time (see sql/007) allows one
+# non-cancelled booking per (date, time), so when two requests race for the
+# same slot exactly one INSERT returns a row; the other gets nothing back and no error.
+INSERT_APPOINTMENT_QUERY = """
+INSERT INTO appointments (patient_id, patient_email, appointment_date, appointment_time, service_type, notes, status)
+VALUES (%s, %s, %s, %s, %s, %s, %s)
+ON CONFLICT (appointment_date, appointment_time) WHERE status != 'cancelled'
+DO NOTHING
+RETURNING id;
+"""
+
+# Number of alternative slots suggested when the requested one is already taken
+ALTERNATIVE_SLOTS_LIMIT = int(os.environ.get("ALTERNATIVE_SLOTS_LIMIT", 5))
 
-# Initialize Pub/Sub publisher client globally
-publisher = pubsub_v1.PublisherClient()
-topic_path = publisher.topic_path(PROJECT_ID, NOTIFICATION_TOPIC_ID)
-print(f"Pub/Sub topic path: {topic_path}")
+# Batch / recurring bookings (book_appointments_batch)
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 24))
+RECURRENCE_INTERVALS = {
+    "daily": timedelta(days=1),
+    "weekly": timedelta(weeks=1),
+    "fortnightly": timedelta(weeks=2),
+}
+
+# Same slot claim as INSERT_APPOINTMENT_QUERY, for many rows in one statement
+INSERT_APPOINTMENTS_BATCH_QUERY = """
+INSERT INTO appointments (patient_id, patient_email, appointment_date, appointment_time, service_type, notes, status)
+VALUES %s
+ON CONFLICT (appointment_date, appointment_time) WHERE status != 'cancelled'
+DO NOTHING
+RETURNING id, to_char(appointment_date, 'YYYY-MM-DD'), to_char(appointment_time, 'HH24:MI');
+"""
+
+def parse_slot(date_str, time_str):
+    """Parses a YYYY-MM-DD date and HH:MM (or HH:MM:SS) time into (date, time)."""
+    try:
+        return (
+            datetime.strptime(str(date_str), '%Y-%m-%d').date(),
+            datetime.strptime(str(time_str)[:5], '%H:%M').time()
+        )
+    except ValueError:
+        raise ValueError(f"Invalid slot {date_str} {time_str}. Expected YYYY-MM-DD and HH:MM.")
 
-def verify_firebase_token(request):
+def expand_batch_slots(request_json):
     """
-    Verifies the Firebase ID token from the Authorization header.
-    Returns the decoded token (containing uid) if valid, None otherwise.
+    Turns a batch request into a sorted list of (date, time) tuples. Accepts either
+      "slots": [{"appointmentDate": "YYYY-MM-DD", "appointmentTime": "HH:MM"}, ...]
+    or
+      "recurrence": {"startDate": "YYYY-MM-DD", "time": "HH:MM", "frequency": "weekly", "count": 8}
     """
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        raise ValueError("Authorization header missing.")
+    requested_slots = request_json.get('slots')
+    recurrence = request_json.get('recurrence')
 
-    id_token = auth_header.split(' ').pop()
-    if not id_token:
-        raise ValueError("Firebase ID token missing from Authorization header.")
+    if requested_slots and recurrence:
+        raise ValueError("Provide either slots or recurrence, not both.")
 
-    try:
-        decoded_token = auth.verify_id_token(id_token)
-        return decoded_token
-    except Exception as e:
-        print(f"Error verifying Firebase ID token: {e}")
-        raise ValueError("Invalid or expired Firebase ID token.")
+    if recurrence:
+        if not isinstance(recurrence, dict):
+            raise ValueError("recurrence must be an object with startDate, time, frequency and count.")
+        frequency = recurrence.get('frequency', 'weekly')
+        if frequency not in RECURRENCE_INTERVALS:
+            raise ValueError(f"Unsupported recurrence frequency: {frequency}. Use one of {', '.join(RECURRENCE_INTERVALS)}.")
+        try:
+            count = int(recurrence.get('count', 0))
+        except (TypeError, ValueError):
+            raise ValueError("Recurrence count must be a number.")
+        if not 1 <= count <= MAX_BATCH_SIZE:
+            raise ValueError(f"Recurrence count must be between 1 and {MAX_BATCH_SIZE}.")
+        first_date, slot_time = parse_slot(recurrence.get('startDate'), recurrence.get('time'))
+        step = RECURRENCE_INTERVALS[frequency]
+        batch = [(first_date + step * i, slot_time) for i in range(count)]
+    elif requested_slots:
+        if not isinstance(requested_slots, list):
+            raise ValueError("slots must be a list of objects with appointmentDate and appointmentTime.")
+        if len(requested_slots) > MAX_BATCH_SIZE:
+            raise ValueError(f"Too many appointments in one batch. Maximum is {MAX_BATCH_SIZE}.")
+        if not all(isinstance(slot, dict) for slot in requested_slots):
+            raise ValueError("Each slot must be an object with appointmentDate and appointmentTime.")
+        batch = [parse_slot(slot.get('appointmentDate'), slot.get('appointmentTime')) for slot in requested_slots]
+    else:
+        raise ValueError("Missing slots or recurrence.")
+
+    if len(set(batch)) != len(batch):
+        raise ValueError("The same slot appears more than once in the batch.")
+
+    return sorted(batch)
 
 @functions_framework.http
 def book_appointment(request):
     """
     HTTP Cloud Function to book a patient appointment in Cloud SQL PostgreSQL.
-    Requires Firebase authentication. Publishes a message to Pub/Sub upon successful booking.
+    Requires Firebase authentication. Queues a notification event in the transactional outbox upon successful booking.
     """
     # Handle CORS Preflight requests.
     if request.method == 'OPTIONS':
@@ -97,8 +136,6 @@ def book_appointment(request):
         appointment_time = request_json.get('appointmentTime')
         service_type = request_json.get('serviceType')
         notes = request_json.get('notes', '')
-        # Assuming patient_phone is also sent from frontend for notifications
-        patient_phone = request_json.get('patientPhone') 
 
         if patient_id_from_request != authenticated_patient_id:
             return (json.dumps({"error": "Unauthorized: Mismatched patient ID."}), 403, headers)
@@ -108,57 +145,57 @@ def book_appointment(request):
         if not all([appointment_date, appointment_time, service_type, patient_email]):
             return (json.dumps({"error": "Missing required appointment fields (appointmentDate, appointmentTime, serviceType, patientEmail)."}), 400, headers)
 
+        requested_date, requested_time = parse_slot(appointment_date, appointment_time)
+
         # --- Database Connection and Insertion ---
         try:
-            conn = psycopg2.connect(
-                host=DB_HOST,
-                user=DB_USER,
-                password=DB_PASSWORD,
-                database=DB_NAME
-            )
+            conn = db.get_connection()
             cur = conn.cursor()
 
-            insert_query = """
-            INSERT INTO appointments (patient_id, patient_email, appointment_date, appointment_time, service_type, notes, status)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            RETURNING id;
-            """
-            cur.execute(insert_query, (
+            cur.execute(INSERT_APPOINTMENT_QUERY, (
                 authenticated_patient_id,
                 patient_email,
-                appointment_date,
-                appointment_time,
+                requested_date,
+                requested_time,
                 service_type,
                 notes,
                 'booked'
             ))
-            appointment_id = cur.fetchone()[0]
+            inserted = cur.fetchone()
+
+            if inserted is None:
+                # Someone else holds this slot. Nothing was written, so just offer nearby free slots.
+                conn.rollback()
+                alternatives = slots.fetch_nearest_free_slots(
+                    cur, requested_date, requested_time, limit=ALTERNATIVE_SLOTS_LIMIT
+                )
+                print(f"Slot {appointment_date} {appointment_time} ({service_type}) already booked; offered {len(alternatives)} alternatives.")
+                return (json.dumps({
+                    "error": "This appointment slot has already been booked.",
+                    "alternatives": [
+                        {"appointmentDate": slot_date, "appointmentTime": slot_time}
+                        for slot_date, slot_time in alternatives
+                    ]
+                }), 409, headers)
+
+            appointment_id = inserted[0]
+
+            # --- Queue the notification event in the same transaction (outbox) ---
+            message_data = {
+                "eventType": "appointmentBooked",
+                "appointmentId": appointment_id,
+                "patientId": authenticated_patient_id,
+                "patientEmail": patient_email,
+                "appointmentDate": appointment_date,
+                "appointmentTime": appointment_time,
+                "serviceType": service_type,
+                "notes": notes
+            }
+            outbox.enqueue_event(cur, message_data)
             conn.commit()
 
             print(f"Appointment booked successfully for patient {authenticated_patient_id}. Appointment ID: {appointment_id}")
 
-            # --- Publish message to Pub/Sub for notification ---
-            try:
-                message_data = {
-                    "eventType": "appointmentBooked",
-                    "appointmentId": appointment_id,
-                    "patientId": authenticated_patient_id,
-                    "patientEmail": patient_email,
-                    "patientPhone": patient_phone, # Include phone for FCM conceptual
-                    "appointmentDate": appointment_date,
-                    "appointmentTime": appointment_time,
-                    "serviceType": service_type,
-                    "notes": notes
-                }
-                data = json.dumps(message_data).encode("utf-8")
-                future = publisher.publish(topic_path, data)
-                message_id = future.result()
-                print(f"Published 'appointmentBooked' message to Pub/Sub with ID: {message_id}")
-            except Exception as pubsub_err:
-                print(f"Error publishing to Pub/Sub: {pubsub_err}")
-                # Log the error but don't fail the booking, as booking is primary
-                # In a real app, you might have a retry mechanism or dead-letter queue.
-
             return (json.dumps({
                 "message": "Appointment booked successfully",
                 "appointmentId": appointment_id
@@ -177,8 +214,140 @@ def book_appointment(request):
         finally:
             if cur:
                 cur.close()
+            # Return the connection to the pool instead of closing it
+            db.release_connection(conn)
+
+    except ValueError as e:
+        print(f"Bad Request Error: {e}")
+        return (json.dumps({"error": str(e)}), 400, headers)
+    except RuntimeError as e:
+        print(f"Server-side Runtime Error: {e}")
+        return (json.dumps({"error": str(e)}), 500, headers)
+    except Exception as e:
+        print(f"Unhandled function error: {e}")
+        import traceback
+        traceback.print_exc()
+        return (json.dumps({"error": "An unexpected server error occurred."}), 500, headers)
+
+
+@functions_framework.http
+def book_appointments_batch(request):
+    """
+    HTTP Cloud Function to book a course of appointments (an explicit list of slots,
+    or a recurrence such as weekly x8 at 10:00) in one transaction.
+    All-or-nothing: if any slot is taken, nothing is booked and a 409 lists the conflicts.
+    Queues one aggregated 'appointmentSeriesBooked' event in the outbox on success.
+    """
+    # Handle CORS Preflight requests.
+    if request.method == 'OPTIONS':
+        headers = {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'POST',
+            'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+            'Access-Control-Max-Age': '3600'
+        }
+        return ('', 204, headers)
+
+    headers = {
+        'Access-Control-Allow-Origin': '*'
+    }
+
+    conn = None
+    cur = None
+
+    try:
+        # 1. Verify Firebase ID Token (once for the whole batch)
+        try:
+            decoded_token = verify_firebase_token(request)
+            authenticated_patient_id = decoded_token['uid']
+            authenticated_patient_email = decoded_token.get('email')
+            print(f"Batch booking request from authenticated user: {authenticated_patient_id}")
+        except ValueError as e:
+            return (json.dumps({"error": str(e)}), 401, headers)
+
+        request_json = request.get_json(silent=True)
+        if not request_json or not isinstance(request_json, dict):
+            raise ValueError("No valid JSON object provided in the request body.")
+
+        patient_id_from_request = request_json.get('patientId')
+        service_type = request_json.get('serviceType')
+        notes = request_json.get('notes', '')
+
+        if patient_id_from_request != authenticated_patient_id:
+            return (json.dumps({"error": "Unauthorized: Mismatched patient ID."}), 403, headers)
+
+        patient_email = authenticated_patient_email or request_json.get('patientEmail')
+
+        if not all([service_type, patient_email]):
+            return (json.dumps({"error": "Missing required appointment fields (serviceType, patientEmail)."}), 400, headers)
+
+        batch = expand_batch_slots(request_json)
+
+        # --- Database Connection and Multi-row Insertion ---
+        try:
+            conn = db.get_connection()
+            cur = conn.cursor()
+
+            rows = [
+                (authenticated_patient_id, patient_email, slot_date, slot_time, service_type, notes, 'booked')
+                for slot_date, slot_time in batch
+            ]
+            inserted = execute_values(cur, INSERT_APPOINTMENTS_BATCH_QUERY, rows, page_size=len(rows), fetch=True)
+
+            if len(inserted) != len(batch):
+                # At least one slot is taken; undo the rows that did go in.
+                conn.rollback()
+                booked = {(row[1], row[2]) for row in inserted}
+                conflicts = [
+                    {"appointmentDate": slot_date.isoformat(), "appointmentTime": slot_time.strftime('%H:%M')}
+                    for slot_date, slot_time in batch
+                    if (slot_date.isoformat(), slot_time.strftime('%H:%M')) not in booked
+                ]
+                print(f"Batch booking for {authenticated_patient_id} rejected: {len(conflicts)} of {len(batch)} slots already booked.")
+                return (json.dumps({
+                    "error": "Some appointment slots have already been booked. Nothing was booked.",
+                    "conflicts": conflicts
+                }), 409, headers)
+
+            appointments = [
+                {"appointmentId": appointment_id, "appointmentDate": slot_date, "appointmentTime": slot_time}
+                for appointment_id, slot_date, slot_time in sorted(inserted, key=lambda row: (row[1], row[2]))
+            ]
+
+            # --- Queue one aggregated notification event in the same transaction (outbox) ---
+            message_data = {
+                "eventType": "appointmentSeriesBooked",
+                "patientId": authenticated_patient_id,
+                "patientEmail": patient_email,
+                "serviceType": service_type,
+                "notes": notes,
+                "appointments": appointments
+            }
+            outbox.enqueue_event(cur, message_data)
+            conn.commit()
+
+            print(f"Batch of {len(appointments)} appointments booked for patient {authenticated_patient_id}.")
+
+            return (json.dumps({
+                "message": f"{len(appointments)} appointments booked successfully",
+                "appointments": appointments
+            }), 200, headers)
+
+        except psycopg2.Error as db_err:
+            print(f"Database error during batch appointment booking: {db_err}")
+            if conn:
+                conn.rollback()
+            raise RuntimeError(f"Database operation failed: {db_err}")
+        except Exception as e:
+            print(f"An unexpected error occurred during DB operation: {e}")
             if conn:
-                conn.close()
+                conn.rollback()
+            raise RuntimeError(f"Internal database server error: {e}")
+        finally:
+            if cur:
+                cur.close()
+            # Return the connection to the pool instead of closing it
+            db.release_connection(conn)
 
     except ValueError as e:
         print(f"Bad Request Error: {e}")
@@ -2,63 +2,61 @@ import os
 import functions_framework
 import json
 import psycopg2
-import firebase_admin
-from firebase_admin import credentials, auth
-from google.cloud import pubsub_v1 # Import Pub/Sub client
+from shared import db # Pooled Cloud SQL connections, reused across invocations
+from shared.firebase_auth import verify_firebase_token # Cached ID-token verification
+from shared import outbox # Events are written in the cancellation transaction, relayed to Pub/Sub later
+from datetime import datetime
 
-# Database connection details from environment variables
-DB_USER = os.environ.get("DB_USER")
-DB_PASSWORD = os.environ.get("DB_PASSWORD")
-DB_HOST = os.environ.get("DB_HOST")
-DB_NAME = os.environ.get("DB_NAME")
+# Marks the appointment cancelled and returns what the notification needs, in one statement
+CANCEL_APPOINTMENT_QUERY = """
+UPDATE appointments
+SET status = 'cancelled'
+WHERE id = %s AND patient_id = %s AND status != 'cancelled'
+RETURNING patient_email, appointment_date, appointment_time, service_type, notes;
+"""
 
-# Firebase Admin SDK key from Secret Manager
-FIREBASE_ADMIN_SDK_KEY = os.environ.get("FIREBASE_ADMIN_SDK_KEY")
+# --- Bulk cancellation (bulk_cancel_appointments) ---
+# Firebase custom claim that marks clinic staff allowed to bulk-cancel
+STAFF_CLAIM = os.environ.get("STAFF_CLAIM", "staff")
+MAX_BULK_CANCEL = int(os.environ.get("MAX_BULK_CANCEL", 5000))
 
-# Pub/Sub Topic ID for notifications
-NOTIFICATION_TOPIC_ID = os.environ.get("NOTIFICATION_TOPIC_ID", "appointment-events") # Default fallback value
-PROJECT_ID = os.environ.get("GCP_PROJECT") # Get project ID from environment
-
-# Initialize Firebase Admin SDK only once
-if not firebase_admin._apps:
-    try:
-        cred_json = json.loads(FIREBASE_ADMIN_SDK_KEY)
-        cred = credentials.Certificate(cred_json)
-        firebase_admin.initialize_app(cred)
-        print("Firebase Admin SDK initialized successfully.")
-    except Exception as e:
-        print(f"Error initializing Firebase Admin SDK: {e}")
-
-# Initialize Pub/Sub publisher client globally
-publisher = pubsub_v1.PublisherClient()
-topic_path = publisher.topic_path(PROJECT_ID, NOTIFICATION_TOPIC_ID)
-print(f"Pub/Sub topic path: {topic_path}")
-
-def verify_firebase_token(request):
-    """
-    Verifies the Firebase ID token from the Authorization header.
-    Returns the decoded token (containing uid) if valid, None otherwise.
-    """
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        raise ValueError("Authorization header missing.")
-
-    id_token = auth_header.split(' ').pop()
-    if not id_token:
-        raise ValueError("Firebase ID token missing from Authorization header.")
-
-    try:
-        decoded_token = auth.verify_id_token(id_token)
-        return decoded_token
-    except Exception as e:
-        print(f"Error verifying Firebase ID token: {e}")
-        raise ValueError("Invalid or expired Firebase ID token.")
+# One statement: locks at most MAX_BULK_CANCEL + 1 matching rows, and cancels them only
+# if there are no more than MAX_BULK_CANCEL, so an oversized selection is rejected
+# before anything is updated and without reading every match. Always returns at
+# least one row: `matched` (the locked count) plus one cancelled row per appointment,
+# or NULLs when nothing was cancelled.
+BULK_CANCEL_QUERY = """
+WITH locked AS (
+    SELECT id
+    FROM appointments
+    WHERE status != 'cancelled'
+      AND (%(ids)s::bigint[] IS NULL OR id = ANY(%(ids)s::bigint[]))
+      AND (%(start_date)s::date IS NULL OR appointment_date >= %(start_date)s::date)
+      AND (%(end_date)s::date IS NULL OR appointment_date <= %(end_date)s::date)
+      AND (%(service_type)s::text IS NULL OR service_type = %(service_type)s::text)
+    ORDER BY id
+    LIMIT %(max)s + 1
+    FOR UPDATE
+), selection AS (
+    SELECT count(*) AS matched FROM locked
+), cancelled AS (
+    UPDATE appointments
+    SET status = 'cancelled'
+    FROM locked, selection
+    WHERE appointments.id = locked.id AND selection.matched <= %(max)s
+    RETURNING appointments.id, appointments.patient_id, appointments.patient_email, appointments.appointment_date,
+              appointments.appointment_time, appointments.service_type, appointments.notes
+)
+SELECT selection.matched, cancelled.*
+FROM selection LEFT JOIN cancelled ON true
+ORDER BY cancelled.id;
+"""
 
 @functions_framework.http
 def cancel_appointment(request):
     """
     HTTP Cloud Function to cancel a patient appointment in Cloud SQL PostgreSQL.
-    Requires Firebase authentication. Publishes a message to Pub/Sub upon successful cancellation.
+    Requires Firebase authentication. Queues a notification event in the transactional outbox upon successful cancellation.
     """
     # Handle CORS Preflight requests.
     if request.method == 'OPTIONS':
@@ -82,7 +80,6 @@ def cancel_appointment(request):
         try:
             decoded_token = verify_firebase_token(request)
             authenticated_patient_id = decoded_token['uid']
-            authenticated_patient_email = decoded_token.get('email') # Get email for notification
             print(f"Request from authenticated user: {authenticated_patient_id}")
         except ValueError as e:
             return (json.dumps({"error": str(e)}), 401, headers) # 401 Unauthorized
@@ -94,7 +91,6 @@ def cancel_appointment(request):
         # Expecting 'appointmentId' and 'patientId' from the frontend
         appointment_id = request_json.get('appointmentId')
         patient_id_from_request = request_json.get('patientId') # Frontend still sends this
-        patient_phone = request_json.get('patientPhone') # Assuming phone is also sent for notifications
 
         # IMPORTANT: Ensure the patientId from the request matches the authenticated UID
         if patient_id_from_request != authenticated_patient_id:
@@ -106,24 +102,15 @@ def cancel_appointment(request):
 
         # --- Database Connection and Update ---
         try:
-            conn = psycopg2.connect(
-                host=DB_HOST,
-                user=DB_USER,
-                password=DB_PASSWORD,
-                database=DB_NAME
-            )
+            conn = db.get_connection()
             cur = conn.cursor()
 
-            # First, retrieve appointment details for the notification before updating status
-            select_query = """
-            SELECT patient_email, appointment_date, appointment_time, service_type, notes
-            FROM appointments
-            WHERE id = %s AND patient_id = %s AND status != 'cancelled';
-            """
-            cur.execute(select_query, (appointment_id, authenticated_patient_id))
+            # Cancel and read back the notification details in one round trip
+            cur.execute(CANCEL_APPOINTMENT_QUERY, (appointment_id, authenticated_patient_id)) # Use authenticated UID
             appointment_details = cur.fetchone()
 
             if not appointment_details:
+                conn.rollback()
                 return (json.dumps({"message": "Appointment not found, or you do not have permission to cancel it, or it's already cancelled."}), 404, headers)
 
             # Unpack details for notification
@@ -139,48 +126,182 @@ def cancel_appointment(request):
             notification_appointment_date = notification_appointment_date.isoformat()
             notification_appointment_time = notification_appointment_time.isoformat()
 
-            # Now, update the appointment status to 'cancelled'
-            update_query = """
-            UPDATE appointments
-            SET status = 'cancelled'
-            WHERE id = %s AND patient_id = %s AND status != 'cancelled';
-            """
-            cur.execute(update_query, (appointment_id, authenticated_patient_id)) # Use authenticated UID
+            # --- Queue the notification event in the same transaction (outbox) ---
+            message_data = {
+                "eventType": "appointmentCancelled",
+                "appointmentId": appointment_id,
+                "patientId": authenticated_patient_id,
+                "patientEmail": notification_patient_email, # Use email from DB
+                "appointmentDate": notification_appointment_date,
+                "appointmentTime": notification_appointment_time,
+                "serviceType": notification_service_type,
+                "notes": notification_notes
+            }
+            outbox.enqueue_event(cur, message_data)
             conn.commit()
 
-            # Check if any row was actually updated (should be 1 if appointment_details was found)
-            if cur.rowcount == 0:
-                # This case should ideally not be hit if appointment_details was found,
-                # but it's a safeguard.
-                return (json.dumps({"message": "Appointment not found, or you do not have permission to cancel it, or it's already cancelled."}), 404, headers)
-
             print(f"Appointment ID {appointment_id} cancelled successfully by authenticated patient {authenticated_patient_id}.")
 
-            # --- Publish message to Pub/Sub for notification ---
-            try:
-                message_data = {
+            return (json.dumps({"message": "Appointment cancelled successfully."}), 200, headers)
+
+        except psycopg2.Error as db_err:
+            print(f"Database error during appointment cancellation: {db_err}")
+            if conn:
+                conn.rollback()
+            raise RuntimeError(f"Database operation failed: {db_err}")
+        except Exception as e:
+            print(f"An unexpected error occurred during DB operation: {e}")
+            if conn:
+                conn.rollback()
+            raise RuntimeError(f"Internal database server error: {e}")
+        finally:
+            if cur:
+                cur.close()
+            # Return the connection to the pool instead of closing it
+            db.release_connection(conn)
+
+    except ValueError as e:
+        print(f"Bad Request Error: {e}")
+        return (json.dumps({"error": str(e)}), 400, headers)
+    except RuntimeError as e:
+        print(f"Server-side Runtime Error: {e}")
+        return (json.dumps({"error": "An unexpected server error occurred."}), 500, headers)
+    except Exception as e:
+        print(f"Unhandled function error: {e}")
+        import traceback
+        traceback.print_exc()
+        return (json.dumps({"error": "An unexpected server error occurred."}), 500, headers)
+
+def parse_bulk_filters(request_json):
+    """
+    Reads the bulk-cancel selection: any combination of appointmentIds, a date or
+    startDate/endDate range, and serviceType. Ids or a date are required so a
+    request can never cancel everything.
+    """
+    appointment_ids = request_json.get('appointmentIds')
+    single_date = request_json.get('date')
+    start_date = request_json.get('startDate') or single_date
+    end_date = request_json.get('endDate') or single_date
+    service_type = request_json.get('serviceType') or None
+
+    if appointment_ids is not None:
+        if not isinstance(appointment_ids, list) or not appointment_ids:
+            raise ValueError("appointmentIds must be a non-empty list.")
+        if len(appointment_ids) > MAX_BULK_CANCEL:
+            raise ValueError(f"Too many appointmentIds. Maximum is {MAX_BULK_CANCEL}.")
+        try:
+            appointment_ids = [int(appointment_id) for appointment_id in appointment_ids]
+        except (TypeError, ValueError):
+            raise ValueError("appointmentIds must be numbers.")
+
+    try:
+        start_date = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+        end_date = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+    except (TypeError, ValueError):
+        raise ValueError("Invalid date format. Expected YYYY-MM-DD.")
+
+    if appointment_ids is None and not (start_date and end_date):
+        raise ValueError("Provide appointmentIds, a date, or both startDate and endDate.")
+    if start_date and end_date and end_date < start_date:
+        raise ValueError("endDate must not be before startDate.")
+
+    return {
+        "ids": appointment_ids,
+        "start_date": start_date,
+        "end_date": end_date,
+        "service_type": service_type,
+    }
+
+@functions_framework.http
+def bulk_cancel_appointments(request):
+    """
+    HTTP Cloud Function for clinic staff to cancel many appointments at once
+    (e.g. a closure): by a list of ids, a date or date range, optionally narrowed to one service.
+    Requires a Firebase token carrying the staff custom claim.
+    One statement locks the matching rows with a bounded SELECT ... FOR UPDATE and
+    cancels them with UPDATE ... RETURNING, unless there are more than MAX_BULK_CANCEL
+    (rejected with 400, nothing updated). All notification events are written to the outbox with one multi-row insert in the
+    same transaction; the relay then publishes them to Pub/Sub in batches.
+    """
+    # Handle CORS Preflight requests.
+    if request.method == 'OPTIONS':
+        headers = {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'POST',
+            'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+            'Access-Control-Max-Age': '3600'
+        }
+        return ('', 204, headers)
+
+    headers = {
+        'Access-Control-Allow-Origin': '*'
+    }
+
+    conn = None
+    cur = None
+
+    try:
+        # 1. Verify Firebase ID Token and staff claim
+        try:
+            decoded_token = verify_firebase_token(request)
+            staff_uid = decoded_token['uid']
+        except ValueError as e:
+            return (json.dumps({"error": str(e)}), 401, headers)
+
+        if not decoded_token.get(STAFF_CLAIM):
+            return (json.dumps({"error": "Forbidden: bulk cancellation is restricted to clinic staff."}), 403, headers)
+
+        request_json = request.get_json(silent=True)
+        if not request_json:
+            raise ValueError("No valid JSON data provided in the request body.")
+
+        filters = parse_bulk_filters(request_json)
+        reason = request_json.get('reason', '')
+        print(f"Bulk cancellation requested by staff {staff_uid}: {filters}")
+
+        # --- Database Connection and Bulk Update ---
+        try:
+            conn = db.get_connection()
+            cur = conn.cursor()
+
+            # Lock the selection (at most one row past the limit) and cancel it in one round trip
+            cur.execute(BULK_CANCEL_QUERY, dict(filters, max=MAX_BULK_CANCEL))
+            result_rows = cur.fetchall()
+
+            if result_rows[0][0] > MAX_BULK_CANCEL:
+                conn.rollback()
+                return (json.dumps({"error": f"Selection matches more than {MAX_BULK_CANCEL} appointments, the limit. Narrow the date range."}), 400, headers)
+
+            cancelled_rows = [row[1:] for row in result_rows if row[1] is not None]
+
+            # --- Queue every notification event with one multi-row outbox insert ---
+            messages = [
+                {
                     "eventType": "appointmentCancelled",
                     "appointmentId": appointment_id,
-                    "patientId": authenticated_patient_id,
-                    "patientEmail": notification_patient_email, # Use email from DB
-                    "patientPhone": patient_phone, # Include phone for FCM conceptual
-                    "appointmentDate": notification_appointment_date,
-                    "appointmentTime": notification_appointment_time,
-                    "serviceType": notification_service_type,
-                    "notes": notification_notes
+                    "patientId": patient_id,
+                    "patientEmail": patient_email,
+                    "appointmentDate": appointment_date.isoformat(),
+                    "appointmentTime": appointment_time.isoformat(),
+                    "serviceType": service_type,
+                    "notes": notes,
+                    "cancellationReason": reason
                 }
-                data = json.dumps(message_data).encode("utf-8")
-                future = publisher.publish(topic_path, data)
-                message_id = future.result()
-                print(f"Published 'appointmentCancelled' message to Pub/Sub with ID: {message_id}")
-            except Exception as pubsub_err:
-                print(f"Error publishing to Pub/Sub: {pubsub_err}")
-                # Log the error but don't fail the cancellation, as cancellation is primary
+                for appointment_id, patient_id, patient_email, appointment_date, appointment_time, service_type, notes in cancelled_rows
+            ]
+            outbox.enqueue_events(cur, messages)
+            conn.commit()
 
-            return (json.dumps({"message": "Appointment cancelled successfully."}), 200, headers)
+            cancelled_ids = [row[0] for row in cancelled_rows]
+            print(f"Bulk cancellation by staff {staff_uid}: {len(cancelled_ids)} appointments cancelled.")
+
+            return (json.dumps({
+                "message": f"{len(cancelled_ids)} appointments cancelled.",
+                "cancelledIds": cancelled_ids
+            }), 200, headers)
 
         except psycopg2.Error as db_err:
-            print(f"Database error during appointment cancellation: {db_err}")
+            print(f"Database error during bulk cancellation: {db_err}")
             if conn:
                 conn.rollback()
             raise RuntimeError(f"Database operation failed: {db_err}")
@@ -192,8 +313,8 @@ def cancel_appointment(request):
         finally:
             if cur:
                 cur.close()
-            if conn:
-                conn.close()
+            # Return the connection to the pool instead of closing it
+            db.release_connection(conn)
 
     except ValueError as e:
         print(f"Bad Request Error: {e}")
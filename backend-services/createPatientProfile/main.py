@@ -4,6 +4,11 @@ import functions_framework
 from google.cloud import firestore
 import json
 import os
+from shared import events # Batched Pub/Sub publishing, used to announce profile changes
+
+# How long the response waits for the patientProfileUpdated publish. Waiting matters:
+# without CPU allocated after the response, a queued message might never be sent.
+PROFILE_EVENT_PUBLISH_TIMEOUT = float(os.environ.get("PROFILE_EVENT_PUBLISH_TIMEOUT", 10))
 
 # Initialize Firestore client
 # The project ID is usually picked up automatically from the environment
@@ -76,6 +81,17 @@ def create_patient_profile(request):
 
         print(f"Patient profile created/updated for user: {user_id} with email: {email}")
 
+        # sendNotification instances evict their cached copy through a Firestore listener
+        # (shared/patient_profiles.py); the event also reaches consumers that don't listen.
+        message_data = {"eventType": "patientProfileUpdated", "patientId": user_id}
+        published, = events.publish_batch(
+            [(json.dumps(message_data).encode("utf-8"), user_id, events.event_attributes(message_data))],
+            timeout=PROFILE_EVENT_PUBLISH_TIMEOUT
+        )
+        if not published:
+            # The profile is saved; cached copies still expire after PROFILE_CACHE_TTL_SECONDS
+            print(f"Could not publish patientProfileUpdated for user: {user_id}")
+
         return (json.dumps({"message": "Patient profile created successfully", "patientId": user_id}), 200, headers)
 
     except ValueError as e:
@@ -2,56 +2,31 @@ import os
 import functions_framework
 import json
 import psycopg2
-from datetime import datetime, date, time, timedelta
-import firebase_admin
-from firebase_admin import credentials, auth
+from shared import db # Pooled Cloud SQL connections, reused across invocations
+from shared.firebase_auth import verify_firebase_token # Cached ID-token verification
+from shared import slots # Slot grid and the set-based free-slot query
+from shared import serialization # Fast JSON and gzip for large range responses
+from datetime import datetime, timedelta
 
-# Database connection details from environment variables
-DB_USER = os.environ.get("DB_USER")
-DB_PASSWORD = os.environ.get("DB_PASSWORD")
-DB_HOST = os.environ.get("DB_HOST")
-DB_NAME = os.environ.get("DB_NAME")
-
-# Firebase Admin SDK key from Secret Manager
-FIREBASE_ADMIN_SDK_KEY = os.environ.get("FIREBASE_ADMIN_SDK_KEY")
-
-# Initialize Firebase Admin SDK only once
-if not firebase_admin._apps:
-    try:
-        cred_json = json.loads(FIREBASE_ADMIN_SDK_KEY)
-        cred = credentials.Certificate(cred_json)
-        firebase_admin.initialize_app(cred)
-        print("Firebase Admin SDK initialized successfully.")
-    except Exception as e:
-        print(f"Error initializing Firebase Admin SDK: {e}")
-        # Log this error severely as the function won't work without Firebase auth.
-
-def verify_firebase_token(request):
-    """
-    Verifies the Firebase ID token from the Authorization header.
-    Returns the decoded token (containing uid) if valid, None otherwise.
-    """
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        raise ValueError("Authorization header missing.")
-
-    id_token = auth_header.split(' ').pop()
-    if not id_token:
-        raise ValueError("Firebase ID token missing from Authorization header.")
+# Longest window a single range request may ask for
+MAX_RANGE_DAYS = int(os.environ.get("AVAILABILITY_MAX_RANGE_DAYS", 90))
 
+def parse_date(value, field_name):
     try:
-        decoded_token = auth.verify_id_token(id_token)
-        return decoded_token
-    except Exception as e:
-        print(f"Error verifying Firebase ID token: {e}")
-        raise ValueError("Invalid or expired Firebase ID token.")
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {field_name} format. Expected YYYY-MM-DD.")
 
 @functions_framework.http
 def get_available_appointments(request):
     """
-    HTTP Cloud Function to retrieve available appointment slots for a given date.
+    HTTP Cloud Function to retrieve available appointment slots.
     Requires Firebase authentication.
-    It calculates availability by comparing predefined slots with existing bookings.
+    Accepts either a single `date`, or a range via `startDate`/`endDate` (up to MAX_RANGE_DAYS days).
+    A slot booked for any service is taken. Availability for the whole window comes from one SQL statement.
+    A `serviceType` in the request is accepted but has no effect, in either mode: since
+    one active booking per slot is enforced across services (sql/007), every service
+    sees the same free slots.
     """
     # Handle CORS Preflight requests.
     if request.method == 'OPTIONS':
@@ -84,55 +59,53 @@ def get_available_appointments(request):
             raise ValueError("No valid JSON data provided in the request body.")
 
         requested_date_str = request_json.get('date')
-
-        if not requested_date_str:
-            return (json.dumps({"error": "Missing required field: date (YYYY-MM-DD)."}), 400, headers)
-
+        start_date_str = request_json.get('startDate')
+        end_date_str = request_json.get('endDate')
+        range_mode = bool(start_date_str or end_date_str)
+        # serviceType is ignored: availability no longer depends on the service
+
+        if range_mode:
+            if not (start_date_str and end_date_str):
+                return (json.dumps({"error": "Range requests need both startDate and endDate (YYYY-MM-DD)."}), 400, headers)
+            start_date = parse_date(start_date_str, 'startDate')
+            end_date = parse_date(end_date_str, 'endDate')
+            if end_date < start_date:
+                return (json.dumps({"error": "endDate must not be before startDate."}), 400, headers)
+            if (end_date - start_date).days + 1 > MAX_RANGE_DAYS:
+                return (json.dumps({"error": f"Date range too large. Maximum is {MAX_RANGE_DAYS} days."}), 400, headers)
+        else:
+            if not requested_date_str:
+                return (json.dumps({"error": "Missing required field: date (YYYY-MM-DD), or startDate and endDate."}), 400, headers)
+            start_date = end_date = parse_date(requested_date_str, 'date')
+
+        # --- Database Connection and Retrieval of Free Slots ---
         try:
-            requested_date = datetime.strptime(requested_date_str, '%Y-%m-%d').date()
-        except ValueError:
-            return (json.dumps({"error": "Invalid date format. Expected YYYY-MM-DD."}), 400, headers)
-
-        # Define standard available time slots for a day
-        start_time = time(9, 0)
-        end_time = time(17, 0)
-        slot_duration_minutes = 30
-
-        possible_slots = []
-        current_slot_time = datetime.combine(requested_date, start_time)
-        while current_slot_time.time() < end_time:
-            possible_slots.append(current_slot_time.strftime('%H:%M'))
-            current_slot_time += timedelta(minutes=slot_duration_minutes)
-
-        # --- Database Connection and Retrieval of Booked Slots ---
-        try:
-            conn = psycopg2.connect(
-                host=DB_HOST,
-                user=DB_USER,
-                password=DB_PASSWORD,
-                database=DB_NAME
-            )
+            conn = db.get_connection()
             cur = conn.cursor()
 
-            # Query for booked appointments on the requested date that are not cancelled
-            select_booked_query = """
-            SELECT appointment_time
-            FROM appointments
-            WHERE appointment_date = %s AND status != 'cancelled';
-            """
-            cur.execute(select_booked_query, (requested_date,))
-            
-            booked_times = {row[0].strftime('%H:%M') for row in cur.fetchall()}
+            free_slots = slots.fetch_free_slots(cur, start_date, end_date)
+
+            # Every day in the window gets a key, even when it is fully booked
+            slots_by_day = {
+                (start_date + timedelta(days=offset)).isoformat(): []
+                for offset in range((end_date - start_date).days + 1)
+            }
+            for slot_date, slot_time in free_slots:
+                slots_by_day[slot_date].append(slot_time)
 
-            # Calculate available slots
-            available_slots = [
-                slot for slot in possible_slots
-                if slot not in booked_times
-            ]
+            if not range_mode:
+                available_slots = slots_by_day[start_date.isoformat()]
+                print(f"Available slots for {requested_date_str}: {available_slots}")
+                return (json.dumps({"date": requested_date_str, "slots": available_slots}), 200, headers)
 
-            print(f"Available slots for {requested_date_str}: {available_slots}")
+            total_slots = sum(len(slots) for slots in slots_by_day.values())
+            print(f"Available slots for {start_date_str}..{end_date_str} {total_slots} across {len(slots_by_day)} days")
 
-            return (json.dumps({"date": requested_date_str, "slots": available_slots}), 200, headers)
+            return serialization.json_response(request, {
+                "startDate": start_date.isoformat(),
+                "endDate": end_date.isoformat(),
+                "days": slots_by_day
+            }, 200, headers)
 
         except psycopg2.Error as db_err:
             print(f"Database error during available slots retrieval: {db_err}")
@@ -147,8 +120,8 @@ def get_available_appointments(request):
         finally:
             if cur:
                 cur.close()
-            if conn:
-                conn.close()
+            # Return the connection to the pool instead of closing it
+            db.release_connection(conn)
 
     except ValueError as e:
         print(f"Bad Request Error: {e}")
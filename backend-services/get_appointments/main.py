@@ -1,70 +1,131 @@
 import os
 import functions_framework
 import json
+import base64
+import hashlib
 import psycopg2
-from datetime import datetime, date, time
-import firebase_admin
-from firebase_admin import credentials, auth
-
-# Database connection details from environment variables
-DB_USER = os.environ.get("DB_USER")
-DB_PASSWORD = os.environ.get("DB_PASSWORD")
-DB_HOST = os.environ.get("DB_HOST")
-DB_NAME = os.environ.get("DB_NAME")
-
-# Firebase Admin SDK key from Secret Manager
-FIREBASE_ADMIN_SDK_KEY = os.environ.get("FIREBASE_ADMIN_SDK_KEY")
-
-# Initialize Firebase Admin SDK only once
-if not firebase_admin._apps:
+from psycopg2 import sql
+from shared import db # Pooled Cloud SQL connections, reused across invocations
+from shared.firebase_auth import verify_firebase_token # Cached ID-token verification
+from shared import serialization # Precompiled row conversion, fast JSON, gzip
+from datetime import date, time
+
+# --- Pagination ---
+DEFAULT_PAGE_SIZE = int(os.environ.get("APPOINTMENTS_DEFAULT_PAGE_SIZE", 50))
+MAX_PAGE_SIZE = int(os.environ.get("APPOINTMENTS_MAX_PAGE_SIZE", 200))
+
+# Columns a client may ask for with `fields`; anything else is rejected
+SELECTABLE_FIELDS = (
+    'id', 'patient_id', 'patient_email', 'appointment_date', 'appointment_time',
+    'service_type', 'notes', 'status', 'created_at'
+)
+# Always fetched, because the next-page cursor is built from them
+KEYSET_FIELDS = ('appointment_date', 'appointment_time', 'id')
+
+VALID_STATUSES = ('booked', 'cancelled')
+
+# Bumped by a trigger on every change to the patient's appointments (sql/005)
+SELECT_VERSION_QUERY = """
+SELECT version FROM patient_appointment_versions WHERE patient_id = %s;
+"""
+
+def build_etag(patient_id, version, query_shape):
+    """Weak ETag for one page: patient, data version, and every parameter that shapes the response."""
+    digest = hashlib.sha256(json.dumps([patient_id, version, query_shape], default=str).encode('utf-8')).hexdigest()
+    return f'W/"{version}-{digest[:20]}"'
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates
+
+def encode_cursor(row_values, order):
+    """Opaque page token: the keyset of the last row returned, plus the sort order."""
+    appointment_date, appointment_time, appointment_id = row_values
+    payload = json.dumps([appointment_date.isoformat(), appointment_time.isoformat(), appointment_id, order])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+def decode_cursor(token, order):
     try:
-        cred_json = json.loads(FIREBASE_ADMIN_SDK_KEY)
-        cred = credentials.Certificate(cred_json)
-        firebase_admin.initialize_app(cred)
-        print("Firebase Admin SDK initialized successfully.")
-    except Exception as e:
-        print(f"Error initializing Firebase Admin SDK: {e}")
-        # Log this error severely as the function won't work without Firebase auth.
-
-def verify_firebase_token(request):
+        appointment_date, appointment_time, appointment_id, cursor_order = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        keyset = (date.fromisoformat(appointment_date), time.fromisoformat(appointment_time), int(appointment_id))
+    except Exception:
+        raise ValueError("Invalid cursor.")
+    if cursor_order != order:
+        raise ValueError("Cursor was issued for a different sort order.")
+    return keyset
+
+def parse_list_param(value):
+    """Accepts a JSON list or a comma-separated string."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    return [str(item).strip() for item in value if str(item).strip()]
+
+def build_select_query(patient_id, fields, statuses, from_date, to_date, keyset, order, limit):
     """
-    Verifies the Firebase ID token from the Authorization header.
-    Returns the decoded token (containing uid) if valid, None otherwise.
+    Builds the page query. All filters run in SQL and the keyset predicate
+    (appointment_date, appointment_time, id) < / > cursor uses idx_appointments_patient_keyset,
+    so each page costs the same no matter how long the patient's history is.
     """
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        raise ValueError("Authorization header missing.")
-
-    id_token = auth_header.split(' ').pop()
-    if not id_token:
-        raise ValueError("Firebase ID token missing from Authorization header.")
-
-    try:
-        decoded_token = auth.verify_id_token(id_token)
-        return decoded_token
-    except Exception as e:
-        print(f"Error verifying Firebase ID token: {e}")
-        raise ValueError("Invalid or expired Firebase ID token.")
+    columns = list(fields) + [field for field in KEYSET_FIELDS if field not in fields]
+    conditions = [sql.SQL("patient_id = %(patient_id)s")]
+    params = {"patient_id": patient_id, "limit": limit + 1} # One extra row tells us if there is a next page
+
+    if statuses:
+        conditions.append(sql.SQL("status = ANY(%(statuses)s)"))
+        params["statuses"] = statuses
+    if from_date:
+        conditions.append(sql.SQL("appointment_date >= %(from_date)s"))
+        params["from_date"] = from_date
+    if to_date:
+        conditions.append(sql.SQL("appointment_date <= %(to_date)s"))
+        params["to_date"] = to_date
+    if keyset:
+        comparison = sql.SQL("<") if order == 'desc' else sql.SQL(">")
+        conditions.append(sql.SQL("(appointment_date, appointment_time, id) {} (%(cursor_date)s, %(cursor_time)s, %(cursor_id)s)").format(comparison))
+        params["cursor_date"], params["cursor_time"], params["cursor_id"] = keyset
+
+    direction = sql.SQL("DESC") if order == 'desc' else sql.SQL("ASC")
+    query = sql.SQL("""
+            SELECT {columns}
+            FROM appointments
+            WHERE {conditions}
+            ORDER BY appointment_date {direction}, appointment_time {direction}, id {direction}
+            LIMIT %(limit)s;
+            """).format(
+        columns=sql.SQL(", ").join(sql.Identifier(column) for column in columns),
+        conditions=sql.SQL(" AND ").join(conditions),
+        direction=direction,
+    )
+    return query, params
 
 @functions_framework.http
 def get_appointments(request):
     """
     HTTP Cloud Function to retrieve patient appointments from Cloud SQL PostgreSQL.
     Requires Firebase authentication. Filters appointments by authenticated patient ID.
-    Now retrieves ALL appointments, including 'cancelled' ones.
+    Returns one page at a time (keyset pagination on appointment_date, appointment_time, id).
+    Optional parameters (JSON body or query string): limit, cursor, order ('desc' or 'asc'),
+    status, fromDate, toDate (YYYY-MM-DD) and fields (column projection).
+    Responses carry an ETag; a matching If-None-Match gets 304 without reading any rows.
     """
     # Handle CORS Preflight requests.
     if request.method == 'OPTIONS':
         headers = {
             'Access-Control-Allow-Origin': '*',
             'Access-Control-Allow-Methods': 'GET, POST',
-            'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+            'Access-Control-Allow-Headers': 'Content-Type, Authorization, If-None-Match',
             'Access-Control-Max-Age': '3600'
         }
         return ('', 204, headers)
 
     headers = {
-        'Access-Control-Allow-Origin': '*'
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'ETag, Content-Encoding',
+        'Cache-Control': 'private, no-cache' # Always revalidate; a matching ETag costs one PK lookup
     }
 
     conn = None
@@ -79,48 +140,84 @@ def get_appointments(request):
         except ValueError as e:
             return (json.dumps({"error": str(e)}), 401, headers) # 401 Unauthorized
 
-        request_json = request.get_json(silent=True)
-        patient_id_from_request = request_json.get('patientId') if request_json else None
+        request_json = request.get_json(silent=True) or {}
+        # Query-string parameters are accepted too, so GET requests can paginate
+        params = dict(request.args.items()) if request.args else {}
+        params.update(request_json)
+        patient_id_from_request = params.get('patientId')
 
         if patient_id_from_request and patient_id_from_request != authenticated_patient_id:
             print(f"Warning: Request patientId ({patient_id_from_request}) does not match authenticated UID ({authenticated_patient_id}). Proceeding with authenticated UID.")
 
+        # --- Pagination, filter and projection parameters ---
+        try:
+            limit = int(params.get('limit') or DEFAULT_PAGE_SIZE)
+        except (TypeError, ValueError):
+            raise ValueError("limit must be a number.")
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}.")
+
+        order = str(params.get('order') or 'desc').lower()
+        if order not in ('asc', 'desc'):
+            raise ValueError("order must be 'asc' or 'desc'.")
+
+        statuses = parse_list_param(params.get('status'))
+        if statuses and any(status not in VALID_STATUSES for status in statuses):
+            raise ValueError(f"status must be one of: {', '.join(VALID_STATUSES)}.")
+
+        try:
+            from_date = date.fromisoformat(params['fromDate']) if params.get('fromDate') else None
+            to_date = date.fromisoformat(params['toDate']) if params.get('toDate') else None
+        except (TypeError, ValueError):
+            raise ValueError("Invalid fromDate/toDate format. Expected YYYY-MM-DD.")
+
+        fields = parse_list_param(params.get('fields')) or list(SELECTABLE_FIELDS)
+        unknown_fields = [field for field in fields if field not in SELECTABLE_FIELDS]
+        if unknown_fields:
+            raise ValueError(f"Unknown fields: {', '.join(unknown_fields)}.")
+
+        keyset = decode_cursor(params['cursor'], order) if params.get('cursor') else None
 
         # --- Database Connection and Retrieval ---
         try:
-            conn = psycopg2.connect(
-                host=DB_HOST,
-                user=DB_USER,
-                password=DB_PASSWORD,
-                database=DB_NAME
-            )
+            conn = db.get_connection()
             cur = conn.cursor()
 
-            appointments = []
-            # Always filter by the authenticated_patient_id, but now include all statuses
-            select_query = """
-            SELECT id, patient_id, patient_email, appointment_date, appointment_time, service_type, notes, status, created_at
-            FROM appointments
-            WHERE patient_id = %s
-            ORDER BY appointment_date DESC, appointment_time DESC;
-            """
-            cur.execute(select_query, (authenticated_patient_id,))
+            # --- Conditional request: answer 304 before touching any appointment rows ---
+            cur.execute(SELECT_VERSION_QUERY, (authenticated_patient_id,))
+            version_row = cur.fetchone()
+            version = version_row[0] if version_row else 0
+            etag = build_etag(
+                authenticated_patient_id, version,
+                [limit, order, statuses, from_date, to_date, fields, params.get('cursor')]
+            )
+            headers['ETag'] = etag
+            if etag_matches(request.headers.get('If-None-Match'), etag):
+                print(f"Appointments for user {authenticated_patient_id} unchanged (version {version}); returning 304.")
+                return ('', 304, headers)
+
+            # Always filter by the authenticated_patient_id
+            select_query, query_params = build_select_query(
+                authenticated_patient_id, fields, statuses, from_date, to_date, keyset, order, limit
+            )
+            cur.execute(select_query, query_params)
 
-            # Fetch all rows and convert to a list of dictionaries
             column_names = [desc[0] for desc in cur.description]
-            for row in cur.fetchall():
-                appointment = dict(zip(column_names, row))
-                if 'appointment_date' in appointment and isinstance(appointment['appointment_date'], date):
-                    appointment['appointment_date'] = appointment['appointment_date'].isoformat()
-                if 'appointment_time' in appointment and isinstance(appointment['appointment_time'], time):
-                    appointment['appointment_time'] = appointment['appointment_time'].isoformat()
-                if 'created_at' in appointment and isinstance(appointment['created_at'], datetime):
-                    appointment['created_at'] = appointment['created_at'].isoformat()
-                appointments.append(appointment)
+            keyset_positions = [column_names.index(field) for field in KEYSET_FIELDS]
+            rows = cur.fetchall()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
 
-            print(f"Retrieved {len(appointments)} appointments for user {authenticated_patient_id} (including cancelled).")
+            # Convert the page to a list of dictionaries, keeping only the requested fields
+            appointments = serialization.rows_to_dicts(cur, rows, fields)
 
-            return (json.dumps({"appointments": appointments}), 200, headers)
+            next_cursor = None
+            if has_more:
+                next_cursor = encode_cursor([rows[-1][position] for position in keyset_positions], order)
+
+            print(f"Retrieved {len(appointments)} appointments for user {authenticated_patient_id} (more: {has_more}).")
+
+            return serialization.json_response(request, {"appointments": appointments, "nextCursor": next_cursor}, 200, headers)
 
         except psycopg2.Error as db_err:
             print(f"Database error during appointment retrieval: {db_err}")
@@ -135,8 +232,8 @@ def get_appointments(request):
         finally:
             if cur:
                 cur.close()
-            if conn:
-                conn.close()
+            # Return the connection to the pool instead of closing it
+            db.release_connection(conn)
 
     except ValueError as e:
         print(f"Bad Request Error: {e}")
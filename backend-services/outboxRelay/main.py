@@ -0,0 +1,167 @@
+# your-healthcare-platform/backend-services/outboxRelay/main.py
+
+import os
+import json
+import time
+import select
+import functions_framework
+import psycopg2
+from shared import db # Pooled Cloud SQL connections, reused across invocations
+from shared import events # Batched Pub/Sub publishing with per-patient ordering keys
+from shared.outbox import OUTBOX_NOTIFY_CHANNEL
+
+# --- Relay tuning ---
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", 500)) # Rows claimed per drain round
+OUTBOX_HTTP_TIME_BUDGET = float(os.environ.get("OUTBOX_HTTP_TIME_BUDGET", 50)) # Seconds one scheduled run may drain for
+OUTBOX_POLL_INTERVAL = float(os.environ.get("OUTBOX_POLL_INTERVAL", 5)) # Max seconds between drains in long-running mode
+OUTBOX_RETENTION_HOURS = int(os.environ.get("OUTBOX_RETENTION_HOURS", 72)) # Published rows are deleted after this
+
+# Only one relay may drain at a time, otherwise two relays could reorder a patient's events
+OUTBOX_ADVISORY_LOCK_ID = 7220451
+
+SELECT_PENDING_QUERY = """
+SELECT id, patient_id, payload::text
+FROM appointment_event_outbox
+WHERE published_at IS NULL
+ORDER BY id
+LIMIT %s;
+"""
+
+MARK_PUBLISHED_QUERY = """
+UPDATE appointment_event_outbox
+SET published_at = now()
+WHERE id = ANY(%s);
+"""
+
+DELETE_PUBLISHED_QUERY = """
+DELETE FROM appointment_event_outbox
+WHERE published_at < now() - make_interval(hours => %s);
+"""
+
+def drain_once(conn, batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Publishes up to batch_size pending outbox rows and marks the delivered ones.
+    Returns (claimed, published), or None if another relay holds the drain lock.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_try_advisory_xact_lock(%s);", (OUTBOX_ADVISORY_LOCK_ID,))
+        if not cur.fetchone()[0]:
+            conn.rollback()
+            return None
+
+        cur.execute(SELECT_PENDING_QUERY, (batch_size,))
+        rows = cur.fetchall()
+        if not rows:
+            conn.rollback()
+            return (0, 0)
+
+        messages = []
+        for row_id, patient_id, payload in rows:
+            message_data = json.loads(payload)
+            messages.append((payload.encode("utf-8"), patient_id or "", events.event_attributes(message_data)))
+
+        results = events.publish_batch(messages)
+
+        # Keep per-patient order: once an event for a patient fails, none of that
+        # patient's later events in this batch count as delivered, so the next round
+        # re-sends them in their original order (consumers drop duplicates by eventId).
+        blocked_patients = set()
+        published_ids = []
+        for (row_id, patient_id, _), delivered in zip(rows, results):
+            if patient_id in blocked_patients:
+                continue
+            if delivered:
+                published_ids.append(row_id)
+            else:
+                blocked_patients.add(patient_id)
+
+        if published_ids:
+            cur.execute(MARK_PUBLISHED_QUERY, (published_ids,))
+        conn.commit()
+
+    print(f"Outbox relay: published {len(published_ids)} of {len(rows)} events"
+          f"{f' ({len(blocked_patients)} patients held back)' if blocked_patients else ''}.")
+    return (len(rows), len(published_ids))
+
+def drain(conn, time_budget=None):
+    """Drains full batches until the outbox is empty, a batch fails, or time runs out."""
+    started = time.monotonic()
+    total_published = 0
+    while True:
+        result = drain_once(conn)
+        if result is None:
+            print("Outbox relay: another relay is draining; skipping.")
+            break
+        claimed, published = result
+        total_published += published
+        if claimed < OUTBOX_BATCH_SIZE or published < claimed:
+            break
+        if time_budget is not None and time.monotonic() - started > time_budget:
+            break
+    return total_published
+
+def delete_published(conn):
+    with conn.cursor() as cur:
+        cur.execute(DELETE_PUBLISHED_QUERY, (OUTBOX_RETENTION_HOURS,))
+        deleted = cur.rowcount
+    conn.commit()
+    return deleted
+
+@functions_framework.http
+def relay_outbox(request):
+    """
+    HTTP Cloud Function (invoke from Cloud Scheduler) that drains the appointment
+    event outbox to the appointment-events topic and prunes old published rows.
+    """
+    conn = None
+    try:
+        conn = db.get_connection()
+        started = time.monotonic()
+        published = drain(conn, time_budget=OUTBOX_HTTP_TIME_BUDGET)
+        deleted = delete_published(conn)
+        elapsed = time.monotonic() - started
+        rate = published / elapsed if elapsed > 0 else 0
+        print(f"Outbox relay run: {published} events in {elapsed:.2f}s ({rate:.0f}/s), {deleted} old rows pruned.")
+        return (json.dumps({"published": published, "pruned": deleted, "seconds": round(elapsed, 3)}), 200)
+    except psycopg2.Error as db_err:
+        print(f"Database error during outbox relay: {db_err}")
+        db.release_connection(conn, discard=True)
+        conn = None
+        return (json.dumps({"error": "Database operation failed."}), 500)
+    finally:
+        db.release_connection(conn)
+
+def run_forever():
+    """
+    Long-running relay (e.g. a Cloud Run job or a VM). Wakes on NOTIFY from the
+    writing transactions, and otherwise polls every OUTBOX_POLL_INTERVAL seconds.
+    """
+    listen_conn = db.open_unpooled_connection()
+    listen_conn.set_session(autocommit=True)
+    with listen_conn.cursor() as cur:
+        cur.execute(f"LISTEN {OUTBOX_NOTIFY_CHANNEL};")
+    print(f"Outbox relay listening on '{OUTBOX_NOTIFY_CHANNEL}'.")
+
+    last_prune = 0
+    while True:
+        conn = None
+        try:
+            conn = db.get_connection() # Inside the try, so a database outage is retried, not fatal
+            drain(conn)
+            if time.monotonic() - last_prune > 3600:
+                delete_published(conn)
+                last_prune = time.monotonic()
+        except (psycopg2.Error, db.PoolTimeoutError) as db_err:
+            print(f"Database error during outbox relay: {db_err}")
+            db.release_connection(conn, discard=True)
+            conn = None
+            time.sleep(OUTBOX_POLL_INTERVAL)
+        finally:
+            db.release_connection(conn)
+
+        if select.select([listen_conn], [], [], OUTBOX_POLL_INTERVAL) != ([], [], []):
+            listen_conn.poll()
+            listen_conn.notifies.clear()
+
+if __name__ == '__main__':
+    run_forever()
@@ -0,0 +1,53 @@
+# your-healthcare-platform/backend-services/registerDeviceToken/main.py
+
+import functions_framework
+import json
+from shared.firebase_auth import verify_firebase_token # Cached ID-token verification
+from shared import device_tokens # Per-patient FCM registration tokens read by sendNotification
+
+@functions_framework.http
+def register_device_token(request):
+    """
+    HTTP Cloud Function that registers (POST) or removes (DELETE) an FCM registration
+    token for the authenticated patient. The web/mobile app calls it after obtaining
+    a token from the FCM SDK, and again whenever the SDK refreshes the token.
+    Expected JSON body: {"token": "...", "platform": "web|android|ios"}.
+    """
+    # Handle CORS Preflight requests.
+    if request.method == 'OPTIONS':
+        headers = {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'POST, DELETE',
+            'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+            'Access-Control-Max-Age': '3600'
+        }
+        return ('', 204, headers)
+
+    headers = {
+        'Access-Control-Allow-Origin': '*'
+    }
+
+    try:
+        try:
+            decoded_token = verify_firebase_token(request)
+            authenticated_patient_id = decoded_token['uid']
+        except ValueError as e:
+            return (json.dumps({"error": str(e)}), 401, headers)
+
+        request_json = request.get_json(silent=True) or {}
+        token = request_json.get('token')
+        if not token or not isinstance(token, str) or '/' in token:
+            return (json.dumps({"error": "A valid FCM registration token is required."}), 400, headers)
+
+        if request.method == 'DELETE':
+            device_tokens.unregister_token(authenticated_patient_id, token)
+            print(f"Device token removed for patient {authenticated_patient_id}.")
+            return (json.dumps({"message": "Device token removed."}), 200, headers)
+
+        device_tokens.register_token(authenticated_patient_id, token, request_json.get('platform'))
+        print(f"Device token registered for patient {authenticated_patient_id}.")
+        return (json.dumps({"message": "Device token registered."}), 200, headers)
+
+    except Exception as e:
+        print(f"Error updating device token: {e}")
+        return (json.dumps({"error": "An unexpected server error occurred."}), 500, headers)
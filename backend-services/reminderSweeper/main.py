@@ -0,0 +1,183 @@
+# your-healthcare-platform/backend-services/reminderSweeper/main.py
+
+import os
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+import functions_framework
+import psycopg2
+from psycopg2.extras import execute_values
+from shared import db # Pooled Cloud SQL connections, reused across invocations
+from shared import events # Batched Pub/Sub publishing with per-patient ordering keys
+
+# --- Sweeper tuning ---
+REMINDER_WINDOWS = os.environ.get("REMINDER_WINDOWS", "24h,2h") # How far ahead each reminder goes out
+REMINDER_LOOKBACK_MINUTES = int(os.environ.get("REMINDER_LOOKBACK_MINUTES", 60)) # Catch-up span if a run was missed
+REMINDER_BATCH_SIZE = int(os.environ.get("REMINDER_BATCH_SIZE", 1000)) # Rows fetched and published per round
+REMINDER_RETENTION_DAYS = int(os.environ.get("REMINDER_RETENTION_DAYS", 30)) # Sent records are deleted after this
+CLINIC_TIMEZONE = ZoneInfo(os.environ.get("CLINIC_TIMEZONE", "UTC")) # appointment_date/time are stored in clinic local time
+
+# Only one sweeper may run at a time, otherwise two sweeps could publish the same reminders
+REMINDER_ADVISORY_LOCK_ID = 7220452
+
+# Row comparisons on (appointment_date, appointment_time) use the leading columns
+# of uq_appointments_active_slot_time, so this is an index range scan.
+SELECT_DUE_REMINDERS_QUERY = """
+SELECT a.id, a.patient_id, a.patient_email, a.appointment_date, a.appointment_time, a.service_type
+FROM appointments a
+WHERE a.status != 'cancelled'
+  AND (a.appointment_date, a.appointment_time) >= (%s, %s)
+  AND (a.appointment_date, a.appointment_time) < (%s, %s)
+  AND NOT EXISTS (
+      SELECT 1 FROM appointment_reminders_sent r
+      WHERE r.appointment_id = a.id AND r.reminder_window = %s
+  )
+ORDER BY a.appointment_date, a.appointment_time;
+"""
+
+INSERT_SENT_QUERY = """
+INSERT INTO appointment_reminders_sent (appointment_id, reminder_window)
+VALUES %s
+ON CONFLICT DO NOTHING;
+"""
+
+DELETE_OLD_SENT_QUERY = """
+DELETE FROM appointment_reminders_sent
+WHERE sent_at < now() - make_interval(days => %s);
+"""
+
+def parse_windows(value):
+    """Parses '24h,2h,30m' into [('24h', timedelta(hours=24)), ...]."""
+    windows = []
+    for label in (part.strip() for part in value.split(',')):
+        if not label:
+            continue
+        amount, unit = label[:-1], label[-1]
+        if unit not in ('h', 'm') or not amount.isdigit():
+            raise ValueError(f"Invalid reminder window '{label}'. Use e.g. '24h' or '30m'.")
+        windows.append((label, timedelta(hours=int(amount)) if unit == 'h' else timedelta(minutes=int(amount))))
+    return windows
+
+def reminder_event_id(appointment_id, window_label):
+    # Stable per (appointment, window), so sendNotification drops a reminder that is
+    # published twice (e.g. the sent record failed to commit after publishing).
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"appointment-reminder/{appointment_id}/{window_label}"))
+
+def build_reminder_message(row, window_label):
+    appointment_id, patient_id, patient_email, appointment_date, appointment_time, service_type = row
+    message_data = {
+        "eventType": "appointmentReminder",
+        "eventId": reminder_event_id(appointment_id, window_label),
+        "appointmentId": appointment_id,
+        "patientId": patient_id,
+        "patientEmail": patient_email,
+        "appointmentDate": appointment_date.isoformat(),
+        "appointmentTime": appointment_time.strftime('%H:%M'),
+        "serviceType": service_type,
+        "reminderWindow": window_label,
+    }
+    return (json.dumps(message_data).encode("utf-8"), patient_id or "", events.event_attributes(message_data))
+
+def sweep_window(read_conn, write_conn, window_label, lead, now):
+    """
+    Publishes reminders for appointments starting between lead - lookback and lead from now.
+    Rows stream from a server-side cursor, so memory stays at one batch however many
+    appointments are due. Each batch is recorded as sent in its own transaction right
+    after publishing; unpublished reminders are left for the next run.
+    Returns (due, published).
+    """
+    window_end = now + lead
+    window_start = window_end - timedelta(minutes=REMINDER_LOOKBACK_MINUTES)
+    params = (window_start.date(), window_start.time(), window_end.date(), window_end.time(), window_label)
+
+    due = 0
+    published = 0
+    with read_conn.cursor(name=f"reminder_sweep_{window_label}") as cur:
+        cur.itersize = REMINDER_BATCH_SIZE
+        cur.execute(SELECT_DUE_REMINDERS_QUERY, params)
+        while True:
+            rows = cur.fetchmany(REMINDER_BATCH_SIZE)
+            if not rows:
+                break
+            due += len(rows)
+
+            results = events.publish_batch([build_reminder_message(row, window_label) for row in rows])
+            sent = [(row[0], window_label) for row, delivered in zip(rows, results) if delivered]
+            if sent:
+                with write_conn.cursor() as write_cur:
+                    execute_values(write_cur, INSERT_SENT_QUERY, sent, page_size=len(sent))
+                write_conn.commit()
+            published += len(sent)
+
+    print(f"Reminder sweep '{window_label}' ({window_start:%Y-%m-%d %H:%M} to {window_end:%Y-%m-%d %H:%M}): "
+          f"published {published} of {due} reminders.")
+    return (due, published)
+
+def sweep(read_conn, write_conn, windows=None):
+    """
+    Runs every reminder window. Returns {window_label: {"due": n, "published": n}},
+    or None if another sweeper holds the lock.
+    """
+    windows = windows or parse_windows(REMINDER_WINDOWS)
+    with read_conn.cursor() as cur:
+        cur.execute("SELECT pg_try_advisory_xact_lock(%s);", (REMINDER_ADVISORY_LOCK_ID,))
+        if not cur.fetchone()[0]:
+            read_conn.rollback()
+            return None
+
+    # Clinic-local wall clock, to match how appointment_date/time are stored
+    now = datetime.now(CLINIC_TIMEZONE).replace(tzinfo=None, second=0, microsecond=0)
+    report = {}
+    try:
+        for window_label, lead in windows:
+            due, published = sweep_window(read_conn, write_conn, window_label, lead, now)
+            report[window_label] = {"due": due, "published": published}
+    finally:
+        read_conn.rollback() # Ends the read transaction and releases the sweep lock
+    return report
+
+def delete_old_sent(conn):
+    with conn.cursor() as cur:
+        cur.execute(DELETE_OLD_SENT_QUERY, (REMINDER_RETENTION_DAYS,))
+        deleted = cur.rowcount
+    conn.commit()
+    return deleted
+
+@functions_framework.http
+def sweep_reminders(request):
+    """
+    HTTP Cloud Function (invoke from Cloud Scheduler, e.g. every 15 minutes) that
+    publishes appointmentReminder events for upcoming appointments.
+    """
+    read_conn = None
+    write_conn = None
+    try:
+        read_conn = db.get_connection()
+        write_conn = db.get_connection()
+        started = time.monotonic()
+        report = sweep(read_conn, write_conn)
+        if report is None:
+            print("Reminder sweep: another sweeper is running; skipping.")
+            return (json.dumps({"skipped": True}), 200)
+        pruned = delete_old_sent(write_conn)
+        elapsed = time.monotonic() - started
+        published = sum(window["published"] for window in report.values())
+        print(f"Reminder sweep run: {published} reminders in {elapsed:.2f}s, {pruned} old records pruned.")
+        return (json.dumps({"windows": report, "pruned": pruned, "seconds": round(elapsed, 3)}), 200)
+    except ValueError as e:
+        print(f"Reminder sweep misconfigured: {e}")
+        return (json.dumps({"error": str(e)}), 500)
+    except psycopg2.Error as db_err:
+        print(f"Database error during reminder sweep: {db_err}")
+        db.release_connection(read_conn, discard=True)
+        db.release_connection(write_conn, discard=True)
+        read_conn = write_conn = None
+        return (json.dumps({"error": "Database operation failed."}), 500)
+    finally:
+        db.release_connection(read_conn)
+        db.release_connection(write_conn)
+
+if __name__ == '__main__':
+    print(json.dumps(sweep_reminders(None)[0]))
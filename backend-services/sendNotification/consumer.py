@@ -0,0 +1,141 @@
+# your-healthcare-platform/backend-services/sendNotification/consumer.py
+
+import os
+import json
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from google.cloud import pubsub_v1
+
+CONSUMER_WORKERS = int(os.environ.get("CONSUMER_WORKERS", 32)) # Messages processed concurrently
+# Emails have their own pool in main.py (SMTP_POOL_SIZE sessions); size the pool for
+# the other channels so every message's push can be in flight at once.
+os.environ.setdefault("CHANNEL_WORKERS", str(CONSUMER_WORKERS))
+
+from main import handle_notification_event, handle_digest_events, prefetch_profiles, push_sender # Same rendering and delivery as the Cloud Function
+from digest import DIGEST_MODE, DigestBuffer # Optional per-patient coalescing of event bursts
+
+# --- Streaming pull consumer ---
+# A long-running alternative to one push-triggered invocation per message, for mass
+# sends (reminder sweeps, clinic closures). Run it on Cloud Run or a VM.
+PROJECT_ID = os.environ.get("GCP_PROJECT")
+NOTIFICATION_SUBSCRIPTION_ID = os.environ.get("NOTIFICATION_SUBSCRIPTION_ID", "appointment-events-notifications")
+CONSUMER_MAX_MESSAGES = int(os.environ.get("CONSUMER_MAX_MESSAGES", 200)) # Flow control: messages leased but not yet acked
+CONSUMER_MAX_BYTES = int(os.environ.get("CONSUMER_MAX_BYTES", 50 * 1024 * 1024)) # Flow control: bytes leased but not yet acked
+CONSUMER_STATS_INTERVAL = float(os.environ.get("CONSUMER_STATS_INTERVAL", 60)) # Seconds between throughput logs
+
+
+class ConsumerStats:
+    """Throughput and end-to-end latency (publish to ack) since the last report."""
+
+    def __init__(self, window=10000):
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._acked = 0
+        self._nacked = 0
+        self._since = time.monotonic()
+
+    def record(self, latency_seconds, acked=True):
+        with self._lock:
+            if acked:
+                self._acked += 1
+                self._latencies.append(latency_seconds)
+            else:
+                self._nacked += 1
+
+    def report(self):
+        with self._lock:
+            elapsed = time.monotonic() - self._since
+            latencies = sorted(self._latencies)
+            acked, nacked = self._acked, self._nacked
+            self._latencies.clear()
+            self._acked = self._nacked = 0
+            self._since = time.monotonic()
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0
+
+        return {
+            "acked": acked,
+            "nacked": nacked,
+            "messages_per_second": round(acked / elapsed, 1) if elapsed > 0 else 0,
+            "p50_ms": round(percentile(0.50)),
+            "p99_ms": round(percentile(0.99)),
+        }
+
+
+stats = ConsumerStats()
+
+
+def record_settled(message, acked=True):
+    """Counts an acked or nacked message; acked ones add their publish-to-ack latency."""
+    stats.record(time.time() - message.publish_time.timestamp() if acked else 0, acked=acked)
+
+
+# Held messages are acked later from the digest threads, which record them through on_settled.
+# Windows that close together share one batched profile read before their digests go out
+digest_buffer = (DigestBuffer(handle_notification_event, handle_digest_events,
+                              on_settled=record_settled, prefetch=prefetch_profiles)
+                 if DIGEST_MODE else None)
+
+
+def process_message(message):
+    """
+    Subscriber callback, run on the consumer's worker pool. ack()/nack() only queue
+    the decision: the client library sends them to Pub/Sub in batched requests.
+    """
+    try:
+        message_data = json.loads(message.data.decode('utf-8'))
+    except ValueError as e:
+        # Redelivering a malformed message can never succeed
+        print(f"Dropping malformed message {message.message_id}: {e}")
+        message.ack()
+        return
+
+    if digest_buffer is not None:
+        digest_buffer.submit(message, message_data) # Acks or nacks once sent, possibly later as part of a digest
+        return
+
+    try:
+        handle_notification_event(message_data, message.message_id)
+    except Exception as e:
+        print(f"Error processing message {message.message_id}: {e}")
+        message.nack()
+        record_settled(message, acked=False)
+        return
+
+    message.ack()
+    record_settled(message)
+
+
+def run_forever():
+    subscriber = pubsub_v1.SubscriberClient()
+    subscription_path = subscriber.subscription_path(PROJECT_ID, NOTIFICATION_SUBSCRIPTION_ID)
+    streaming_pull = subscriber.subscribe(
+        subscription_path,
+        callback=process_message,
+        flow_control=pubsub_v1.types.FlowControl(max_messages=CONSUMER_MAX_MESSAGES, max_bytes=CONSUMER_MAX_BYTES),
+        scheduler=pubsub_v1.subscriber.scheduler.ThreadScheduler(
+            ThreadPoolExecutor(max_workers=CONSUMER_WORKERS, thread_name_prefix="notify")
+        ),
+    )
+    print(f"Notification consumer pulling from {subscription_path} "
+          f"({CONSUMER_WORKERS} workers, up to {CONSUMER_MAX_MESSAGES} outstanding messages"
+          f"{', digest mode' if digest_buffer is not None else ''}).")
+
+    with subscriber:
+        try:
+            while True:
+                try:
+                    streaming_pull.result(timeout=CONSUMER_STATS_INTERVAL)
+                except FutureTimeoutError:
+                    print(f"Notification consumer stats: {json.dumps(stats.report())}, push: {json.dumps(push_sender.get_stats())}"
+                          f"{f', digest: {json.dumps(digest_buffer.stats)}' if digest_buffer is not None else ''}")
+        except KeyboardInterrupt:
+            streaming_pull.cancel()
+            streaming_pull.result()
+
+
+if __name__ == '__main__':
+    run_forever()
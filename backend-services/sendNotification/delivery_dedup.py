@@ -0,0 +1,295 @@
+# your-healthcare-platform/backend-services/sendNotification/delivery_dedup.py
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+# "firestore" in production, "sqlite" for local runs, "memory" to disable the durable tier
+DEDUP_BACKEND = os.environ.get("DEDUP_BACKEND", "firestore")
+DEDUP_TTL_SECONDS = int(os.environ.get("DEDUP_TTL_SECONDS", 7 * 24 * 3600)) # Longer than Pub/Sub's max retention
+DEDUP_MEMORY_SIZE = int(os.environ.get("DEDUP_MEMORY_SIZE", 10000))
+DEDUP_SQLITE_PATH = os.environ.get("DEDUP_SQLITE_PATH", "/tmp/notification_deliveries.sqlite3")
+DEDUP_FIRESTORE_COLLECTION = os.environ.get("DEDUP_FIRESTORE_COLLECTION", "notificationDeliveries")
+
+
+class TtlCache:
+    """Bounded in-memory set of keys; entries expire after ttl seconds, oldest are evicted first."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict() # key -> expires_at
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            expires_at = self._entries.get(key)
+            if expires_at is None:
+                return False
+            if expires_at <= time.time():
+                del self._entries[key]
+                return False
+            return True
+
+    def add(self, key, expires_at=None):
+        with self._lock:
+            self._entries[key] = expires_at or time.time() + self.ttl
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+# A claim on (event id, channel) while its send is in flight. It lapses after this long,
+# so a claim left behind by a crashed instance doesn't block the channel for good.
+DEDUP_CLAIM_SECONDS = int(os.environ.get("DEDUP_CLAIM_SECONDS", 120)) # Longer than any channel timeout
+
+# Results of DeliveryDedup.claim()
+CLAIMED = "claimed" # Caller owns the send; must call mark_delivered() or release()
+DELIVERED = "delivered" # Already sent; skip
+IN_PROGRESS = "in_progress" # Another worker or instance is sending it right now
+
+
+class SqliteDeliveryStore:
+    """Durable tier for local runs and tests."""
+
+    def __init__(self, path=DEDUP_SQLITE_PATH, ttl=DEDUP_TTL_SECONDS, claim_ttl=DEDUP_CLAIM_SECONDS):
+        self.ttl = ttl
+        self.claim_ttl = claim_ttl
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL;")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS deliveries ("
+                "key TEXT PRIMARY KEY, state TEXT NOT NULL DEFAULT 'done', expires_at REAL NOT NULL);"
+            )
+            try:
+                # Files written before claims existed only held delivered keys
+                self._conn.execute("ALTER TABLE deliveries ADD COLUMN state TEXT NOT NULL DEFAULT 'done';")
+            except sqlite3.OperationalError:
+                pass
+            self._conn.execute("DELETE FROM deliveries WHERE expires_at <= ?;", (time.time(),))
+
+    def get_expiry(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT expires_at FROM deliveries WHERE key = ? AND state = 'done' AND expires_at > ?;",
+                (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def claim(self, key):
+        """
+        Atomically claims the key. Returns (CLAIMED, None), (DELIVERED, expires_at)
+        or (IN_PROGRESS, None). An expired row of either state is taken over.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO deliveries (key, state, expires_at) VALUES (?, 'pending', ?) "
+                "ON CONFLICT (key) DO UPDATE SET state = 'pending', expires_at = excluded.expires_at "
+                "WHERE deliveries.expires_at <= ?;",
+                (key, now + self.claim_ttl, now)
+            )
+            if cursor.rowcount == 1:
+                return CLAIMED, None
+            row = self._conn.execute("SELECT state, expires_at FROM deliveries WHERE key = ?;", (key,)).fetchone()
+        if row and row[0] == "done":
+            return DELIVERED, row[1]
+        return IN_PROGRESS, None
+
+    def release(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM deliveries WHERE key = ? AND state = 'pending';", (key,))
+
+    def add(self, key):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO deliveries (key, state, expires_at) VALUES (?, 'done', ?);", (key, expires_at)
+            )
+        return expires_at
+
+
+class FirestoreDeliveryStore:
+    """
+    Durable tier shared by all instances. Documents carry a `state` (pending while a
+    send is in flight, done afterwards) and an `expireAt` field; configure a Firestore
+    TTL policy on `expireAt` so old records are deleted automatically.
+    """
+
+    def __init__(self, collection=DEDUP_FIRESTORE_COLLECTION, ttl=DEDUP_TTL_SECONDS, claim_ttl=DEDUP_CLAIM_SECONDS):
+        from google.cloud import firestore
+        self.ttl = ttl
+        self.claim_ttl = claim_ttl
+        self._client = firestore.Client()
+        self._collection = self._client.collection(collection)
+
+    def _doc(self, key):
+        # Keys contain characters Firestore ids don't allow, so hash them
+        return self._collection.document(hashlib.sha256(key.encode("utf-8")).hexdigest())
+
+    @staticmethod
+    def _timestamp(epoch_seconds):
+        from datetime import datetime, timezone
+        return datetime.fromtimestamp(epoch_seconds, tz=timezone.utc)
+
+    def get_expiry(self, key):
+        snapshot = self._doc(key).get()
+        if not snapshot.exists or snapshot.to_dict().get("state", "done") != "done":
+            return None
+        expires_at = snapshot.get("expireAt").timestamp()
+        return expires_at if expires_at > time.time() else None
+
+    def claim(self, key):
+        """Same contract as SqliteDeliveryStore.claim: create() fails if the document exists."""
+        from google.api_core.exceptions import AlreadyExists, FailedPrecondition
+        doc = self._doc(key)
+        pending = {"key": key, "state": "pending", "expireAt": self._timestamp(time.time() + self.claim_ttl)}
+        try:
+            doc.create(pending)
+            return CLAIMED, None
+        except AlreadyExists:
+            pass
+
+        snapshot = doc.get()
+        if not snapshot.exists:
+            # Released between our create() and get(); try once more
+            try:
+                doc.create(pending)
+                return CLAIMED, None
+            except AlreadyExists:
+                return IN_PROGRESS, None
+        data = snapshot.to_dict()
+        expires_at = data["expireAt"].timestamp()
+        if expires_at > time.time():
+            return (DELIVERED, expires_at) if data.get("state", "done") == "done" else (IN_PROGRESS, None)
+        try:
+            # Take over an expired record only if nobody else changed it since we read it
+            doc.set(pending, option=self._client.write_option(last_update_time=snapshot.update_time))
+            return CLAIMED, None
+        except FailedPrecondition:
+            return IN_PROGRESS, None
+
+    def release(self, key):
+        self._doc(key).delete()
+
+    def add(self, key):
+        expires_at = time.time() + self.ttl
+        self._doc(key).set({"key": key, "state": "done", "expireAt": self._timestamp(expires_at)})
+        return expires_at
+
+
+class DeliveryDedup:
+    """
+    Remembers which (event id, channel) pairs were delivered. Lookups hit the
+    in-memory TTL cache first, so repeats seen by the same instance cost a dict lookup;
+    the durable store catches redeliveries that land on a different instance.
+
+    Senders claim a key before sending (claim), then either record it (mark_delivered)
+    or give the claim back (release). Concurrent duplicates on this instance are
+    stopped by an in-flight set, and across instances by the store's atomic claim.
+    """
+
+    def __init__(self, durable_store=None, memory_size=DEDUP_MEMORY_SIZE, ttl=DEDUP_TTL_SECONDS):
+        self.memory = TtlCache(memory_size, ttl)
+        self.durable = durable_store
+        self._in_flight = set()
+        self._in_flight_lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "durable_hits": 0, "misses": 0, "recorded": 0,
+                      "in_progress": 0, "released": 0}
+
+    @staticmethod
+    def key(event_id, channel):
+        return f"{event_id}:{channel}"
+
+    def is_delivered(self, event_id, channel):
+        key = self.key(event_id, channel)
+        if key in self.memory:
+            self.stats["memory_hits"] += 1
+            return True
+        if self.durable is not None:
+            try:
+                expires_at = self.durable.get_expiry(key)
+            except Exception as e:
+                # Fail open: a duplicate notification is better than a lost one
+                print(f"Dedup store lookup failed for {key}: {e}")
+                expires_at = None
+            if expires_at:
+                self.memory.add(key, expires_at)
+                self.stats["durable_hits"] += 1
+                return True
+        self.stats["misses"] += 1
+        return False
+
+    def claim(self, event_id, channel):
+        """Returns CLAIMED, DELIVERED or IN_PROGRESS for (event id, channel)."""
+        key = self.key(event_id, channel)
+        if key in self.memory:
+            self.stats["memory_hits"] += 1
+            return DELIVERED
+        with self._in_flight_lock:
+            if key in self._in_flight:
+                self.stats["in_progress"] += 1
+                return IN_PROGRESS
+            self._in_flight.add(key)
+
+        if self.durable is not None:
+            try:
+                result, expires_at = self.durable.claim(key)
+            except Exception as e:
+                # Fail open: a duplicate notification is better than a lost one
+                print(f"Dedup store claim failed for {key}: {e}")
+                result, expires_at = CLAIMED, None
+            if result != CLAIMED:
+                with self._in_flight_lock:
+                    self._in_flight.discard(key)
+                if result == DELIVERED:
+                    self.memory.add(key, expires_at)
+                    self.stats["durable_hits"] += 1
+                else:
+                    self.stats["in_progress"] += 1
+                return result
+
+        self.stats["misses"] += 1
+        return CLAIMED
+
+    def release(self, event_id, channel):
+        """Gives up a claim after a failed send, so a retry can send the channel."""
+        key = self.key(event_id, channel)
+        if self.durable is not None:
+            try:
+                self.durable.release(key)
+            except Exception as e:
+                # The claim still lapses after DEDUP_CLAIM_SECONDS
+                print(f"Dedup store release failed for {key}: {e}")
+        with self._in_flight_lock:
+            self._in_flight.discard(key)
+        self.stats["released"] += 1
+
+    def mark_delivered(self, event_id, channel):
+        key = self.key(event_id, channel)
+        expires_at = None
+        if self.durable is not None:
+            try:
+                expires_at = self.durable.add(key)
+            except Exception as e:
+                print(f"Dedup store write failed for {key}: {e}")
+        self.memory.add(key, expires_at)
+        with self._in_flight_lock:
+            self._in_flight.discard(key)
+        self.stats["recorded"] += 1
+
+
+def create_dedup(backend=DEDUP_BACKEND):
+    if backend == "sqlite":
+        return DeliveryDedup(SqliteDeliveryStore())
+    if backend == "firestore":
+        try:
+            return DeliveryDedup(FirestoreDeliveryStore())
+        except Exception as e:
+            print(f"Could not initialise Firestore dedup store, using memory only: {e}")
+    return DeliveryDedup()
@@ -0,0 +1,144 @@
+# your-healthcare-platform/backend-services/sendNotification/digest.py
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from templates import DIGESTIBLE_EVENT_TYPES
+
+# --- Digest mode (streaming consumer only) ---
+# The first event for a patient is sent straight away and opens a window; events for
+# that patient arriving inside the window are held and sent as one combined email
+# when it closes. A lone event is therefore never delayed, and a burst (series
+# booking, clinic closure) costs two emails instead of dozens.
+DIGEST_MODE = os.environ.get("DIGEST_MODE", "false").lower() == "true"
+DIGEST_WINDOW_SECONDS = float(os.environ.get("DIGEST_WINDOW_SECONDS", 30))
+DIGEST_MAX_EVENTS = int(os.environ.get("DIGEST_MAX_EVENTS", 20)) # Per patient; a full digest is sent early
+DIGEST_MAX_BUFFERED = int(os.environ.get("DIGEST_MAX_BUFFERED", 150)) # All patients; keep below CONSUMER_MAX_MESSAGES
+DIGEST_URGENT_EVENT_TYPES = set(os.environ.get("DIGEST_URGENT_EVENT_TYPES", "appointmentReminder").split(","))
+
+
+class DigestBuffer:
+    """
+    Buffers Pub/Sub messages per patient. Held messages stay leased (the subscriber
+    keeps extending their ack deadline) and are acked only after their digest is
+    delivered, or nacked for redelivery if it fails, so nothing is lost on a crash.
+    `send_single(message_data, message_id)` and `send_digest(events)` raise on failure.
+    `on_settled(message, acked)`, if given, is called after each ack or nack.
+    `prefetch(events)`, if given, is called once with every event of the windows
+    that close together, before their digests are sent (e.g. to batch profile reads).
+    """
+
+    def __init__(self, send_single, send_digest, window=DIGEST_WINDOW_SECONDS,
+                 max_events=DIGEST_MAX_EVENTS, max_buffered=DIGEST_MAX_BUFFERED, on_settled=None, prefetch=None):
+        self.send_single = send_single
+        self.send_digest = send_digest
+        self.on_settled = on_settled
+        self.prefetch = prefetch
+        self.window = window
+        self.max_events = max_events
+        self.max_buffered = max_buffered
+        self._windows = {} # patient_id -> {"deadline": monotonic time, "items": [(message, message_data)]}
+        self._buffered = 0
+        self._lock = threading.Lock()
+        self._flush_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="digest")
+        self.stats = {"immediate": 0, "digests": 0, "digested_events": 0}
+        threading.Thread(target=self._flush_due_loop, name="digest-flusher", daemon=True).start()
+
+    def bypasses_digest(self, message_data):
+        event_type = message_data.get("eventType")
+        return (bool(message_data.get("urgent")) or event_type in DIGEST_URGENT_EVENT_TYPES
+                or event_type not in DIGESTIBLE_EVENT_TYPES)
+
+    def submit(self, message, message_data):
+        patient_id = message_data.get("patientId")
+        if not patient_id or self.bypasses_digest(message_data):
+            self._send_now(message, message_data)
+            return
+
+        flush_now = []
+        with self._lock:
+            current = self._windows.get(patient_id)
+            if current is None:
+                # Leading edge: send this one immediately and hold later ones
+                self._windows[patient_id] = {"deadline": time.monotonic() + self.window, "items": []}
+            else:
+                current["items"].append((message, message_data))
+                self._buffered += 1
+                if len(current["items"]) >= self.max_events:
+                    flush_now.append(self._pop_locked(patient_id))
+                if self._buffered > self.max_buffered:
+                    # Memory bound: flush whichever window closes soonest
+                    oldest = min(
+                        (pid for pid, entry in self._windows.items() if entry["items"]),
+                        key=lambda pid: self._windows[pid]["deadline"],
+                    )
+                    flush_now.append(self._pop_locked(oldest))
+
+        if current is None:
+            self._send_now(message, message_data)
+        for items in flush_now:
+            self._flush_executor.submit(self._flush, items)
+
+    def _pop_locked(self, patient_id):
+        items = self._windows.pop(patient_id)["items"]
+        self._buffered -= len(items)
+        return items
+
+    def _send_now(self, message, message_data):
+        self.stats["immediate"] += 1
+        try:
+            self.send_single(message_data, message.message_id)
+        except Exception as e:
+            print(f"Error processing message {message.message_id}: {e}")
+            self._settle(message, acked=False)
+            return
+        self._settle(message, acked=True)
+
+    def _flush(self, items):
+        if not items:
+            return
+        try:
+            if len(items) == 1:
+                message, message_data = items[0]
+                self.send_single(message_data, message.message_id)
+            else:
+                self.send_digest([message_data for _, message_data in items])
+                self.stats["digests"] += 1
+                self.stats["digested_events"] += len(items)
+        except Exception as e:
+            print(f"Error delivering digest of {len(items)} events: {e}")
+            for message, _ in items:
+                self._settle(message, acked=False)
+            return
+        for message, _ in items:
+            self._settle(message, acked=True)
+
+    def _settle(self, message, acked):
+        if acked:
+            message.ack()
+        else:
+            message.nack()
+        if self.on_settled is not None:
+            try:
+                self.on_settled(message, acked)
+            except Exception as e:
+                print(f"Error in digest on_settled callback: {e}")
+
+    def _flush_due(self, now):
+        with self._lock:
+            due = [pid for pid, entry in self._windows.items() if entry["deadline"] <= now]
+            batches = [self._pop_locked(pid) for pid in due]
+        events = [message_data for items in batches for _, message_data in items]
+        if events and self.prefetch is not None:
+            try:
+                self.prefetch(events)
+            except Exception as e:
+                print(f"Error prefetching for {len(batches)} digests: {e}") # Each digest looks up on its own
+        for items in batches:
+            self._flush_executor.submit(self._flush, items)
+
+    def _flush_due_loop(self):
+        while True:
+            time.sleep(min(1.0, self.window / 4))
+            self._flush_due(time.monotonic())
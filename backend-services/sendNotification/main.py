@@ -2,9 +2,18 @@ import os
 import functions_framework
 import json
 import base64
+import hashlib
 import smtplib
 import ssl
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from email.message import EmailMessage # Recommended for creating proper email messages
+from delivery_dedup import create_dedup, CLAIMED, IN_PROGRESS # Skips channels already delivered for an event
+from push import push_sender # FCM multicast to each patient's registered devices
+import templates # Precompiled, auto-escaping notification templates per event type
+from shared import patient_profiles # Cached patients/{uid} profiles from Firestore
 
 # --- Environment variables (loaded from Secret Manager) ---
 # For SMTP email sending
@@ -15,15 +24,179 @@ SMTP_USERNAME = os.environ.get("SMTP_USERNAME") # For Gmail App Password, this w
 SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD") # Your 16-digit App Password (without spaces)
 SENDER_EMAIL = os.environ.get("SENDER_EMAIL")   # This will be your desired sender email: thmina2809@gmail.com
 
-# For Firebase Admin SDK (FCM) - keep if you intend to implement FCM fully
-# The secret value is the JSON content of your service account key file
-# If you don't use FCM, this can be removed or left for future use.
-FIREBASE_ADMIN_SDK_KEY = os.environ.get("FIREBASE_ADMIN_SDK_KEY")
+# --- SMTP session reuse ---
+# A few authenticated connections are kept per instance and reused by every message,
+# instead of a new TCP + STARTTLS + LOGIN per email. Each session sends one message
+# at a time, so SMTP_POOL_SIZE is also the number of emails in flight.
+SMTP_POOL_SIZE = int(os.environ.get("SMTP_POOL_SIZE", 4)) # Sessions per instance (mind the provider's connection limit)
+SMTP_TIMEOUT = float(os.environ.get("SMTP_TIMEOUT", 30)) # Seconds for connect and each SMTP command
+SMTP_NOOP_AFTER_SECONDS = float(os.environ.get("SMTP_NOOP_AFTER_SECONDS", 30)) # Check liveness if idle longer than this
+SMTP_MAX_MESSAGES_PER_SESSION = int(os.environ.get("SMTP_MAX_MESSAGES_PER_SESSION", 100)) # Reconnect after this many (provider limits)
+
+class TrackedSmtp(smtplib.SMTP):
+    """smtplib.SMTP that remembers whether the DATA command of the current message was sent."""
+
+    data_started = False
+
+    def data(self, msg):
+        self.data_started = True
+        return super().data(msg)
+
+class SmtpSession:
+    """
+    A warm, authenticated SMTP connection that is reused across messages and invocations.
+    Idle sessions are checked with NOOP before use. A connection that drops before
+    the message's DATA command is re-established once and the message resent;
+    refusals and anything after DATA started are raised, never retried, so a
+    bad address isn't sent twice and a message can't be delivered twice.
+    """
+
+    def __init__(self):
+        self._server = None
+        self._last_used = 0.0
+        self._sent_on_session = 0
+        self._lock = threading.Lock()
+        self.stats = {"connects": 0, "sent": 0, "reconnects": 0}
+
+    def _connect(self):
+        # Create a secure SSL context for the connection
+        context = ssl.create_default_context()
+
+        # Connect to the SMTP server. For port 587, we start a TLS session.
+        # For port 465 (SMTPS), you would use smtplib.SMTP_SSL(host, port, context=context) directly.
+        server = TrackedSmtp(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        try:
+            server.starttls(context=context) # Secure the connection with TLS encryption
+            server.login(SMTP_USERNAME, SMTP_PASSWORD) # Authenticate with the SMTP server
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+        self._sent_on_session = 0
+        self._last_used = time.monotonic()
+        self.stats["connects"] += 1
+
+    def _disconnect(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                self._server.close()
+        self._server = None
+
+    def _ensure_connected(self):
+        if self._server is not None and self._sent_on_session >= SMTP_MAX_MESSAGES_PER_SESSION:
+            self._disconnect()
+        elif self._server is not None and time.monotonic() - self._last_used > SMTP_NOOP_AFTER_SECONDS:
+            try:
+                alive = self._server.noop()[0] == 250
+            except (smtplib.SMTPException, OSError):
+                alive = False
+            if not alive:
+                self.stats["reconnects"] += 1
+                self._disconnect()
+
+        if self._server is None:
+            self._connect()
+
+    def _send_locked(self, msg):
+        for attempt in (1, 2):
+            self._ensure_connected()
+            self._server.data_started = False
+            try:
+                self._server.send_message(msg)
+            except smtplib.SMTPServerDisconnected as e:
+                dropped = e
+            except smtplib.SMTPException:
+                # A refusal (recipient, sender, data) is permanent for this message; smtplib
+                # has already reset the transaction, so the session stays usable.
+                raise
+            except OSError as e:
+                dropped = e # Socket-level failure
+            else:
+                self._sent_on_session += 1
+                self._last_used = time.monotonic()
+                self.stats["sent"] += 1
+                return
+
+            # The session died underneath us (server timeout, network blip). Resend once,
+            # but only if the server never got the DATA command, so nothing goes out twice.
+            data_started = self._server.data_started
+            self._disconnect()
+            if attempt == 2 or data_started:
+                raise dropped
+            self.stats["reconnects"] += 1
+
+    def send(self, msg):
+        with self._lock:
+            self._send_locked(msg)
+
+    def send_many(self, messages):
+        """
+        Sends several messages back to back over the same session.
+        Returns a list with None for each success or the exception for each failure.
+        """
+        results = []
+        with self._lock:
+            for msg in messages:
+                try:
+                    self._send_locked(msg)
+                    results.append(None)
+                except Exception as e:
+                    results.append(e)
+        return results
+
+class SmtpSessionPool:
+    """
+    A fixed set of SmtpSessions. send() and send_many() borrow a free session and
+    wait for one if all are busy. Sessions connect lazily, on their first message.
+    """
+
+    def __init__(self, size=SMTP_POOL_SIZE):
+        self.size = size
+        self._sessions = [SmtpSession() for _ in range(size)]
+        self._free = queue.LifoQueue() # Most recently used first, so warm sessions stay busy
+        for session in self._sessions:
+            self._free.put(session)
+
+    def _borrow(self):
+        return self._free.get()
+
+    def send(self, msg):
+        session = self._borrow()
+        try:
+            session.send(msg)
+        finally:
+            self._free.put(session)
+
+    def send_many(self, messages):
+        session = self._borrow()
+        try:
+            return session.send_many(messages)
+        finally:
+            self._free.put(session)
+
+    @property
+    def stats(self):
+        totals = {"connects": 0, "sent": 0, "reconnects": 0}
+        for session in self._sessions:
+            for name in totals:
+                totals[name] += session.stats[name]
+        return totals
+
+# Module-level sessions, reused across invocations handled by this instance
+smtp_sessions = SmtpSessionPool()
+
+# Evicts cached profiles on every instance as soon as they change in Firestore
+if patient_profiles.PROFILE_CACHE_LISTENER:
+    try:
+        patient_profiles.start_invalidation_listener()
+    except Exception as e:
+        print(f"Could not start the profile invalidation listener; relying on the cache TTL: {e}")
 
 # --- Helper functions for sending notifications ---
 
-def send_email(recipient_email, subject, message_body_html): # Changed to accept HTML body
-    """Sends an email using an SMTP server."""
+def smtp_configured():
     # Ensure all necessary SMTP credentials and sender email are configured
     if not all([SMTP_HOST, SMTP_USERNAME, SMTP_PASSWORD, SENDER_EMAIL]):
         print("SMTP server details or sender email not fully configured (check environment variables). Skipping email.")
@@ -33,175 +206,316 @@ def send_email(recipient_email, subject, message_body_html): # Changed to accept
         if not SMTP_PASSWORD: print("  SMTP_PASSWORD is missing.")
         if not SENDER_EMAIL: print("  SENDER_EMAIL is missing.")
         return False
+    return True
 
+def build_email_message(recipient_email, subject, message_body_html, message_body_text=None):
     # Create the email message using EmailMessage for better email structure
     msg = EmailMessage()
     msg['Subject'] = subject
     msg['From'] = SENDER_EMAIL
     msg['To'] = recipient_email
-    msg.set_content(message_body_html, subtype='html') # Set content as HTML
-
-    try:
-        # Create a secure SSL context for the connection
-        context = ssl.create_default_context()
+    if message_body_text:
+        # multipart/alternative: clients that can't show HTML use the plain-text part
+        msg.set_content(message_body_text)
+        msg.add_alternative(message_body_html, subtype='html')
+    else:
+        msg.set_content(message_body_html, subtype='html') # Set content as HTML
+    return msg
 
-        # Connect to the SMTP server. For port 587, we start a TLS session.
-        # For port 465 (SMTPS), you would use smtplib.SMTP_SSL(host, port, context=context) directly.
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-            server.starttls(context=context) # Secure the connection with TLS encryption
-            server.login(SMTP_USERNAME, SMTP_PASSWORD) # Authenticate with the SMTP server
-            server.send_message(msg) # Send the constructed email message
-            print(f"Email sent successfully to {recipient_email} from {SENDER_EMAIL}.")
-            return True
-    except smtplib.SMTPAuthenticationError as e:
+def log_email_error(recipient_email, e):
+    if isinstance(e, smtplib.SMTPAuthenticationError):
         print(f"SMTP Authentication Error: Check SMTP_USERNAME and SMTP_PASSWORD. Details: {e}")
         # This typically means the username/password (App Password) is incorrect or not allowed.
-        return False
-    except smtplib.SMTPConnectError as e:
+    elif isinstance(e, smtplib.SMTPConnectError):
         print(f"SMTP Connection Error: Could not connect to {SMTP_HOST}:{SMTP_PORT}. Details: {e}")
         # This could mean incorrect host/port, network issues, or server not running.
-        return False
-    except smtplib.SMTPRecipientsRefused as e:
+    elif isinstance(e, smtplib.SMTPRecipientsRefused):
         print(f"SMTP Recipient Refused Error: One or more recipients were refused by the server. Details: {e.recipients}")
         # This usually means the recipient email address is invalid or blocked by the server.
+    else:
+        print(f"An unexpected error occurred while sending email via SMTP to {recipient_email}: {e}")
+
+def send_email(recipient_email, subject, message_body_html, message_body_text=None): # Changed to accept HTML body
+    """Sends an email over one of the pooled SMTP sessions."""
+    if not smtp_configured():
         return False
+
+    msg = build_email_message(recipient_email, subject, message_body_html, message_body_text)
+    try:
+        smtp_sessions.send(msg) # Send the constructed email message over a pooled session
+        print(f"Email sent successfully to {recipient_email} from {SENDER_EMAIL}.")
+        return True
     except Exception as e:
-        print(f"An unexpected error occurred while sending email via SMTP: {e}")
+        log_email_error(recipient_email, e)
         return False
 
-def send_fcm_push_notification(recipient_token_or_topic, title, body, notification_type):
+def send_emails(emails):
+    """
+    Sends a queue of (recipient_email, subject, message_body_html[, message_body_text]) over one SMTP session.
+    Returns a list of booleans in the same order.
+    """
+    if not smtp_configured():
+        return [False] * len(emails)
+
+    messages = [build_email_message(*email) for email in emails]
+    results = []
+    for email, error in zip(emails, smtp_sessions.send_many(messages)):
+        recipient_email = email[0]
+        if error is None:
+            results.append(True)
+        else:
+            log_email_error(recipient_email, error)
+            results.append(False)
+    print(f"Sent {sum(results)} of {len(emails)} queued emails over one SMTP session.")
+    return results
+
+# --- Concurrent channel delivery ---
+# Each channel's timeout runs from when its send starts, not from when it was queued,
+# so a busy instance can't time out sends that never got a chance to run.
+CHANNEL_TIMEOUTS = {
+    "email": float(os.environ.get("EMAIL_CHANNEL_TIMEOUT", 20)), # Seconds
+    "push": float(os.environ.get("PUSH_CHANNEL_TIMEOUT", 10)),
+}
+# A send still queued after this long is cancelled (it never goes out) and retried on redelivery
+CHANNEL_QUEUE_TIMEOUT = float(os.environ.get("CHANNEL_QUEUE_TIMEOUT", 60))
+
+# Shared across invocations; channels for one event run side by side. Email has its own
+# pool, one worker per SMTP session, so emails queue here rather than inside a session.
+channel_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("CHANNEL_WORKERS", 8)), thread_name_prefix="channel")
+channel_executors = {
+    "email": ThreadPoolExecutor(max_workers=SMTP_POOL_SIZE, thread_name_prefix="email"),
+}
+
+# (event id, channel) pairs already delivered: in-memory TTL cache in front of a durable
+# store, so Pub/Sub redeliveries and partial-failure retries never send a channel twice.
+delivery_dedup = create_dedup()
+
+def deliver_channels(event_key, channels):
+    """
+    Runs every channel's send function concurrently, each with its own timeout,
+    counted from when the send starts. A send that is still queued after
+    CHANNEL_QUEUE_TIMEOUT is cancelled, so it can't go out after being reported.
+    `channels` maps a channel name to a zero-argument callable returning True on success.
+    Each channel is claimed in the dedup store first, so concurrent duplicates of an
+    event can't both send it; a channel another worker is still sending reports
+    in_progress and is retried on redelivery. `event_key` is the dedup key for every
+    channel, or a dict mapping a channel to a list of keys that are claimed and
+    settled together (a digest push covers several events).
+    Returns a delivery report: {channel: {"status": sent|failed|timeout|skipped|in_progress, "ms": elapsed}}.
+    """
+    report = {}
+    futures = {}
+    submitted_at = time.monotonic()
+    began = {} # channel -> monotonic time its send started
+
+    def settle_claim(future, channel, keys):
+        # Runs even when the channel finishes after its timeout, so a late success still
+        # counts; a late failure or a cancelled send frees the channel for the redelivery
+        delivered = not future.cancelled() and future.exception() is None and future.result()
+        for key in keys:
+            if delivered:
+                delivery_dedup.mark_delivered(key, channel)
+            else:
+                delivery_dedup.release(key, channel)
+
+    def run(channel, send, started):
+        began[channel] = time.monotonic()
+        started.set()
+        return send()
+
+    for channel, send in channels.items():
+        if isinstance(event_key, dict):
+            keys = event_key.get(channel) or []
+        else:
+            keys = [event_key] if event_key is not None else []
+        claims = {key: delivery_dedup.claim(key, channel) for key in keys}
+        held = [key for key, claim in claims.items() if claim == CLAIMED]
+        if keys and (not held or IN_PROGRESS in claims.values()):
+            # Nothing left to send, or part of it is being sent elsewhere: leave it to that worker
+            for key in held:
+                delivery_dedup.release(key, channel)
+            status = "in_progress" if IN_PROGRESS in claims.values() else "skipped"
+            report[channel] = {"status": status, "ms": 0}
+            continue
+        started = threading.Event()
+        future = channel_executors.get(channel, channel_executor).submit(run, channel, send, started)
+        if held:
+            future.add_done_callback(lambda f, channel=channel, held=held: settle_claim(f, channel, held))
+        futures[channel] = (future, started)
+
+    for channel, (future, started) in futures.items():
+        queue_remaining = submitted_at + CHANNEL_QUEUE_TIMEOUT - time.monotonic()
+        if not started.wait(max(queue_remaining, 0)) and future.cancel():
+            print(f"{channel} send was still queued after {CHANNEL_QUEUE_TIMEOUT}s; cancelled.")
+            status = "timeout"
+        else:
+            started.wait() # Lost the race with cancel(): the send has just begun
+            remaining = began[channel] + CHANNEL_TIMEOUTS.get(channel, 20) - time.monotonic()
+            try:
+                status = "sent" if future.result(timeout=max(remaining, 0)) else "failed"
+            except FutureTimeoutError:
+                status = "timeout"
+            except Exception as e:
+                print(f"Error delivering {channel} notification: {e}")
+                status = "failed"
+        report[channel] = {"status": status, "ms": round((time.monotonic() - submitted_at) * 1000)}
+
+    return report
+
+def lookup_profile(patient_id):
+    """The patient's cached Firestore profile, or {} if there is none or the lookup fails."""
+    try:
+        return patient_profiles.get_profile(patient_id) or {}
+    except Exception as e:
+        # The event still carries the email, so notify without the profile rather than fail
+        print(f"Could not load profile for patient {patient_id}: {e}")
+        return {}
+
+def prefetch_profiles(events):
+    """Loads the profiles of many events' patients into the cache with batched reads."""
+    try:
+        patient_profiles.get_profiles(message_data.get('patientId') for message_data in events)
+    except Exception as e:
+        print(f"Could not prefetch profiles for {len(events)} events: {e}") # lookup_profile retries one by one
+
+def handle_notification_event(message_data, message_id=None):
     """
-    Sends a push notification via Firebase Cloud Messaging (FCM).
-    NOTE: This is still a conceptual placeholder. To make this functional,
-    you would need to initialize the Firebase Admin SDK and use its messaging module.
+    Renders and delivers the notifications for one appointment event. Shared by the
+    push-triggered Cloud Function and the streaming pull consumer (consumer.py).
+    Returns the delivery report, or None for unhandled event types.
+    Raises RuntimeError if any channel failed, so the message is redelivered.
     """
-    # To implement actual FCM, you'd integrate the firebase_admin SDK here.
-    # The FIREBASE_ADMIN_SDK_KEY would be used to initialize the SDK.
-    # Example (uncomment and properly implement if you add firebase-admin):
-    # import firebase_admin
-    # from firebase_admin import credentials, messaging
-    #
-    # if FIREBASE_ADMIN_SDK_KEY and not firebase_admin._apps: # Check if app is not already initialized
-    #     try:
-    #         cred = credentials.Certificate(json.loads(FIREBASE_ADMIN_SDK_KEY))
-    #         firebase_admin.initialize_app(cred)
-    #         print("Firebase Admin SDK initialized for FCM.")
-    #     except Exception as e:
-    #         print(f"Error initializing Firebase Admin SDK: {e}")
-    #         return False
-    #
-    # try:
-    #     message = messaging.Message(
-    #         notification=messaging.Notification(title=title, body=body),
-    #         token=recipient_token_or_topic, # Or use topic= if sending to a topic
-    #         data={"type": notification_type} # Optional data payload
-    #     )
-    #     response = Messaging(message)
-    #     print(f"FCM message sent successfully. Response: {response}")
-    #     return True
-    # except Exception as e:
-    #     print(f"Error sending FCM notification: {e}")
-    #     return False
-
-    print(f"--- FCM Push Notification (Conceptual) ---")
-    print(f"Attempting to send FCM push notification:")
-    print(f"   Target: {recipient_token_or_topic}")
-    print(f"   Title: {title}")
-    print(f"   Body: {body}")
-    print(f"   Type: {notification_type}")
-    print("   To implement this, you would use firebase_admin.Messaging() or similar.")
-    print("   Remember: This requires a client-side app (mobile or web) with FCM integration.")
-    print("   For actual SMS/WhatsApp to a phone number, you still need a service like Twilio or Vonage.")
-    print(f"------------------------------------------")
-    return True # Return True for conceptual success
+    event_type = message_data.get('eventType')
+    appointment_id = message_data.get('appointmentId')
+    patient_id = message_data.get('patientId')
+    patient_email = message_data.get('patientEmail')
+
+    print(f"Received event: {event_type} for Appointment ID: {appointment_id}")
+
+    if event_type == "patientProfileUpdated":
+        # Published by create_patient_profile; the next lookup re-reads Firestore
+        patient_profiles.invalidate(patient_id)
+        return None
+
+    if not templates.has_template(event_type):
+        print(f"Unhandled event type: {event_type}. No notification sent.")
+        return None # Exit if event type is not handled
+
+    # Contact details come from the patient's profile, not from the client request
+    profile = lookup_profile(patient_id)
+    patient_email = patient_email or profile.get('email')
+    print(f"Patient Email: {patient_email}")
 
+    # --- Render subject, email and push bodies from the precompiled templates ---
+    rendered = templates.render(dict(message_data, firstName=profile.get('firstName')))
+
+    # --- Deliver all channels concurrently ---
+    # eventId comes from the outbox; Pub/Sub's messageId is stable across redeliveries too
+    event_key = message_data.get('eventId') or message_id
+    return deliver_rendered(event_key, event_type, patient_id, patient_email, rendered)
+
+def deliver_rendered(event_key, event_type, patient_id, patient_email, rendered):
+    """Sends a rendered notification by email and push. Raises RuntimeError if any channel failed."""
+    channels = {}
+
+    # Email Notification (via SMTP)
+    if patient_email and rendered.subject and rendered.html and smtp_configured():
+        channels["email"] = lambda: send_email(patient_email, rendered.subject, rendered.html, rendered.text)
+    else:
+        print("Skipping email: Missing recipient email, message content or SMTP configuration.")
+
+    # FCM Push Notification (multicast to the patient's registered devices)
+    if patient_id and rendered.push_title and rendered.push_body:
+        channels["push"] = lambda: push_sender.send_to_patient(patient_id, rendered.push_title, rendered.push_body, event_type)
+    else:
+        print("Skipping FCM push notification: Missing patient ID or message content.")
+
+    return deliver_and_report(event_key, event_type, channels)
+
+def deliver_and_report(event_key, event_type, channels):
+    """deliver_channels() plus logging. Raises RuntimeError if any channel failed."""
+    report = deliver_channels(event_key, channels)
+    print(f"Delivery report for {event_type} (event {event_key}): {json.dumps(report)}")
+
+    failed_channels = [channel for channel, result in report.items()
+                       if result["status"] in ("failed", "timeout", "in_progress")]
+    if failed_channels:
+        # Pub/Sub will redeliver; channels that already succeeded are skipped next time
+        raise RuntimeError(f"Notification channels failed: {', '.join(failed_channels)}")
+    return report
+
+def handle_digest_events(events):
+    """
+    Sends one combined email and push for several events of the same patient
+    (digest mode of the streaming consumer, see digest.py). Each channel covers only
+    the events it hasn't delivered yet. The email is claimed under a key for its set
+    of events and, once sent, recorded as delivered for each of them before any other
+    channel can fail; the push is claimed per event. So a redelivery, as a digest of
+    any make-up or on its own through handle_notification_event, repeats no channel.
+    Raises RuntimeError if any channel failed.
+    """
+    def pending(channel):
+        return [message_data for message_data in events
+                if not (message_data.get('eventId') and delivery_dedup.is_delivered(message_data['eventId'], channel))]
+
+    email_events = pending("email")
+    push_events = pending("push")
+    if not email_events and not push_events:
+        return None
+
+    latest = events[-1]
+    patient_id = latest.get('patientId')
+    profile = lookup_profile(patient_id)
+    patient_email = latest.get('patientEmail') or profile.get('email')
+    first_name = profile.get('firstName')
+
+    channels = {}
+    event_keys = {}
+
+    email = templates.render_digest(email_events, first_name=first_name) if email_events else None
+    if email is not None and patient_email and email.subject and email.html and smtp_configured():
+        email_event_ids = [message_data['eventId'] for message_data in email_events if message_data.get('eventId')]
+
+        def send_digest_email():
+            sent = send_email(patient_email, email.subject, email.html, email.text)
+            if sent:
+                for event_id in email_event_ids:
+                    delivery_dedup.mark_delivered(event_id, "email")
+            return sent
+
+        channels["email"] = send_digest_email
+        digest_ids = sorted(str(message_data.get('eventId')) for message_data in email_events)
+        event_keys["email"] = ["digest:" + hashlib.sha256(",".join(digest_ids).encode("utf-8")).hexdigest()]
+    else:
+        print("Skipping digest email: Nothing pending, missing recipient email or SMTP configuration.")
+
+    push = email if push_events == email_events else (
+        templates.render_digest(push_events, first_name=first_name) if push_events else None)
+    if push is not None and patient_id and push.push_title and push.push_body:
+        channels["push"] = lambda: push_sender.send_to_patient(patient_id, push.push_title, push.push_body, "appointmentDigest")
+        event_keys["push"] = [message_data['eventId'] for message_data in push_events if message_data.get('eventId')]
+    else:
+        print("Skipping digest push: Nothing pending or missing patient ID.")
+
+    if not channels:
+        return None
+    return deliver_and_report(event_keys, "appointmentDigest", channels)
 
 @functions_framework.cloud_event
 def send_appointment_notification(cloud_event):
     """
     Cloud Function that processes Pub/Sub messages to send various appointment notifications.
     Triggered by messages on the 'appointment-events' topic.
-    Uses SMTP for emails and conceptually handles FCM for push notifications.
+    Uses SMTP for emails and FCM multicast for push notifications.
+    Channels are delivered concurrently; if any fail the message is retried, and
+    channels that already succeeded for this event are not sent again.
     """
     try:
         if cloud_event.data and 'message' in cloud_event.data:
             pubsub_message = cloud_event.data['message']
             data_bytes = base64.b64decode(pubsub_message['data'])
             message_data = json.loads(data_bytes.decode('utf-8'))
-
-            event_type = message_data.get('eventType')
-            appointment_id = message_data.get('appointmentId')
-            patient_id = message_data.get('patientId')
-            patient_email = message_data.get('patientEmail')
-            patient_phone = message_data.get('patientPhone')
-            appointment_date = message_data.get('appointmentDate')
-            appointment_time = message_data.get('appointmentTime')
-            service_type = message_data.get('serviceType')
-            notes = message_data.get('notes', '')
-
-            print(f"Received event: {event_type} for Appointment ID: {appointment_id}")
-            print(f"Patient Email: {patient_email}, Patient Phone (for FCM concept): {patient_phone}")
-
-            subject = ""
-            email_body_html = "" # Changed variable name and content for HTML
-            fcm_title = ""
-            fcm_body = ""
-
-            # --- Construct messages based on event type ---
-            if event_type == "appointmentBooked":
-                subject = f"Appointment Confirmed: {service_type} on {appointment_date} at {appointment_time}"
-                email_body_html = (
-                    f"Dear Patient,<br><br>" # Use <br> for line breaks in HTML email
-                    f"Your appointment for <b>{service_type}</b> is confirmed.<br>"
-                    f"<b>Date:</b> {appointment_date}<br>"
-                    f"<b>Time:</b> {appointment_time}<br>"
-                    f"<b>Appointment ID:</b> {appointment_id}<br>"
-                    f"<b>Notes:</b> {notes}<br><br>"
-                    f"Thank you for choosing our clinic!"
-                )
-                fcm_title = "Appointment Confirmed!"
-                fcm_body = f"Your {service_type} appt is confirmed for {appointment_date} at {appointment_time}. ID: {appointment_id}."
-            elif event_type == "appointmentCancelled":
-                subject = f"Appointment Cancelled: {service_type} on {appointment_date} at {appointment_time}"
-                email_body_html = (
-                    f"Dear Patient,<br><br>"
-                    f"Your appointment for <b>{service_type}</b> on {appointment_date} at {appointment_time} "
-                    f"has been successfully cancelled.<br>"
-                    f"<b>Appointment ID:</b> {appointment_id}<br><br>"
-                    f"If you wish to reschedule, please visit our booking page."
-                )
-                fcm_title = "Appointment Cancelled"
-                fcm_body = f"Your {service_type} appt on {appointment_date} at {appointment_time} has been cancelled. ID: {appointment_id}."
-            elif event_type == "appointmentReminder":
-                subject = f"Reminder: Your Upcoming Appointment for {service_type}"
-                email_body_html = (
-                    f"Dear Patient,<br><br>"
-                    f"This is a friendly reminder for your upcoming appointment:<br>"
-                    f"<b>Service:</b> {service_type}<br>"
-                    f"<b>Date:</b> {appointment_date}<br>"
-                    f"<b>Time:</b> {appointment_time}<br>"
-                    f"<b>Appointment ID:</b> {appointment_id}<br><br>"
-                    f"Please arrive on time. If you need to reschedule, please do so via the portal."
-                )
-                fcm_title = "Appointment Reminder!"
-                fcm_body = f"Reminder: Your {service_type} appt is on {appointment_date} at {appointment_time}. ID: {appointment_id}."
-            else:
-                print(f"Unhandled event type: {event_type}. No notification sent.")
-                return # Exit if event type is not handled
-
-            # --- Send Email Notification (via SMTP) ---
-            if patient_email and subject and email_body_html:
-                send_email(patient_email, subject, email_body_html)
-            else:
-                print("Skipping email: Missing recipient email or message content.")
-
-            # --- Send FCM Push Notification (conceptual) ---
-            if patient_phone and fcm_title and fcm_body:
-                fcm_target = f"user_{patient_id}" if patient_id else "general_topic"
-                send_fcm_push_notification(fcm_target, fcm_title, fcm_body, event_type)
-            else:
-                print("Skipping FCM push notification: Missing patient phone (for conceptual target) or message content.")
-
+            handle_notification_event(message_data, pubsub_message.get('messageId') or pubsub_message.get('message_id'))
         else:
             print("No message data found in Pub/Sub event.")
 
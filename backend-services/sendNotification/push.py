@@ -0,0 +1,137 @@
+# your-healthcare-platform/backend-services/sendNotification/push.py
+
+import os
+import json
+import time
+import firebase_admin
+from firebase_admin import credentials, messaging
+from shared import device_tokens # Per-patient FCM registration tokens in Firestore
+
+# The secret value is the JSON content of your service account key file.
+# Without it the default service account of the function is used.
+FIREBASE_ADMIN_SDK_KEY = os.environ.get("FIREBASE_ADMIN_SDK_KEY")
+
+# FCM accepts at most 500 tokens per multicast call
+FCM_MAX_TOKENS_PER_CALL = int(os.environ.get("FCM_MAX_TOKENS_PER_CALL", 500))
+
+# Errors meaning the token will never work again; anything else is worth retrying
+INVALID_TOKEN_ERRORS = (messaging.UnregisteredError, messaging.SenderIdMismatchError)
+
+# Devices that fail with a retryable error are retried here, only those tokens, this
+# many times. Redelivering the message instead would push again to every device.
+PUSH_RETRY_ATTEMPTS = int(os.environ.get("PUSH_RETRY_ATTEMPTS", 2))
+PUSH_RETRY_BACKOFF_SECONDS = float(os.environ.get("PUSH_RETRY_BACKOFF_SECONDS", 0.5)) # Doubles per attempt
+
+
+def init_firebase():
+    if firebase_admin._apps:
+        return
+    try:
+        if FIREBASE_ADMIN_SDK_KEY:
+            firebase_admin.initialize_app(credentials.Certificate(json.loads(FIREBASE_ADMIN_SDK_KEY)))
+        else:
+            firebase_admin.initialize_app()
+        print("Firebase Admin SDK initialized for FCM.")
+    except Exception as e:
+        print(f"Error initializing Firebase Admin SDK: {e}")
+
+
+init_firebase()
+
+
+class PushSender:
+    """
+    Sends one notification to all of a patient's devices with as few FCM calls as
+    possible and prunes tokens FCM rejects as invalid. `backend` is anything with
+    firebase_admin.messaging's send_each_for_multicast/MulticastMessage/Notification,
+    so a local fake can stand in for FCM.
+    """
+
+    def __init__(self, backend=messaging, token_registry=device_tokens):
+        self.backend = backend
+        self.token_registry = token_registry
+        self.stats = {"calls": 0, "sent": 0, "failed": 0, "retried": 0, "pruned": 0, "seconds": 0.0}
+
+    def build_message(self, tokens, title, body, notification_type):
+        return self.backend.MulticastMessage(
+            tokens=tokens,
+            notification=self.backend.Notification(title=title, body=body),
+            data={"type": notification_type or ""},
+        )
+
+    def send_to_tokens(self, tokens, title, body, notification_type):
+        """Returns (sent, invalid_tokens, retryable_tokens)."""
+        sent = 0
+        invalid_tokens = []
+        retryable_tokens = []
+        for start in range(0, len(tokens), FCM_MAX_TOKENS_PER_CALL):
+            chunk = tokens[start:start + FCM_MAX_TOKENS_PER_CALL]
+            self.stats["calls"] += 1
+            try:
+                response = self.backend.send_each_for_multicast(self.build_message(chunk, title, body, notification_type))
+            except Exception as e:
+                # The whole call failed (network, quota): every device in it is retryable
+                print(f"FCM multicast call failed for {len(chunk)} devices: {e}")
+                retryable_tokens.extend(chunk)
+                continue
+            sent += response.success_count
+            for token, result in zip(chunk, response.responses):
+                if result.success:
+                    continue
+                if isinstance(result.exception, INVALID_TOKEN_ERRORS):
+                    invalid_tokens.append(token)
+                else:
+                    retryable_tokens.append(token)
+                    print(f"FCM send failed for a device: {result.exception}")
+        return (sent, invalid_tokens, retryable_tokens)
+
+    def send_to_patient(self, patient_id, title, body, notification_type):
+        """
+        Pushes to every registered device of the patient. Devices failing with a
+        retryable error are retried (only those) up to PUSH_RETRY_ATTEMPTS times;
+        invalid tokens are pruned. Returns False only if no device got the push and
+        some are still failing. Once any device has it, a redelivery would push again
+        to that device, so devices that still fail are logged instead.
+        """
+        tokens = self.token_registry.get_tokens(patient_id)
+        if not tokens:
+            print(f"No registered devices for patient {patient_id}; push skipped.")
+            return True
+
+        started = time.monotonic()
+        sent, invalid_tokens, pending = self.send_to_tokens(tokens, title, body, notification_type)
+        for attempt in range(PUSH_RETRY_ATTEMPTS):
+            if not pending:
+                break
+            time.sleep(PUSH_RETRY_BACKOFF_SECONDS * 2 ** attempt)
+            self.stats["retried"] += len(pending)
+            retry_sent, retry_invalid, pending = self.send_to_tokens(pending, title, body, notification_type)
+            sent += retry_sent
+            invalid_tokens += retry_invalid
+        elapsed = time.monotonic() - started
+
+        self.stats["sent"] += sent
+        self.stats["failed"] += len(pending)
+        self.stats["seconds"] += elapsed
+        if invalid_tokens:
+            try:
+                self.stats["pruned"] += self.token_registry.remove_tokens(patient_id, invalid_tokens)
+            except Exception as e:
+                print(f"Could not prune invalid FCM tokens for patient {patient_id}: {e}")
+        if pending:
+            print(f"FCM push to patient {patient_id} still failing for {len(pending)} device(s) after "
+                  f"{PUSH_RETRY_ATTEMPTS} retries ({', '.join(token[-8:] for token in pending)}); "
+                  f"{'giving up on them' if sent else 'the message will be redelivered'}.")
+
+        rate = sent / elapsed if elapsed > 0 else 0
+        print(f"FCM push to patient {patient_id}: {sent} of {len(tokens)} devices in {elapsed * 1000:.0f} ms "
+              f"({rate:.0f} msg/s), {len(invalid_tokens)} invalid tokens pruned.")
+        return sent > 0 or not pending
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats["messages_per_second"] = round(stats["sent"] / stats["seconds"], 1) if stats["seconds"] else 0
+        return stats
+
+
+push_sender = PushSender()
@@ -0,0 +1,172 @@
+# your-healthcare-platform/backend-services/sendNotification/templates.py
+
+from collections import namedtuple
+from jinja2 import Environment
+
+# Every notification has these parts; each one is a template string.
+NOTIFICATION_PARTS = ("subject", "html", "text", "push_title", "push_body")
+
+RenderedNotification = namedtuple("RenderedNotification", NOTIFICATION_PARTS)
+
+# HTML parts escape every interpolated value; the plain-text parts (subject, text, push) don't.
+# Missing fields render as empty strings, like the old .get() lookups did.
+_html_env = Environment(autoescape=True)
+_text_env = Environment(autoescape=False)
+
+# One summary line per event, shared by the digest's HTML and text bodies
+_DIGEST_LINE = (
+    "{% if e.eventType == 'appointmentBooked' %}Booked: {{ e.serviceType }} on {{ e.appointmentDate }} at {{ e.appointmentTime }} (ID: {{ e.appointmentId }})"
+    "{% elif e.eventType == 'appointmentCancelled' %}Cancelled: {{ e.serviceType }} on {{ e.appointmentDate }} at {{ e.appointmentTime }} (ID: {{ e.appointmentId }})"
+    "{% elif e.eventType == 'appointmentSeriesBooked' %}Booked: {{ e.appointments|length }} {{ e.serviceType }} appointments from {{ (e.appointments|first or {}).appointmentDate }}"
+    "{% elif e.eventType == 'appointmentReminder' %}Reminder: {{ e.serviceType }} on {{ e.appointmentDate }} at {{ e.appointmentTime }} (ID: {{ e.appointmentId }})"
+    "{% endif %}"
+)
+
+# Template sources per event type. Templates see the event's fields by name
+# (serviceType, appointmentDate, ...) plus the patient's firstName from their
+# profile; the digest sees `events`, a list of events.
+TEMPLATE_SOURCES = {
+    "appointmentBooked": {
+        "subject": "Appointment Confirmed: {{ serviceType }} on {{ appointmentDate }} at {{ appointmentTime }}",
+        "html": (
+            "Dear {{ firstName or 'Patient' }},<br><br>"
+            "Your appointment for <b>{{ serviceType }}</b> is confirmed.<br>"
+            "<b>Date:</b> {{ appointmentDate }}<br>"
+            "<b>Time:</b> {{ appointmentTime }}<br>"
+            "<b>Appointment ID:</b> {{ appointmentId }}<br>"
+            "<b>Notes:</b> {{ notes }}<br><br>"
+            "Thank you for choosing our clinic!"
+        ),
+        "text": (
+            "Dear {{ firstName or 'Patient' }},\n\n"
+            "Your appointment for {{ serviceType }} is confirmed.\n"
+            "Date: {{ appointmentDate }}\n"
+            "Time: {{ appointmentTime }}\n"
+            "Appointment ID: {{ appointmentId }}\n"
+            "Notes: {{ notes }}\n\n"
+            "Thank you for choosing our clinic!"
+        ),
+        "push_title": "Appointment Confirmed!",
+        "push_body": "Your {{ serviceType }} appt is confirmed for {{ appointmentDate }} at {{ appointmentTime }}. ID: {{ appointmentId }}.",
+    },
+    "appointmentCancelled": {
+        "subject": "Appointment Cancelled: {{ serviceType }} on {{ appointmentDate }} at {{ appointmentTime }}",
+        "html": (
+            "Dear {{ firstName or 'Patient' }},<br><br>"
+            "Your appointment for <b>{{ serviceType }}</b> on {{ appointmentDate }} at {{ appointmentTime }} "
+            "has been successfully cancelled.<br>"
+            "<b>Appointment ID:</b> {{ appointmentId }}<br><br>"
+            "If you wish to reschedule, please visit our booking page."
+        ),
+        "text": (
+            "Dear {{ firstName or 'Patient' }},\n\n"
+            "Your appointment for {{ serviceType }} on {{ appointmentDate }} at {{ appointmentTime }} "
+            "has been successfully cancelled.\n"
+            "Appointment ID: {{ appointmentId }}\n\n"
+            "If you wish to reschedule, please visit our booking page."
+        ),
+        "push_title": "Appointment Cancelled",
+        "push_body": "Your {{ serviceType }} appt on {{ appointmentDate }} at {{ appointmentTime }} has been cancelled. ID: {{ appointmentId }}.",
+    },
+    "appointmentSeriesBooked": {
+        "subject": "{{ appointments|length }} Appointments Confirmed: {{ serviceType }} from {{ (appointments|first or {}).appointmentDate }}",
+        "html": (
+            "Dear {{ firstName or 'Patient' }},<br><br>"
+            "Your course of <b>{{ appointments|length }}</b> appointments for <b>{{ serviceType }}</b> is confirmed:<br>"
+            "{% for item in appointments %}{{ item.appointmentDate }} at {{ item.appointmentTime }} (ID: {{ item.appointmentId }})<br>{% endfor %}<br>"
+            "<b>Notes:</b> {{ notes }}<br><br>"
+            "Thank you for choosing our clinic!"
+        ),
+        "text": (
+            "Dear {{ firstName or 'Patient' }},\n\n"
+            "Your course of {{ appointments|length }} appointments for {{ serviceType }} is confirmed:\n"
+            "{% for item in appointments %}{{ item.appointmentDate }} at {{ item.appointmentTime }} (ID: {{ item.appointmentId }})\n{% endfor %}\n"
+            "Notes: {{ notes }}\n\n"
+            "Thank you for choosing our clinic!"
+        ),
+        "push_title": "Appointments Confirmed!",
+        "push_body": "{{ appointments|length }} {{ serviceType }} appts confirmed, starting {{ (appointments|first or {}).appointmentDate }} at {{ (appointments|first or {}).appointmentTime }}.",
+    },
+    "appointmentReminder": {
+        "subject": "Reminder: Your Upcoming Appointment for {{ serviceType }}",
+        "html": (
+            "Dear {{ firstName or 'Patient' }},<br><br>"
+            "This is a friendly reminder for your upcoming appointment:<br>"
+            "<b>Service:</b> {{ serviceType }}<br>"
+            "<b>Date:</b> {{ appointmentDate }}<br>"
+            "<b>Time:</b> {{ appointmentTime }}<br>"
+            "<b>Appointment ID:</b> {{ appointmentId }}<br><br>"
+            "Please arrive on time. If you need to reschedule, please do so via the portal."
+        ),
+        "text": (
+            "Dear {{ firstName or 'Patient' }},\n\n"
+            "This is a friendly reminder for your upcoming appointment:\n"
+            "Service: {{ serviceType }}\n"
+            "Date: {{ appointmentDate }}\n"
+            "Time: {{ appointmentTime }}\n"
+            "Appointment ID: {{ appointmentId }}\n\n"
+            "Please arrive on time. If you need to reschedule, please do so via the portal."
+        ),
+        "push_title": "Appointment Reminder!",
+        "push_body": "Reminder: Your {{ serviceType }} appt is on {{ appointmentDate }} at {{ appointmentTime }}. ID: {{ appointmentId }}.",
+    },
+    "appointmentDigest": {
+        "subject": "{{ events|length }} Updates to Your Appointments",
+        "html": (
+            "Dear {{ firstName or 'Patient' }},<br><br>"
+            "There have been several changes to your appointments:<br>"
+            "{% for e in events %}" + _DIGEST_LINE + "<br>{% endfor %}<br>"
+            "You can review all your appointments in the portal."
+        ),
+        "text": (
+            "Dear {{ firstName or 'Patient' }},\n\n"
+            "There have been several changes to your appointments:\n"
+            "{% for e in events %}" + _DIGEST_LINE + "\n{% endfor %}\n"
+            "You can review all your appointments in the portal."
+        ),
+        "push_title": "Appointment Updates",
+        "push_body": "{{ events|length }} changes to your appointments. Check your email for details.",
+    },
+}
+
+# Event types the digest knows how to summarise
+DIGESTIBLE_EVENT_TYPES = {"appointmentBooked", "appointmentCancelled", "appointmentSeriesBooked", "appointmentReminder"}
+
+# event_type -> {part: compiled jinja2 Template}, filled once at import
+_registry = {}
+
+
+def register_template(event_type, sources):
+    """Compiles all parts of one notification type. New event types only need an entry here."""
+    missing = [part for part in NOTIFICATION_PARTS if part not in sources]
+    if missing:
+        raise ValueError(f"Template for '{event_type}' is missing parts: {', '.join(missing)}")
+    _registry[event_type] = {
+        part: (_html_env if part == "html" else _text_env).from_string(sources[part])
+        for part in NOTIFICATION_PARTS
+    }
+
+
+for _event_type, _sources in TEMPLATE_SOURCES.items():
+    register_template(_event_type, _sources)
+
+
+def has_template(event_type):
+    return event_type in _registry
+
+
+def render(message_data, event_type=None):
+    """Renders one event's notification. Returns a RenderedNotification, or None for unknown event types."""
+    compiled = _registry.get(event_type or message_data.get("eventType"))
+    if compiled is None:
+        return None
+    context = {"notes": "", "appointments": [], **message_data}
+    return RenderedNotification(*(compiled[part].render(context) for part in NOTIFICATION_PARTS))
+
+
+def render_digest(events, first_name=None):
+    """Renders one combined notification for several events of the same patient."""
+    events = [message_data for message_data in events if message_data.get("eventType") in DIGESTIBLE_EVENT_TYPES]
+    if not events:
+        return None
+    return render({"events": events, "firstName": first_name}, event_type="appointmentDigest")
@@ -0,0 +1,6 @@
+# your-healthcare-platform/backend-services/shared/__init__.py
+#
+# Code shared by the Python Cloud Functions (bookAppointment, cancel_appointment,
+# get_appointments, getAvailableAppointments, ...).
+# Cloud Functions only uploads the function's own source directory, so copy this
+# package next to main.py before deploying (see shared/README.md).
@@ -0,0 +1,213 @@
+import os
+import time
+import threading
+from collections import deque
+import psycopg2
+from psycopg2 import extensions
+
+# Database connection details from environment variables
+DB_USER = os.environ.get("DB_USER")
+DB_PASSWORD = os.environ.get("DB_PASSWORD")
+DB_HOST = os.environ.get("DB_HOST")
+DB_NAME = os.environ.get("DB_NAME")
+
+# --- Pool tuning (per function instance) ---
+DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", 5)) # Hard cap on open connections per instance
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10)) # Seconds to wait for a free connection
+DB_CONN_MAX_AGE = float(os.environ.get("DB_CONN_MAX_AGE", 1800)) # Recycle connections older than this (seconds)
+DB_CONN_IDLE_CHECK = float(os.environ.get("DB_CONN_IDLE_CHECK", 30)) # Ping connections idle longer than this (seconds)
+
+
+class PoolTimeoutError(RuntimeError):
+    """Raised when no pooled connection becomes free within DB_POOL_TIMEOUT."""
+
+
+class ConnectionPool:
+    """
+    A small thread-safe pool of psycopg2 connections.
+    Connections stay open between invocations handled by the same instance, so
+    only the first request (or a recycled connection) pays the TCP+TLS+auth handshake.
+    """
+
+    def __init__(self, max_size=DB_POOL_MAX_SIZE, timeout=DB_POOL_TIMEOUT,
+                 max_age=DB_CONN_MAX_AGE, idle_check=DB_CONN_IDLE_CHECK):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.idle_check = idle_check
+
+        self._idle = deque() # (conn, created_at, last_used)
+        self._borrowed = {} # id(conn) -> created_at
+        self._size = 0 # Idle + borrowed + currently being opened
+        self._lock = threading.Condition(threading.RLock()) # Guards the idle/borrowed state and stats
+
+        self.stats = {
+            "borrowed": 0,
+            "created": 0,
+            "recycled": 0,
+            "total_wait_ms": 0.0,
+            "max_wait_ms": 0.0,
+        }
+
+    def _open(self):
+        conn = psycopg2.connect(
+            host=DB_HOST,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            database=DB_NAME
+        )
+        with self._lock:
+            self.stats["created"] += 1
+        return conn
+
+    def _close(self, conn):
+        with self._lock: # Reentrant, so close_all() can call this while holding it
+            self.stats["recycled"] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, conn, created_at, last_used):
+        """Checks a pooled connection before handing it out again."""
+        now = time.monotonic()
+        if conn.closed:
+            return False
+        if now - created_at > self.max_age:
+            return False
+        if now - last_used > self.idle_check:
+            # Cloud SQL (or a proxy in between) may have dropped a long-idle socket.
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def get_connection(self):
+        """
+        Borrows a connection from the pool, waiting up to `timeout` seconds if the
+        pool is already at max_size. Returns (conn, wait_ms).
+        """
+        start = time.monotonic()
+        deadline = start + self.timeout
+        conn = None
+
+        with self._lock:
+            while not self._idle and self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeoutError(
+                        f"Timed out after {self.timeout}s waiting for a database connection "
+                        f"(pool size {self.max_size})."
+                    )
+                self._lock.wait(remaining)
+
+            if self._idle:
+                # Most recently used first, so the warmest sockets stay busy
+                conn, created_at, last_used = self._idle.pop()
+            else:
+                self._size += 1 # Reserve the slot before connecting outside the lock
+
+        # Health check / recycle outside the lock; a replacement reuses the same slot
+        if conn is not None and not self._is_healthy(conn, created_at, last_used):
+            self._close(conn)
+            conn = None
+
+        if conn is None:
+            try:
+                conn = self._open()
+                created_at = time.monotonic()
+            except Exception:
+                with self._lock:
+                    self._size -= 1
+                    self._lock.notify()
+                raise
+
+        wait_ms = (time.monotonic() - start) * 1000
+        with self._lock:
+            self._borrowed[id(conn)] = created_at
+            self.stats["borrowed"] += 1
+            self.stats["total_wait_ms"] += wait_ms
+            self.stats["max_wait_ms"] = max(self.stats["max_wait_ms"], wait_ms)
+        return conn, wait_ms
+
+    def release_connection(self, conn, discard=False):
+        """Returns a borrowed connection to the pool, rolling back any open transaction."""
+        with self._lock:
+            created_at = self._borrowed.pop(id(conn), None)
+
+        if created_at is None:
+            # Not one of ours (or already released); just make sure it is closed.
+            self._close(conn)
+            return
+
+        if not discard and not conn.closed:
+            try:
+                status = conn.get_transaction_status()
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    discard = True
+                elif status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        else:
+            discard = True
+
+        if discard:
+            self._close(conn)
+
+        with self._lock:
+            if discard:
+                self._size -= 1
+            else:
+                self._idle.append((conn, created_at, time.monotonic()))
+            self._lock.notify()
+
+    def close_all(self):
+        """Closes every idle connection (borrowed ones are closed when released)."""
+        with self._lock:
+            while self._idle:
+                conn, _, _ = self._idle.pop()
+                self._close(conn)
+                self._size -= 1
+
+    def get_stats(self):
+        with self._lock:
+            borrowed = self.stats["borrowed"]
+            return dict(
+                self.stats,
+                idle=len(self._idle),
+                in_use=len(self._borrowed),
+                max_size=self.max_size,
+                avg_wait_ms=(self.stats["total_wait_ms"] / borrowed) if borrowed else 0.0,
+            )
+
+
+# Module-level pool, created once per function instance and reused across invocations
+pool = ConnectionPool()
+
+
+def get_connection():
+    """Borrows a pooled connection and logs how long the request waited for it."""
+    conn, wait_ms = pool.get_connection()
+    print(f"DB pool: borrowed connection after {wait_ms:.1f} ms wait "
+          f"({pool.get_stats()['in_use']}/{pool.max_size} in use).")
+    return conn
+
+
+def open_unpooled_connection():
+    """Opens a dedicated connection outside the pool, e.g. for a long-lived LISTEN."""
+    return psycopg2.connect(
+        host=DB_HOST,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        database=DB_NAME
+    )
+
+
+def release_connection(conn, discard=False):
+    """Returns a connection to the pool. Pass discard=True if it may be broken."""
+    if conn is not None:
+        pool.release_connection(conn, discard=discard)
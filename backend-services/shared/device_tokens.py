@@ -0,0 +1,49 @@
+from google.cloud import firestore
+
+# FCM registration tokens live under patients/{uid}/deviceTokens/{token}. The token is
+# the document id, so registering the same device twice just refreshes its entry.
+DEVICE_TOKENS_SUBCOLLECTION = "deviceTokens"
+
+# Firestore allows at most 500 writes per batch
+FIRESTORE_MAX_BATCH_WRITES = 500
+
+_client = None
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        _client = firestore.Client()
+    return _client
+
+
+def _tokens_ref(patient_id):
+    return _get_client().collection("patients").document(patient_id).collection(DEVICE_TOKENS_SUBCOLLECTION)
+
+
+def register_token(patient_id, token, platform=None):
+    _tokens_ref(patient_id).document(token).set({
+        "token": token,
+        "platform": platform or "unknown",
+        "lastSeen": firestore.SERVER_TIMESTAMP,
+    }, merge=True)
+
+
+def unregister_token(patient_id, token):
+    _tokens_ref(patient_id).document(token).delete()
+
+
+def get_tokens(patient_id):
+    """Returns the patient's registered FCM tokens (document ids only, no field reads)."""
+    return [doc.id for doc in _tokens_ref(patient_id).list_documents()]
+
+
+def remove_tokens(patient_id, tokens):
+    """Deletes tokens FCM reported as invalid, in as few batched writes as possible."""
+    tokens = list(tokens)
+    for start in range(0, len(tokens), FIRESTORE_MAX_BATCH_WRITES):
+        batch = _get_client().batch()
+        for token in tokens[start:start + FIRESTORE_MAX_BATCH_WRITES]:
+            batch.delete(_tokens_ref(patient_id).document(token))
+        batch.commit()
+    return len(tokens)
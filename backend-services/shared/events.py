@@ -0,0 +1,76 @@
+import os
+from google.cloud import pubsub_v1 # Import Pub/Sub client
+
+# Pub/Sub Topic ID for notifications
+NOTIFICATION_TOPIC_ID = os.environ.get("NOTIFICATION_TOPIC_ID", "appointment-events") # Default fallback value
+PROJECT_ID = os.environ.get("GCP_PROJECT") # Get project ID from environment
+
+# --- Publisher batching ---
+# Messages are sent when any limit is reached; max latency bounds how long one waits.
+PUBSUB_BATCH_MAX_MESSAGES = int(os.environ.get("PUBSUB_BATCH_MAX_MESSAGES", 100))
+PUBSUB_BATCH_MAX_BYTES = int(os.environ.get("PUBSUB_BATCH_MAX_BYTES", 1024 * 1024))
+PUBSUB_BATCH_MAX_LATENCY = float(os.environ.get("PUBSUB_BATCH_MAX_LATENCY", 0.05)) # Seconds
+
+# Initialize Pub/Sub publisher client globally, with batching enabled.
+# Message ordering is on so events for one patient (same ordering key) arrive in order.
+# PUBSUB_EMULATOR_HOST is honoured by the client, which is how local runs use the emulator.
+publisher = pubsub_v1.PublisherClient(
+    batch_settings=pubsub_v1.types.BatchSettings(
+        max_messages=PUBSUB_BATCH_MAX_MESSAGES,
+        max_bytes=PUBSUB_BATCH_MAX_BYTES,
+        max_latency=PUBSUB_BATCH_MAX_LATENCY,
+    ),
+    publisher_options=pubsub_v1.types.PublisherOptions(enable_message_ordering=True),
+)
+topic_path = publisher.topic_path(PROJECT_ID, NOTIFICATION_TOPIC_ID)
+print(f"Pub/Sub topic path: {topic_path}")
+
+stats = {"published": 0, "failed": 0}
+
+
+def event_attributes(message_data):
+    """Pub/Sub attributes so subscribers can route and de-duplicate without parsing the body."""
+    attributes = {"eventType": str(message_data.get("eventType") or "")}
+    if message_data.get("eventId"):
+        attributes["eventId"] = str(message_data["eventId"])
+    return attributes
+
+
+def publish_batch(messages, timeout=60):
+    """
+    Publishes many messages and waits for all of them. Used by background jobs
+    (outbox relay, sweepers) that need to know exactly what was delivered.
+    `messages` is a list of (data_bytes, ordering_key, attributes).
+    Returns a list of booleans, True where the publish succeeded.
+    """
+    futures = []
+    for data, ordering_key, attributes in messages:
+        try:
+            futures.append(publisher.publish(topic_path, data, ordering_key=ordering_key or "", **attributes))
+        except Exception as pubsub_err:
+            print(f"Error publishing to Pub/Sub: {pubsub_err}")
+            futures.append(None)
+
+    results = []
+    failed_keys = set()
+    for (data, ordering_key, attributes), future in zip(messages, futures):
+        try:
+            if future is None:
+                raise RuntimeError("publish rejected")
+            future.result(timeout=timeout)
+            stats["published"] += 1
+            results.append(True)
+        except Exception as pubsub_err:
+            stats["failed"] += 1
+            print(f"Error publishing '{attributes.get('eventType')}' to Pub/Sub: {pubsub_err}")
+            if ordering_key:
+                failed_keys.add(ordering_key)
+            results.append(False)
+
+    for ordering_key in failed_keys:
+        publisher.resume_publish(topic_path, ordering_key)
+    return results
+
+
+def get_publish_stats():
+    return dict(stats)
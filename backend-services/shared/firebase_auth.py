@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import firebase_admin
+from firebase_admin import credentials, auth
+from google.auth import jwt
+from google.auth.transport import requests as google_requests
+
+# Firebase Admin SDK key from Secret Manager
+FIREBASE_ADMIN_SDK_KEY = os.environ.get("FIREBASE_ADMIN_SDK_KEY")
+
+# --- Token cache tuning ---
+AUTH_CACHE_MAX_SIZE = int(os.environ.get("AUTH_CACHE_MAX_SIZE", 1024)) # Decoded tokens kept per instance
+AUTH_CERTS_REFRESH_SECONDS = int(os.environ.get("AUTH_CERTS_REFRESH_SECONDS", 3600)) # Fallback when no Cache-Control max-age
+AUTH_CLOCK_SKEW_SECONDS = int(os.environ.get("AUTH_CLOCK_SKEW_SECONDS", 10))
+AUTH_STATS_LOG_INTERVAL = float(os.environ.get("AUTH_STATS_LOG_INTERVAL", 300)) # Seconds between cache stats logs; 0 disables
+
+# Public keys Google uses to sign Firebase ID tokens
+FIREBASE_CERTS_URL = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+FIREBASE_ISSUER_PREFIX = "https://securetoken.google.com/"
+
+# Initialize Firebase Admin SDK only once
+if not firebase_admin._apps:
+    try:
+        cred_json = json.loads(FIREBASE_ADMIN_SDK_KEY)
+        cred = credentials.Certificate(cred_json)
+        firebase_admin.initialize_app(cred)
+        print("Firebase Admin SDK initialized successfully.")
+    except Exception as e:
+        print(f"Error initializing Firebase Admin SDK: {e}")
+        # Log this error severely as the functions won't work without Firebase auth.
+
+
+class SigningCertCache:
+    """
+    Keeps Google's token-signing certificates in memory. get() re-fetches them once
+    their Cache-Control lifetime has passed, so they are never used stale even when
+    the instance had no CPU between requests. The optional background thread
+    (start()) refreshes at half the lifetime, so requests normally never wait.
+    """
+
+    retry_seconds = 30 # After a failed fetch, wait this long before get() tries again
+
+    def __init__(self, url=FIREBASE_CERTS_URL, default_ttl=AUTH_CERTS_REFRESH_SECONDS):
+        self.url = url
+        self.default_ttl = default_ttl
+        self._certs = {}
+        self._expires_at = 0.0 # time.monotonic() after which get() refreshes
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock() # One request-path fetch at a time
+        self._refresh_now = threading.Event()
+        self._thread = None
+
+    def _fetch(self):
+        response = google_requests.Request()(self.url, method="GET")
+        if response.status != 200:
+            raise RuntimeError(f"Could not fetch signing certificates (HTTP {response.status}).")
+
+        ttl = self.default_ttl
+        for directive in response.headers.get("cache-control", "").split(","):
+            name, _, value = directive.strip().partition("=")
+            if name == "max-age" and value.isdigit():
+                ttl = int(value)
+
+        certs = json.loads(response.data.decode("utf-8"))
+        with self._lock:
+            self._certs = certs
+            self._expires_at = time.monotonic() + ttl
+        return ttl
+
+    def _run(self):
+        while True:
+            try:
+                ttl = self._fetch()
+                # Refresh at half the advertised lifetime so new keys are always here first
+                wait = max(ttl // 2, 60)
+            except Exception as e:
+                print(f"Error refreshing Firebase signing certificates: {e}")
+                wait = 30
+            self._refresh_now.wait(wait)
+            self._refresh_now.clear()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="firebase-certs-refresh", daemon=True)
+            self._thread.start()
+
+    def request_refresh(self):
+        """Asks the background thread to re-fetch now (e.g. an unknown key id was seen)."""
+        self._refresh_now.set()
+
+    def get(self):
+        with self._lock:
+            certs = self._certs
+            expired = time.monotonic() >= self._expires_at
+        if not expired:
+            return certs
+
+        # With no certificates yet every caller waits for the fetch; with expired ones,
+        # one caller refreshes and the others go on (an unknown key id falls back to the SDK)
+        if not self._fetch_lock.acquire(blocking=not certs):
+            return certs
+        try:
+            with self._lock:
+                expired = time.monotonic() >= self._expires_at
+            if expired: # Not refreshed while this caller waited
+                self._fetch()
+        except Exception as e:
+            print(f"Error refreshing Firebase signing certificates: {e}")
+            with self._lock:
+                self._expires_at = time.monotonic() + self.retry_seconds
+        finally:
+            self._fetch_lock.release()
+        with self._lock:
+            return self._certs
+
+
+class CachedTokenVerifier:
+    """
+    Verifies Firebase ID tokens and remembers the decoded result until the token's
+    `exp`, in a bounded LRU keyed by a SHA-256 of the token.
+    """
+
+    def __init__(self, max_size=AUTH_CACHE_MAX_SIZE, cert_cache=None):
+        self.max_size = max_size
+        self.cert_cache = cert_cache or SigningCertCache()
+        self._entries = OrderedDict() # token hash -> (decoded_token, exp)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0, "fallbacks": 0}
+
+    def _lookup(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            decoded_token, exp = entry
+            if exp <= now:
+                del self._entries[key]
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return decoded_token
+
+    def _store(self, key, decoded_token):
+        exp = decoded_token.get("exp")
+        if not exp:
+            return
+        with self._lock:
+            self._entries[key] = (decoded_token, exp)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats["evicted"] += 1
+
+    def _verify_locally(self, id_token):
+        """
+        Checks signature, audience, issuer and expiry against the prefetched certificates.
+        Returns None when the certificates can't be used, so the caller falls back to the SDK.
+        """
+        certs = self.cert_cache.get()
+        if not certs:
+            return None
+
+        header = jwt.decode_header(id_token)
+        if header.get("kid") not in certs:
+            # Probably a freshly rotated key; let the SDK handle this one and refresh in the background.
+            self.cert_cache.request_refresh()
+            return None
+
+        project_id = firebase_admin.get_app().project_id
+        decoded_token = jwt.decode(
+            id_token,
+            certs=certs,
+            audience=project_id,
+            clock_skew_in_seconds=AUTH_CLOCK_SKEW_SECONDS,
+        )
+        if decoded_token.get("iss") != FIREBASE_ISSUER_PREFIX + project_id:
+            raise ValueError("Firebase ID token has an incorrect issuer.")
+        if not decoded_token.get("sub"):
+            raise ValueError("Firebase ID token has no subject.")
+        decoded_token["uid"] = decoded_token["sub"]
+        return decoded_token
+
+    def verify(self, id_token):
+        key = hashlib.sha256(id_token.encode("utf-8")).hexdigest()
+
+        decoded_token = self._lookup(key)
+        if decoded_token is not None:
+            return decoded_token
+
+        decoded_token = self._verify_locally(id_token)
+        if decoded_token is None:
+            with self._lock:
+                self.stats["fallbacks"] += 1
+            decoded_token = auth.verify_id_token(id_token)
+
+        self._store(key, decoded_token)
+        return decoded_token
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return dict(
+                self.stats,
+                size=len(self._entries),
+                max_size=self.max_size,
+                hit_rate=(self.stats["hits"] / lookups) if lookups else 0.0,
+            )
+
+
+# Module-level verifier shared by every request handled by this instance
+token_verifier = CachedTokenVerifier()
+token_verifier.cert_cache.start()
+
+
+def verify_firebase_token(request):
+    """
+    Verifies the Firebase ID token from the Authorization header.
+    Returns the decoded token (containing uid) if valid, raises ValueError otherwise.
+    """
+    auth_header = request.headers.get('Authorization')
+    if not auth_header:
+        raise ValueError("Authorization header missing.")
+
+    id_token = auth_header.split(' ').pop()
+    if not id_token:
+        raise ValueError("Firebase ID token missing from Authorization header.")
+
+    try:
+        return token_verifier.verify(id_token)
+    except Exception as e:
+        print(f"Error verifying Firebase ID token: {e}")
+        raise ValueError("Invalid or expired Firebase ID token.")
+    finally:
+        log_auth_cache_stats()
+
+
+def get_auth_cache_stats():
+    """Hit/miss counters for the token cache, for logging or a debug endpoint."""
+    return token_verifier.get_stats()
+
+
+_stats_logged_at = time.monotonic()
+_stats_log_lock = threading.Lock()
+
+
+def log_auth_cache_stats(interval=None):
+    """
+    Prints the token cache counters at most once per `interval` seconds per instance
+    (AUTH_STATS_LOG_INTERVAL by default).
+    Called on every verification, so each handler reports without a timer thread
+    (which would not get CPU between requests on Cloud Functions anyway).
+    Returns True if it logged.
+    """
+    global _stats_logged_at
+    interval = AUTH_STATS_LOG_INTERVAL if interval is None else interval
+    if interval <= 0:
+        return False
+    now = time.monotonic()
+    with _stats_log_lock:
+        if now - _stats_logged_at < interval:
+            return False
+        _stats_logged_at = now
+    print(f"Firebase token cache stats: {json.dumps(get_auth_cache_stats())}")
+    return True
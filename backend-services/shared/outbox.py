@@ -0,0 +1,42 @@
+import json
+import uuid
+from psycopg2.extras import execute_values
+
+# Channel the relay LISTENs on; NOTIFY is only delivered when the writing transaction commits.
+OUTBOX_NOTIFY_CHANNEL = "appointment_event_outbox"
+
+INSERT_OUTBOX_QUERY = """
+INSERT INTO appointment_event_outbox (event_id, patient_id, event_type, payload)
+VALUES %s;
+"""
+
+
+def new_event_id():
+    return str(uuid.uuid4())
+
+
+def enqueue_events(cur, messages):
+    """
+    Writes events to the outbox using the caller's cursor, so they commit (or roll back)
+    together with the appointment change. Each message gets an `eventId` that
+    consumers can use to drop duplicates. Returns the event ids.
+    """
+    rows = []
+    for message_data in messages:
+        message_data.setdefault("eventId", new_event_id())
+        rows.append((
+            message_data["eventId"],
+            message_data.get("patientId"),
+            message_data.get("eventType"),
+            json.dumps(message_data),
+        ))
+
+    if rows:
+        execute_values(cur, INSERT_OUTBOX_QUERY, rows, page_size=len(rows))
+        cur.execute(f"NOTIFY {OUTBOX_NOTIFY_CHANNEL};")
+    return [row[0] for row in rows]
+
+
+def enqueue_event(cur, message_data):
+    """Single-event form of enqueue_events. Returns the event id."""
+    return enqueue_events(cur, [message_data])[0]
@@ -0,0 +1,153 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from google.cloud import firestore
+from google.cloud.firestore import FieldFilter
+
+# --- Profile cache tuning ---
+PROFILE_CACHE_MAX_SIZE = int(os.environ.get("PROFILE_CACHE_MAX_SIZE", 5000)) # Profiles kept per instance
+PROFILE_CACHE_TTL_SECONDS = float(os.environ.get("PROFILE_CACHE_TTL_SECONDS", 300)) # Upper bound on staleness
+PROFILE_GET_ALL_BATCH_SIZE = int(os.environ.get("PROFILE_GET_ALL_BATCH_SIZE", 100)) # Documents per get_all round trip
+PROFILE_CACHE_LISTENER = os.environ.get("PROFILE_CACHE_LISTENER", "true").lower() == "true" # Evict on every instance when a profile changes
+
+# Only the fields notifications need are read, not the whole document (addresses etc.)
+PROFILE_FIELDS = ["email", "firstName", "lastName", "phoneNumber"]
+
+_MISSING = object() # Cached "no profile", so unknown uids don't hit Firestore every time
+
+_client = None
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        _client = firestore.Client()
+    return _client
+
+
+class ProfileCache:
+    """
+    Bounded in-memory cache of patients/{uid} documents. Entries expire after ttl
+    seconds and the least recently used entry is evicted when the cache is full.
+    """
+
+    def __init__(self, max_size=PROFILE_CACHE_MAX_SIZE, ttl=PROFILE_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict() # uid -> (expires_at, profile or _MISSING)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "reads": 0, "invalidations": 0}
+
+    def get(self, uid):
+        with self._lock:
+            entry = self._entries.get(uid)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[uid]
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(uid)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def put(self, uid, profile):
+        with self._lock:
+            self._entries[uid] = (time.monotonic() + self.ttl, profile)
+            self._entries.move_to_end(uid)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def put_many(self, profiles):
+        """Caches a batch read from Firestore: {uid: profile or _MISSING}. Counts each as a read."""
+        with self._lock:
+            self.stats["reads"] += len(profiles)
+            expires_at = time.monotonic() + self.ttl
+            for uid, profile in profiles.items():
+                self._entries[uid] = (expires_at, profile)
+                self._entries.move_to_end(uid)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, size=len(self._entries))
+
+    def invalidate(self, uid):
+        with self._lock:
+            if self._entries.pop(uid, None) is not None:
+                self.stats["invalidations"] += 1
+
+
+cache = ProfileCache()
+
+
+def get_profiles(uids):
+    """
+    Returns {uid: profile dict or None} for many patients. Cached profiles cost nothing;
+    the rest are read with batched get_all calls, PROFILE_GET_ALL_BATCH_SIZE per round trip.
+    """
+    profiles = {}
+    missing = []
+    for uid in dict.fromkeys(uid for uid in uids if uid):
+        cached = cache.get(uid)
+        if cached is None:
+            missing.append(uid)
+        else:
+            profiles[uid] = None if cached is _MISSING else cached
+    if not missing:
+        return profiles
+
+    collection = _get_client().collection("patients")
+    for start in range(0, len(missing), PROFILE_GET_ALL_BATCH_SIZE):
+        chunk = missing[start:start + PROFILE_GET_ALL_BATCH_SIZE]
+        found = {}
+        for snapshot in _get_client().get_all([collection.document(uid) for uid in chunk], field_paths=PROFILE_FIELDS):
+            if snapshot.exists:
+                found[snapshot.id] = snapshot.to_dict()
+        cache.put_many({uid: found.get(uid, _MISSING) for uid in chunk})
+        for uid in chunk:
+            profiles[uid] = found.get(uid)
+    return profiles
+
+
+def get_profile(uid):
+    """Single-patient form of get_profiles. Returns the profile dict or None."""
+    if not uid:
+        return None
+    return get_profiles([uid]).get(uid)
+
+
+def invalidate(uid):
+    cache.invalidate(uid)
+
+
+_listener = None
+
+
+def start_invalidation_listener(query=None):
+    """
+    Watches profiles written since this instance started (createPatientProfile stamps
+    `lastUpdated` on every write) and evicts each one as it changes, so every instance
+    drops a stale profile within moments instead of after the TTL. The initial
+    snapshot is empty, so starting the listener reads no documents.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    if query is None:
+        query = _get_client().collection("patients").where(
+            filter=FieldFilter("lastUpdated", ">=", datetime.now(timezone.utc))
+        )
+
+    def on_snapshot(snapshots, changes, read_time):
+        for change in changes:
+            invalidate(change.document.id)
+
+    _listener = query.on_snapshot(on_snapshot)
+    return _listener
+
+
+def get_cache_stats():
+    return cache.get_stats()
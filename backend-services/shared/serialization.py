@@ -0,0 +1,84 @@
+import os
+import gzip
+import json
+from datetime import date, time, datetime
+
+# orjson is optional: several times faster than json.dumps and encodes date/time/datetime
+# natively in the same ISO format as .isoformat(), so rows need no per-value conversion.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Responses smaller than this are sent uncompressed; gzip isn't worth it below a few KB
+GZIP_MIN_BYTES = int(os.environ.get("GZIP_MIN_BYTES", 4096))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", 5))
+
+# psycopg2 type codes (Postgres OIDs) of the temporal columns we return
+TEMPORAL_TYPE_CODES = {
+    1082, # date
+    1083, # time
+    1114, # timestamp
+    1184, # timestamptz
+}
+
+
+def _isoformat(value):
+    return value.isoformat() if isinstance(value, (date, time, datetime)) else value
+
+
+def make_row_converter(description, fields=None):
+    """
+    Builds a function that turns one DB row tuple into a dict, once per query instead of once per row.
+    Column positions, names and which columns need ISO formatting are worked out here
+    from cursor.description; `fields` optionally keeps only some columns.
+    """
+    columns = [
+        (index, column.name, column.type_code in TEMPORAL_TYPE_CODES)
+        for index, column in enumerate(description)
+        if fields is None or column.name in fields
+    ]
+
+    if orjson is not None or not any(is_temporal for _, _, is_temporal in columns):
+        names = [name for _, name, _ in columns]
+        indexes = [index for index, _, _ in columns]
+        if indexes == list(range(len(description))):
+            return lambda row: dict(zip(names, row))
+        return lambda row: dict(zip(names, [row[index] for index in indexes]))
+
+    def convert(row):
+        return {
+            name: _isoformat(row[index]) if is_temporal else row[index]
+            for index, name, is_temporal in columns
+        }
+    return convert
+
+
+def rows_to_dicts(cur, rows, fields=None):
+    convert = make_row_converter(cur.description, fields)
+    return [convert(row) for row in rows]
+
+
+def dumps(payload):
+    """Serializes to UTF-8 JSON bytes with orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':'), default=_isoformat).encode('utf-8')
+
+
+def json_response(request, payload, status=200, headers=None):
+    """
+    Returns a (body, status, headers) tuple for a Cloud Function, gzip-compressing
+    the body when it is large and the client sends Accept-Encoding: gzip.
+    """
+    headers = dict(headers or {})
+    body = dumps(payload)
+    headers['Content-Type'] = 'application/json'
+    headers['Vary'] = 'Accept-Encoding'
+
+    accept_encoding = request.headers.get('Accept-Encoding', '') if request is not None else ''
+    if len(body) >= GZIP_MIN_BYTES and 'gzip' in accept_encoding.lower():
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        headers['Content-Encoding'] = 'gzip'
+
+    return (body, status, headers)
@@ -0,0 +1,72 @@
+from datetime import datetime, time, timedelta
+
+# Standard bookable day: 30 minute slots from 9:00, last slot starting before 17:00
+SLOT_DAY_START = time(9, 0)
+SLOT_DAY_END = time(17, 0)
+SLOT_DURATION_MINUTES = 30
+
+# Generates every slot in [start_date, end_date] server-side and anti-joins it against
+# non-cancelled bookings, so any window costs one round trip.
+# A slot is taken by any active booking, whatever its service, the same rule the
+# unique index bookAppointment claims slots against enforces (sql/007).
+SELECT_FREE_SLOTS_QUERY = """
+SELECT to_char(s.slot_start, 'YYYY-MM-DD') AS slot_date,
+       to_char(s.slot_start, 'HH24:MI') AS slot_time
+FROM generate_series(%(start_date)s::timestamp, %(end_date)s::timestamp, interval '1 day') AS d
+CROSS JOIN LATERAL generate_series(
+    d::date + %(day_start)s::time,
+    d::date + %(day_end)s::time - %(slot_step)s::interval,
+    %(slot_step)s::interval
+) AS s(slot_start)
+WHERE NOT EXISTS (
+    SELECT 1
+    FROM appointments a
+    WHERE a.appointment_date = s.slot_start::date
+      AND a.appointment_time = s.slot_start::time
+      AND a.status != 'cancelled'
+)
+{where_extra}
+ORDER BY {order_by}
+{limit};
+"""
+
+
+def free_slots_params(start_date, end_date):
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "day_start": SLOT_DAY_START,
+        "day_end": SLOT_DAY_END,
+        "slot_step": timedelta(minutes=SLOT_DURATION_MINUTES),
+    }
+
+
+def fetch_free_slots(cur, start_date, end_date):
+    """Returns [(YYYY-MM-DD, HH:MM), ...] for every free slot in the window, in order."""
+    query = SELECT_FREE_SLOTS_QUERY.format(where_extra="", order_by="s.slot_start", limit="")
+    cur.execute(query, free_slots_params(start_date, end_date))
+    return cur.fetchall()
+
+
+def fetch_nearest_free_slots(cur, slot_date, slot_time, search_days=3, limit=5):
+    """
+    Returns up to `limit` free slots closest to the requested one (excluding it),
+    searching `search_days` either side of slot_date. Used to suggest alternatives on a 409.
+    """
+    start_date = max(slot_date - timedelta(days=search_days), datetime.now().date())
+    end_date = slot_date + timedelta(days=search_days)
+    if end_date < start_date:
+        return []
+
+    query = SELECT_FREE_SLOTS_QUERY.format(
+        where_extra="AND s.slot_start > now()::timestamp AND s.slot_start != %(requested)s::timestamp",
+        order_by="abs(extract(epoch FROM s.slot_start - %(requested)s::timestamp)), s.slot_start",
+        limit="LIMIT %(limit)s",
+    )
+    params = free_slots_params(start_date, end_date)
+    params.update({
+        "requested": datetime.combine(slot_date, slot_time),
+        "limit": limit,
+    })
+    cur.execute(query, params)
+    return cur.fetchall()
@@ -0,0 +1,5 @@
+-- Supports the anti-join in getAvailableAppointments (SELECT_FREE_SLOTS_QUERY):
+-- each generated slot is probed against active bookings by (date, time).
+CREATE INDEX IF NOT EXISTS idx_appointments_active_slot
+    ON appointments (appointment_date, appointment_time)
+    WHERE status != 'cancelled';
@@ -0,0 +1,15 @@
+-- One active booking per slot and service. bookAppointment claims slots with
+-- INSERT ... ON CONFLICT DO NOTHING against this index, so concurrent requests
+-- for the same slot cannot both succeed.
+--
+-- Creating the index fails if double bookings already exist. List them with:
+--   SELECT appointment_date, appointment_time, service_type, array_agg(id)
+--   FROM appointments WHERE status != 'cancelled'
+--   GROUP BY 1, 2, 3 HAVING count(*) > 1;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_appointments_active_slot
+    ON appointments (appointment_date, appointment_time, service_type)
+    WHERE status != 'cancelled';
+
+-- The unique index leads with (appointment_date, appointment_time), so it also
+-- serves the availability anti-join that 001 was added for.
+DROP INDEX IF EXISTS idx_appointments_active_slot;
@@ -0,0 +1,22 @@
+-- Transactional outbox for appointment events. bookAppointment and
+-- cancel_appointment insert here in the same transaction as the appointment
+-- change; outboxRelay publishes the rows to the appointment-events topic.
+CREATE TABLE IF NOT EXISTS appointment_event_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    event_id UUID NOT NULL UNIQUE, -- Sent as the eventId attribute so consumers can de-duplicate
+    patient_id TEXT, -- Pub/Sub ordering key
+    event_type TEXT NOT NULL,
+    payload JSONB NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    published_at TIMESTAMPTZ
+);
+
+-- The relay scans pending rows in id order
+CREATE INDEX IF NOT EXISTS idx_outbox_pending
+    ON appointment_event_outbox (id)
+    WHERE published_at IS NULL;
+
+-- Cleanup of published rows past the retention window
+CREATE INDEX IF NOT EXISTS idx_outbox_published_at
+    ON appointment_event_outbox (published_at)
+    WHERE published_at IS NOT NULL;
@@ -0,0 +1,4 @@
+-- Keyset pagination in get_appointments: filter by patient, then walk
+-- (appointment_date, appointment_time, id) in either direction from the cursor.
+CREATE INDEX IF NOT EXISTS idx_appointments_patient_keyset
+    ON appointments (patient_id, appointment_date, appointment_time, id);
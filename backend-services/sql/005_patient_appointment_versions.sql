@@ -0,0 +1,30 @@
+-- Per-patient version counter used as the ETag source in get_appointments.
+-- A trigger bumps it on every change to a patient's appointments (book, batch
+-- book, cancel, bulk cancel, manual fixes), so no handler can forget to.
+CREATE TABLE IF NOT EXISTS patient_appointment_versions (
+    patient_id TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION bump_patient_appointment_version() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO patient_appointment_versions (patient_id) VALUES (NEW.patient_id)
+        ON CONFLICT (patient_id) DO UPDATE
+            SET version = patient_appointment_versions.version + 1, updated_at = now();
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') AND OLD.patient_id IS DISTINCT FROM
+            (CASE WHEN TG_OP = 'UPDATE' THEN NEW.patient_id END) THEN
+        INSERT INTO patient_appointment_versions (patient_id) VALUES (OLD.patient_id)
+        ON CONFLICT (patient_id) DO UPDATE
+            SET version = patient_appointment_versions.version + 1, updated_at = now();
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_appointments_bump_version ON appointments;
+CREATE TRIGGER trg_appointments_bump_version
+    AFTER INSERT OR UPDATE OR DELETE ON appointments
+    FOR EACH ROW EXECUTE FUNCTION bump_patient_appointment_version();
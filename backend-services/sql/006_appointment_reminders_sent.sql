@@ -0,0 +1,16 @@
+-- Reminders already published by reminderSweeper, one row per appointment and
+-- reminder window (e.g. '24h', '2h'). The sweeper anti-joins against this table,
+-- so a rerun or an overlapping window never sends the same reminder twice.
+CREATE TABLE IF NOT EXISTS appointment_reminders_sent (
+    appointment_id BIGINT NOT NULL,
+    reminder_window TEXT NOT NULL,
+    sent_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (appointment_id, reminder_window)
+);
+
+-- Rows for past appointments are pruned by sent_at
+CREATE INDEX IF NOT EXISTS idx_appointment_reminders_sent_at
+    ON appointment_reminders_sent (sent_at);
+
+-- The sweeper's range scan on (appointment_date, appointment_time) for active
+-- appointments is served by uq_appointments_active_slot_time from 007.
@@ -0,0 +1,13 @@
+-- A slot is one clinic slot: getAvailableAppointments shows it as taken once any
+-- service is booked there, so the uniqueness rule must not include service_type
+-- either. 002's index let a second patient book the same slot under another service.
+--
+-- Creating the index fails if a slot already has several active bookings. List them with:
+--   SELECT appointment_date, appointment_time, array_agg(id)
+--   FROM appointments WHERE status != 'cancelled'
+--   GROUP BY 1, 2 HAVING count(*) > 1;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_appointments_active_slot_time
+    ON appointments (appointment_date, appointment_time)
+    WHERE status != 'cancelled';
+
+DROP INDEX IF EXISTS uq_appointments_active_slot;
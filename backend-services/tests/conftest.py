@@ -0,0 +1,28 @@
+import pytest
+
+from support import load_function_module, database_dsn, apply_schema, reset_tables, use_database
+
+
+@pytest.fixture
+def load_function():
+    return load_function_module
+
+
+@pytest.fixture(scope="session")
+def postgres_dsn():
+    """Scratch Postgres with the appointments schema; tests using it skip without one."""
+    pytest.importorskip("psycopg2")
+    dsn = database_dsn()
+    if dsn is None:
+        pytest.skip("No Postgres: set TEST_DATABASE_URL or pip install -r tests/requirements.txt")
+    apply_schema(dsn)
+    return dsn
+
+
+@pytest.fixture
+def database(postgres_dsn):
+    """shared.db pointed at the scratch database, with empty tables."""
+    reset_tables(postgres_dsn)
+    db = use_database(postgres_dsn)
+    yield db
+    db.pool.close_all()
@@ -0,0 +1,381 @@
+"""Helpers shared by the tests and the scripts in backend-services/benchmarks."""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+import importlib.util
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SQL_DIR = BACKEND_DIR / "sql"
+
+# Functions import `shared` as a package copied next to main.py at deploy time
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+# The appointments table predates sql/ (created by hand in Cloud SQL), so tests
+# create it from this copy and then apply the migrations on top.
+APPOINTMENTS_TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS appointments (
+    id SERIAL PRIMARY KEY,
+    patient_id TEXT NOT NULL,
+    patient_email TEXT,
+    appointment_date DATE NOT NULL,
+    appointment_time TIME NOT NULL,
+    service_type TEXT,
+    notes TEXT,
+    status TEXT NOT NULL DEFAULT 'booked',
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+TRUNCATE_QUERY = """
+TRUNCATE appointments, appointment_event_outbox, patient_appointment_versions,
+         appointment_reminders_sent RESTART IDENTITY;
+"""
+
+_embedded_server = None
+
+
+def load_function_module(function_dir, module_name="main", alias=None):
+    """
+    Imports backend-services/<function_dir>/<module_name>.py. Every function has a
+    main.py, so it is registered under "<function_dir>_<module_name>" (and `alias`,
+    for modules that import it by its plain name) to keep them apart.
+    """
+    directory = BACKEND_DIR / function_dir
+    if str(directory) not in sys.path:
+        sys.path.insert(0, str(directory))
+    name = f"{function_dir}_{module_name}"
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, directory / f"{module_name}.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    if alias:
+        sys.modules[alias] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def database_dsn():
+    """
+    DSN of a scratch Postgres: TEST_DATABASE_URL if set, otherwise an embedded server
+    from the `pgserver` package. Returns None when neither is available.
+    """
+    global _embedded_server
+    if os.environ.get("TEST_DATABASE_URL"):
+        return os.environ["TEST_DATABASE_URL"]
+    try:
+        import pgserver
+    except ImportError:
+        return None
+    if _embedded_server is None:
+        _embedded_server = pgserver.get_server(tempfile.mkdtemp(prefix="appointments-pg-"), cleanup_mode="stop")
+    return _embedded_server.get_uri()
+
+
+def apply_schema(dsn):
+    """Creates the appointments table and applies every sql/ migration in order."""
+    import psycopg2
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(APPOINTMENTS_TABLE_DDL)
+            for path in sorted(SQL_DIR.glob("*.sql")):
+                cur.execute(path.read_text())
+    finally:
+        conn.close()
+
+
+def reset_tables(dsn):
+    import psycopg2
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(TRUNCATE_QUERY)
+    finally:
+        conn.close()
+
+
+def use_database(dsn, max_size=20):
+    """Points shared.db at `dsn` with a fresh pool of `max_size` connections. Returns the module."""
+    from psycopg2.extensions import parse_dsn
+    from shared import db
+    params = parse_dsn(dsn)
+    db.DB_HOST = params.get("host")
+    db.DB_USER = params.get("user")
+    db.DB_PASSWORD = params.get("password")
+    db.DB_NAME = params.get("dbname")
+    db.pool.close_all()
+    db.pool = db.ConnectionPool(max_size=max_size)
+    return db
+
+
+def make_request(body=None, uid=None, method="POST", headers=None, query_string=None):
+    """A Flask request like the ones functions-framework passes to HTTP handlers."""
+    from flask import Request
+    from werkzeug.test import EnvironBuilder
+    headers = dict(headers or {})
+    if uid:
+        headers["Authorization"] = f"Bearer {uid}"
+    builder = EnvironBuilder(method=method, json=body, headers=headers, query_string=query_string)
+    return Request(builder.get_environ())
+
+
+def fake_verify_firebase_token(request):
+    """Stands in for shared.firebase_auth.verify_firebase_token: the bearer token is the uid."""
+    auth_header = request.headers.get("Authorization")
+    if not auth_header:
+        raise ValueError("Authorization header missing.")
+    uid = auth_header.split(" ").pop()
+    return {"uid": uid, "email": f"{uid}@example.com"}
+
+
+def load_http_function(function_dir):
+    """Loads a function's main.py with token verification replaced by fake_verify_firebase_token."""
+    module = load_function_module(function_dir)
+    module.verify_firebase_token = fake_verify_firebase_token
+    return module
+
+
+class FakeMessaging:
+    """
+    Local stand-in for firebase_admin.messaging, for PushSender(backend=...).
+    Tokens in `invalid` fail with UnregisteredError, tokens in `flaky` fail with a
+    retryable error their first `flaky[token]` times; every call is recorded.
+    """
+
+    def __init__(self, invalid=(), flaky=None, latency=0.0):
+        from firebase_admin import messaging, exceptions
+        self.messaging = messaging
+        self.exceptions = exceptions
+        self.invalid = set(invalid)
+        self.flaky = dict(flaky or {})
+        self.latency = latency
+        self.calls = []
+        self.delivered = [] # One entry per successful (token, title)
+        self.MulticastMessage = messaging.MulticastMessage
+        self.Notification = messaging.Notification
+
+    def send_each_for_multicast(self, message):
+        from types import SimpleNamespace
+        if self.latency:
+            time.sleep(self.latency)
+        self.calls.append(list(message.tokens))
+        responses = []
+        for token in message.tokens:
+            if token in self.invalid:
+                error = self.messaging.UnregisteredError("Requested entity was not found.")
+            elif self.flaky.get(token, 0) > 0:
+                self.flaky[token] -= 1
+                error = self.exceptions.UnavailableError("FCM is temporarily unavailable.")
+            else:
+                error = None
+                self.delivered.append((token, message.notification.title))
+            responses.append(SimpleNamespace(success=error is None, exception=error))
+        return SimpleNamespace(
+            responses=responses,
+            success_count=sum(1 for response in responses if response.success),
+            failure_count=sum(1 for response in responses if not response.success),
+        )
+
+
+class FakeTokenRegistry:
+    """In-memory stand-in for shared.device_tokens."""
+
+    def __init__(self, tokens_by_patient=None):
+        self.tokens = {patient_id: list(tokens) for patient_id, tokens in (tokens_by_patient or {}).items()}
+
+    def get_tokens(self, patient_id):
+        return list(self.tokens.get(patient_id, []))
+
+    def remove_tokens(self, patient_id, tokens):
+        tokens = set(tokens)
+        self.tokens[patient_id] = [token for token in self.tokens.get(patient_id, []) if token not in tokens]
+        return len(tokens)
+
+
+def self_signed_certificate(directory, hostname="localhost"):
+    """Writes a throwaway certificate and key for `hostname` into `directory`. Returns (cert_path, key_path)."""
+    import datetime
+    import ipaddress
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, hostname)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name).public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5)).not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([
+            x509.DNSName(hostname), x509.IPAddress(ipaddress.ip_address("127.0.0.1")),
+        ]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = Path(directory) / "smtp-cert.pem"
+    key_path = Path(directory) / "smtp-key.pem"
+    cert_path.write_bytes(certificate.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+    return str(cert_path), str(key_path)
+
+
+class LocalSmtpServer:
+    """
+    An aiosmtpd server on localhost that requires STARTTLS and AUTH like the real
+    provider, with `delay` seconds of latency per message. Use as a context manager;
+    it sets SMTP_* and SSL_CERT_FILE so sendNotification trusts and logs in to it,
+    and restores them on exit. Recipients in `refuse` get a 550 at RCPT TO.
+    `messages` counts accepted messages, `recipient_attempts` every RCPT TO and
+    `connections` TCP connections.
+    """
+
+    ENV_KEYS = ("SMTP_HOST", "SMTP_PORT", "SMTP_USERNAME", "SMTP_PASSWORD", "SENDER_EMAIL", "SSL_CERT_FILE")
+
+    def __init__(self, delay=0.0, port=0, refuse=()):
+        self.delay = delay
+        self.port = port
+        self.refuse = set(refuse)
+        self.messages = 0
+        self.recipient_attempts = 0
+        self._saved_env = {}
+        self._peers = set()
+        self._controller = None
+        self._directory = tempfile.mkdtemp(prefix="smtp-")
+
+    def __enter__(self):
+        import ssl
+        import socket
+        import asyncio
+        import logging
+        from aiosmtpd.controller import Controller
+        from aiosmtpd.smtp import AuthResult
+
+        server = self
+
+        class Handler:
+            async def handle_EHLO(self, smtp, session, envelope, hostname, responses):
+                server._peers.add(session.peer) # Clients send EHLO again after STARTTLS
+                session.host_name = hostname
+                return responses
+
+            async def handle_RCPT(self, smtp, session, envelope, address, rcpt_options):
+                server.recipient_attempts += 1
+                if address in server.refuse:
+                    return "550 5.1.1 Recipient address rejected"
+                envelope.rcpt_tos.append(address)
+                return "250 OK"
+
+            async def handle_DATA(self, smtp, session, envelope):
+                if server.delay:
+                    await asyncio.sleep(server.delay)
+                server.messages += 1
+                return "250 Message accepted for delivery"
+
+        logging.getLogger("mail.log").setLevel(logging.ERROR) # aiosmtpd logs a deprecation on every AUTH
+        cert_path, key_path = self_signed_certificate(self._directory)
+        tls_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        tls_context.load_cert_chain(cert_path, key_path)
+        if not self.port:
+            with socket.socket() as probe:
+                probe.bind(("127.0.0.1", 0))
+                self.port = probe.getsockname()[1]
+        self._controller = Controller(
+            Handler(), hostname="127.0.0.1", port=self.port, server_hostname="localhost",
+            tls_context=tls_context, require_starttls=True, auth_require_tls=True,
+            authenticator=lambda *args: AuthResult(success=True),
+        )
+        self._controller.start()
+        self._saved_env = {key: os.environ.get(key) for key in self.ENV_KEYS}
+        os.environ.update({
+            "SMTP_HOST": "localhost", "SMTP_PORT": str(self.port), "SMTP_USERNAME": "bench",
+            "SMTP_PASSWORD": "bench", "SENDER_EMAIL": "clinic@example.com", "SSL_CERT_FILE": cert_path,
+        })
+        return self
+
+    @property
+    def connections(self):
+        return len(self._peers)
+
+    def __exit__(self, *exc_info):
+        self._controller.stop()
+        for key, value in self._saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+class FakePubsubMessage:
+    """What the streaming pull client hands to the subscriber callback: data, ids, ack()/nack()."""
+
+    def __init__(self, message_data, message_id, publish_time=None):
+        from datetime import datetime, timezone
+        self.data = json.dumps(message_data).encode("utf-8")
+        self.message_id = message_id
+        self.publish_time = publish_time or datetime.now(timezone.utc)
+        self.outcome = None # "ack" or "nack"
+        self.settled_at = None
+        self.settled = threading.Event()
+
+    def _settle(self, outcome):
+        self.outcome = outcome
+        self.settled_at = time.time()
+        self.settled.set()
+
+    def ack(self):
+        self._settle("ack")
+
+    def nack(self):
+        self._settle("nack")
+
+
+class FakePublisher:
+    """
+    In-process stand-in for the Pub/Sub PublisherClient in shared.events (assign it to
+    events.publisher). publish() returns an already settled future. Event ids in
+    `fail_event_ids` fail; like Pub/Sub with message ordering, a failure pauses its
+    ordering key, so later messages with that key fail until resume_publish().
+    Delivered messages are kept in `published` as (ordering_key, attributes, data).
+    """
+
+    def __init__(self, fail_event_ids=()):
+        self.fail_event_ids = set(fail_event_ids)
+        self.published = []
+        self.paused_keys = set()
+        self._lock = threading.Lock()
+
+    def publish(self, topic, data, ordering_key="", **attributes):
+        from concurrent.futures import Future
+        future = Future()
+        with self._lock:
+            if ordering_key and ordering_key in self.paused_keys:
+                future.set_exception(RuntimeError(f"Ordering key {ordering_key} is paused."))
+            elif attributes.get("eventId") in self.fail_event_ids:
+                if ordering_key:
+                    self.paused_keys.add(ordering_key)
+                future.set_exception(RuntimeError("Publish failed."))
+            else:
+                self.published.append((ordering_key, attributes, data))
+                future.set_result(str(len(self.published)))
+        return future
+
+    def resume_publish(self, topic, ordering_key):
+        with self._lock:
+            self.paused_keys.discard(ordering_key)
+
+    def event_ids(self, ordering_key=None):
+        return [attributes.get("eventId") for key, attributes, _ in self.published
+                if ordering_key is None or key == ordering_key]
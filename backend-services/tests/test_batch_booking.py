@@ -0,0 +1,59 @@
+import json
+from datetime import date, timedelta
+
+import pytest
+
+from support import load_http_function, make_request
+
+pytest.importorskip("functions_framework")
+pytest.importorskip("firebase_admin")
+
+book = load_http_function("bookAppointment")
+
+START_DATE = (date.today() + timedelta(days=7)).isoformat()
+
+
+def book_batch(body, uid="patient-1"):
+    body = dict({"patientId": uid, "serviceType": "Physiotherapy"}, **body)
+    response_body, status, _ = book.book_appointments_batch(make_request(body, uid=uid))
+    return status, json.loads(response_body)
+
+
+@pytest.mark.parametrize("body", [
+    {"slots": ["2030-01-01 09:00"]},
+    {"slots": [None]},
+    {"slots": [{"appointmentDate": START_DATE, "appointmentTime": "09:00"}, 42]},
+    {"slots": "2030-01-01"},
+    {"slots": {"appointmentDate": START_DATE, "appointmentTime": "09:00"}},
+    {"recurrence": "weekly"},
+    {"recurrence": ["2030-01-01", "09:00"]},
+    {"recurrence": {"startDate": START_DATE, "time": "09:00", "count": "many"}},
+])
+def test_malformed_batches_are_rejected_with_400(body):
+    status, response = book_batch(body)
+    assert status == 400
+    assert response["error"]
+
+
+def test_non_object_body_is_rejected_with_400():
+    response_body, status, _ = book.book_appointments_batch(make_request([{"patientId": "patient-1"}], uid="patient-1"))
+    assert status == 400
+
+
+def test_recurring_series_is_booked_in_one_transaction(database):
+    status, response = book_batch({"recurrence": {"startDate": START_DATE, "time": "10:00", "frequency": "weekly", "count": 4}})
+    assert status == 200, response
+
+    # Overlapping series: one slot is taken, so none of it is booked
+    status, response = book_batch({"recurrence": {"startDate": START_DATE, "time": "10:00", "frequency": "daily", "count": 3}},
+                                  uid="patient-2")
+    assert status == 409
+    assert response["conflicts"] == [{"appointmentDate": START_DATE, "appointmentTime": "10:00"}]
+
+    conn = database.get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT patient_id, count(*) FROM appointments GROUP BY 1;")
+            assert cur.fetchall() == [("patient-1", 4)]
+    finally:
+        database.release_connection(conn)
@@ -0,0 +1,79 @@
+import json
+from datetime import date, timedelta
+
+import pytest
+
+from support import load_http_function, make_request, fake_verify_firebase_token
+
+pytest.importorskip("functions_framework")
+pytest.importorskip("firebase_admin")
+
+cancel = load_http_function("cancel_appointment")
+
+CLOSURE_DATE = date.today() + timedelta(days=7)
+
+
+@pytest.fixture
+def staff(monkeypatch):
+    monkeypatch.setattr(cancel, "verify_firebase_token",
+                        lambda request: dict(fake_verify_firebase_token(request), **{cancel.STAFF_CLAIM: True}))
+
+
+def seed_appointments(database, count, day=CLOSURE_DATE):
+    conn = database.get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.executemany("""
+                INSERT INTO appointments (patient_id, patient_email, appointment_date, appointment_time, service_type)
+                VALUES (%s, %s, %s, %s, 'Physiotherapy');
+            """, [(f"patient-{i}", f"patient-{i}@example.com", day, f"{8 + i // 4:02d}:{(i % 4) * 15:02d}")
+                  for i in range(count)])
+        conn.commit()
+    finally:
+        database.release_connection(conn)
+
+
+def counts(database):
+    conn = database.get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT count(*) FILTER (WHERE status = 'cancelled') FROM appointments;")
+            cancelled = cur.fetchone()[0]
+            cur.execute("SELECT count(*) FROM appointment_event_outbox;")
+            return cancelled, cur.fetchone()[0]
+    finally:
+        database.release_connection(conn)
+
+
+def bulk_cancel(body):
+    response_body, status, _ = cancel.bulk_cancel_appointments(make_request(body, uid="staff-1"))
+    return status, json.loads(response_body)
+
+
+def test_selection_over_the_limit_is_rejected_before_anything_is_cancelled(database, staff, monkeypatch):
+    monkeypatch.setattr(cancel, "MAX_BULK_CANCEL", 3)
+    seed_appointments(database, 5)
+
+    status, body = bulk_cancel({"date": CLOSURE_DATE.isoformat()})
+
+    assert status == 400
+    assert "more than 3" in body["error"]
+    assert counts(database) == (0, 0)
+
+
+def test_selection_at_the_limit_is_cancelled_with_one_event_each(database, staff, monkeypatch):
+    monkeypatch.setattr(cancel, "MAX_BULK_CANCEL", 3)
+    seed_appointments(database, 3)
+
+    status, body = bulk_cancel({"date": CLOSURE_DATE.isoformat(), "reason": "Clinic closed"})
+
+    assert status == 200
+    assert len(body["cancelledIds"]) == 3
+    assert counts(database) == (3, 3)
+    # Already cancelled rows no longer count towards the selection
+    assert bulk_cancel({"date": CLOSURE_DATE.isoformat()}) == (200, {"message": "0 appointments cancelled.", "cancelledIds": []})
+
+
+def test_bulk_cancel_requires_the_staff_claim(database):
+    status, _ = bulk_cancel({"date": CLOSURE_DATE.isoformat()})
+    assert status == 403
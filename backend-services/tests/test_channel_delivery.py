@@ -0,0 +1,85 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from support import load_function_module
+
+for dependency in ("functions_framework", "firebase_admin", "jinja2", "google.cloud.firestore"):
+    pytest.importorskip(dependency)
+
+main = load_function_module("sendNotification", "main", alias="main")
+
+
+class SlowSend:
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.sent = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        time.sleep(self.seconds)
+        with self._lock:
+            self.sent += 1
+        return True
+
+
+@pytest.fixture
+def email_pool(monkeypatch):
+    """Two email workers (as with SMTP_POOL_SIZE=2) and memory-only dedup."""
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="test-email")
+    monkeypatch.setitem(main.channel_executors, "email", executor)
+    monkeypatch.setattr(main, "delivery_dedup", main.create_dedup("memory"))
+    yield executor
+    executor.shutdown(wait=True)
+
+
+def test_burst_waiting_for_smtp_sessions_does_not_time_out(email_pool, monkeypatch):
+    # 20 emails of 50 ms through 2 sessions take ~0.5 s; each send alone is well within 0.2 s
+    monkeypatch.setitem(main.CHANNEL_TIMEOUTS, "email", 0.2)
+    send = SlowSend(0.05)
+
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        reports = list(pool.map(lambda i: main.deliver_channels(f"evt-{i}", {"email": send}), range(20)))
+
+    assert [report["email"]["status"] for report in reports] == ["sent"] * 20
+    assert send.sent == 20
+
+
+def test_send_still_queued_after_queue_timeout_is_cancelled(email_pool, monkeypatch):
+    monkeypatch.setattr(main, "CHANNEL_QUEUE_TIMEOUT", 0.1)
+    blocker = SlowSend(0.4)
+    for i in range(2):
+        email_pool.submit(blocker) # Both email workers busy
+    queued = SlowSend(0)
+
+    report = main.deliver_channels("evt-queued", {"email": queued})
+    time.sleep(0.5) # Workers free again; a cancelled send must not run now
+
+    assert report["email"]["status"] == "timeout"
+    assert queued.sent == 0
+    # The claim was released, so the redelivery sends it
+    assert main.deliver_channels("evt-queued", {"email": queued})["email"]["status"] == "sent"
+    assert queued.sent == 1
+
+
+def test_smtp_session_pool_bounds_concurrent_sends(monkeypatch):
+    in_flight = []
+    peak = []
+    lock = threading.Lock()
+
+    def fake_send(self, msg):
+        with lock:
+            in_flight.append(msg)
+            peak.append(len(in_flight))
+        time.sleep(0.02)
+        with lock:
+            in_flight.remove(msg)
+
+    monkeypatch.setattr(main.SmtpSession, "send", fake_send)
+    sessions = main.SmtpSessionPool(size=3)
+    with ThreadPoolExecutor(max_workers=12) as pool:
+        list(pool.map(sessions.send, [object() for _ in range(36)]))
+
+    assert max(peak) == 3
@@ -0,0 +1,128 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from support import load_function_module
+
+delivery_dedup = load_function_module("sendNotification", "delivery_dedup")
+DeliveryDedup = delivery_dedup.DeliveryDedup
+SqliteDeliveryStore = delivery_dedup.SqliteDeliveryStore
+
+
+def deliver(dedup, event_id, channel, send):
+    """The claim -> send -> record/release sequence deliver_channels runs per channel."""
+    if dedup.claim(event_id, channel) != delivery_dedup.CLAIMED:
+        return False
+    try:
+        ok = send()
+    except Exception:
+        ok = False
+    if ok:
+        dedup.mark_delivered(event_id, channel)
+    else:
+        dedup.release(event_id, channel)
+    return ok
+
+
+class CountingSender:
+    def __init__(self, delay=0.05, fail_first=0):
+        self.sends = 0
+        self.fail_first = fail_first
+        self.delay = delay
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        time.sleep(self.delay) # Keep the send in flight while the duplicates arrive
+        with self._lock:
+            self.sends += 1
+            return self.sends > self.fail_first
+
+
+def replay_burst(dedups, sender, duplicates=20):
+    barrier = threading.Barrier(duplicates)
+
+    def one(i):
+        barrier.wait()
+        return deliver(dedups[i % len(dedups)], "evt-1", "email", sender)
+
+    with ThreadPoolExecutor(max_workers=duplicates) as pool:
+        return list(pool.map(one, range(duplicates)))
+
+
+def test_concurrent_duplicate_burst_sends_once(tmp_path):
+    dedup = DeliveryDedup(SqliteDeliveryStore(str(tmp_path / "dedup.sqlite3")))
+    sender = CountingSender()
+
+    replay_burst([dedup], sender)
+
+    assert sender.sends == 1
+
+
+def test_burst_across_instances_sharing_the_store_sends_once(tmp_path):
+    path = str(tmp_path / "dedup.sqlite3")
+    instances = [DeliveryDedup(SqliteDeliveryStore(path)) for _ in range(4)]
+    sender = CountingSender()
+
+    replay_burst(instances, sender)
+
+    assert sender.sends == 1
+
+
+def test_redelivery_after_success_is_skipped_on_a_fresh_instance(tmp_path):
+    path = str(tmp_path / "dedup.sqlite3")
+    sender = CountingSender(delay=0)
+    assert deliver(DeliveryDedup(SqliteDeliveryStore(path)), "evt-1", "email", sender)
+
+    restarted = DeliveryDedup(SqliteDeliveryStore(path))
+    assert restarted.claim("evt-1", "email") == delivery_dedup.DELIVERED
+    assert restarted.claim("evt-1", "push") == delivery_dedup.CLAIMED
+    assert sender.sends == 1
+
+
+def test_failed_send_releases_the_claim_for_the_retry(tmp_path):
+    dedup = DeliveryDedup(SqliteDeliveryStore(str(tmp_path / "dedup.sqlite3")))
+    sender = CountingSender(delay=0, fail_first=1)
+
+    assert not deliver(dedup, "evt-1", "email", sender)
+    assert deliver(dedup, "evt-1", "email", sender)
+    assert not deliver(dedup, "evt-1", "email", sender)
+    assert sender.sends == 2
+
+
+def test_abandoned_claim_lapses(tmp_path):
+    path = str(tmp_path / "dedup.sqlite3")
+    crashed = DeliveryDedup(SqliteDeliveryStore(path, claim_ttl=0.1))
+    assert crashed.claim("evt-1", "email") == delivery_dedup.CLAIMED
+
+    other = DeliveryDedup(SqliteDeliveryStore(path, claim_ttl=0.1))
+    assert other.claim("evt-1", "email") == delivery_dedup.IN_PROGRESS
+    time.sleep(0.15)
+    assert other.claim("evt-1", "email") == delivery_dedup.CLAIMED
+
+
+def test_memory_only_dedup_stops_concurrent_duplicates():
+    sender = CountingSender()
+    replay_burst([DeliveryDedup()], sender)
+    assert sender.sends == 1
+
+
+def test_deliver_channels_sends_a_duplicate_burst_once(tmp_path, monkeypatch):
+    for dependency in ("functions_framework", "firebase_admin", "jinja2", "google.cloud.firestore"):
+        pytest.importorskip(dependency)
+    main = load_function_module("sendNotification", "main", alias="main")
+    monkeypatch.setattr(main, "delivery_dedup", DeliveryDedup(SqliteDeliveryStore(str(tmp_path / "dedup.sqlite3"))))
+    sender = CountingSender()
+    barrier = threading.Barrier(20)
+
+    def one(_):
+        barrier.wait()
+        return main.deliver_channels("evt-1", {"email": sender})["email"]["status"]
+
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        statuses = list(pool.map(one, range(20)))
+
+    assert sender.sends == 1
+    assert statuses.count("sent") == 1
+    assert set(statuses) <= {"sent", "in_progress", "skipped"}
@@ -0,0 +1,142 @@
+import json
+
+import pytest
+
+from support import load_function_module, FakePubsubMessage
+
+pytest.importorskip("jinja2")
+
+digest = load_function_module("sendNotification", "digest")
+
+
+class Recorder:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.singles = []
+        self.digests = []
+        self.settled = []
+
+    def send_single(self, message_data, message_id):
+        self.singles.append(message_id)
+        if self.fail:
+            raise RuntimeError("SMTP down")
+
+    def send_digest(self, events):
+        self.digests.append([message_data["eventId"] for message_data in events])
+        if self.fail:
+            raise RuntimeError("SMTP down")
+
+    def on_settled(self, message, acked):
+        self.settled.append((message.message_id, acked))
+
+
+def booked(n, patient_id="patient-1"):
+    return FakePubsubMessage({"eventId": f"evt-{n}", "eventType": "appointmentBooked", "patientId": patient_id}, f"msg-{n}")
+
+
+def submit_all(buffer, messages):
+    for message in messages:
+        buffer.submit(message, json.loads(message.data))
+
+
+def wait_for_flushes(buffer):
+    buffer._flush_executor.shutdown(wait=True) # Digests run, then ack/nack and on_settled, on this pool
+
+
+def test_immediate_and_digested_messages_are_all_reported():
+    recorder = Recorder()
+    buffer = digest.DigestBuffer(recorder.send_single, recorder.send_digest, window=60, max_events=3,
+                                 on_settled=recorder.on_settled)
+    messages = [booked(n) for n in range(4)]
+
+    submit_all(buffer, messages) # The first goes out now; three more fill the window and flush early
+    wait_for_flushes(buffer)
+
+    assert recorder.digests == [["evt-1", "evt-2", "evt-3"]]
+    assert sorted(recorder.settled) == [(f"msg-{n}", True) for n in range(4)]
+    assert all(message.outcome == "ack" for message in messages)
+
+
+def test_failed_digest_nacks_and_reports_every_held_message():
+    recorder = Recorder()
+    buffer = digest.DigestBuffer(recorder.send_single, recorder.send_digest, window=60, max_events=2,
+                                 on_settled=recorder.on_settled)
+    submit_all(buffer, [booked(0)])
+    recorder.fail = True
+    held = [booked(1), booked(2)]
+    submit_all(buffer, held)
+    wait_for_flushes(buffer)
+
+    assert sorted(recorder.settled) == [("msg-0", True), ("msg-1", False), ("msg-2", False)]
+    assert [message.outcome for message in held] == ["nack", "nack"]
+
+
+def test_consumer_stats_count_messages_acked_by_the_digest(monkeypatch):
+    for dependency in ("functions_framework", "firebase_admin", "google.cloud.pubsub_v1", "google.cloud.firestore"):
+        pytest.importorskip(dependency)
+    load_function_module("sendNotification", "main", alias="main")
+    consumer = load_function_module("sendNotification", "consumer")
+    recorder = Recorder()
+    monkeypatch.setattr(consumer, "digest_buffer", digest.DigestBuffer(
+        recorder.send_single, recorder.send_digest, window=60, max_events=2, on_settled=consumer.record_settled))
+    monkeypatch.setattr(consumer, "stats", consumer.ConsumerStats())
+
+    messages = [booked(n) for n in range(3)]
+    for message in messages:
+        consumer.process_message(message)
+    wait_for_flushes(consumer.digest_buffer)
+
+    report = consumer.stats.report()
+    assert (report["acked"], report["nacked"]) == (3, 0)
+
+
+def test_digest_redelivered_after_push_failure_sends_one_email(monkeypatch):
+    for dependency in ("functions_framework", "firebase_admin", "google.cloud.firestore"):
+        pytest.importorskip(dependency)
+    main = load_function_module("sendNotification", "main", alias="main")
+    emails = []
+    pushes = []
+    push_fails = [True]
+
+    def fake_send_email(recipient, subject, html, text=None):
+        emails.append(recipient)
+        return True
+
+    def fake_push(patient_id, title, body, event_type):
+        pushes.append(patient_id)
+        return not push_fails.pop() if push_fails else True
+
+    monkeypatch.setattr(main, "delivery_dedup", main.create_dedup("memory"))
+    monkeypatch.setattr(main, "send_email", fake_send_email)
+    monkeypatch.setattr(main, "smtp_configured", lambda: True)
+    monkeypatch.setattr(main, "lookup_profile", lambda patient_id: {"firstName": "Ada"})
+    monkeypatch.setattr(main.push_sender, "send_to_patient", fake_push)
+    events = [dict(json.loads(booked(n).data), patientEmail="ada@example.com") for n in range(3)]
+
+    with pytest.raises(RuntimeError, match="push"):
+        main.handle_digest_events(events)
+    report = main.handle_digest_events(events) # Pub/Sub redelivers the held messages
+    main.handle_digest_events(events[1:] + [events[0]]) # ...and again, batched differently
+
+    assert emails == ["ada@example.com"]
+    assert pushes == ["patient-1", "patient-1"]
+    assert report["push"]["status"] == "sent"
+    assert "email" not in report # Every event's email was recorded, so the email isn't even rendered
+    for message_data in events:
+        # A single redelivery through the non-digest path is skipped too
+        assert main.handle_notification_event(message_data)["email"]["status"] == "skipped"
+
+
+def test_windows_closing_together_are_prefetched_once():
+    recorder = Recorder()
+    prefetched = []
+    buffer = digest.DigestBuffer(recorder.send_single, recorder.send_digest, window=60, max_events=10,
+                                 on_settled=recorder.on_settled, prefetch=prefetched.append)
+    submit_all(buffer, [booked(n, patient_id=f"patient-{n % 2}") for n in range(6)])
+
+    buffer._flush_due(digest.time.monotonic() + 61)
+    wait_for_flushes(buffer)
+
+    assert [[message_data["eventId"] for message_data in events] for events in prefetched] == [
+        ["evt-2", "evt-4", "evt-3", "evt-5"]]
+    assert sorted(recorder.digests) == [["evt-2", "evt-4"], ["evt-3", "evt-5"]]
@@ -0,0 +1,108 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from support import make_request
+
+pytest.importorskip("firebase_admin")
+pytest.importorskip("flask")
+
+from shared import firebase_auth
+
+
+@pytest.fixture
+def verifier(monkeypatch):
+    """The module's verifier with certificate checks replaced: a token decodes to its own uid."""
+    monkeypatch.setattr(firebase_auth.token_verifier, "_verify_locally",
+                        lambda id_token: {"uid": id_token, "sub": id_token, "exp": 4102444800})
+    monkeypatch.setattr(firebase_auth, "_stats_logged_at", float("-inf")) # Due on the first request
+    return firebase_auth.token_verifier
+
+
+def test_handlers_log_cache_stats_once_per_interval(verifier, monkeypatch, capsys):
+    monkeypatch.setattr(firebase_auth, "AUTH_STATS_LOG_INTERVAL", 3600)
+
+    for _ in range(3):
+        firebase_auth.verify_firebase_token(make_request(uid="patient-1"))
+
+    logs = [line for line in capsys.readouterr().out.splitlines() if line.startswith("Firebase token cache stats")]
+    assert len(logs) == 1
+
+
+def test_stats_are_logged_for_rejected_tokens_too(verifier, monkeypatch, capsys):
+    def reject(id_token):
+        raise ValueError("Token expired.")
+
+    monkeypatch.setattr(verifier, "_verify_locally", reject)
+    with pytest.raises(ValueError):
+        firebase_auth.verify_firebase_token(make_request(uid="patient-3"))
+    assert "Firebase token cache stats" in capsys.readouterr().out
+
+
+def test_interval_zero_disables_the_log(verifier, monkeypatch, capsys):
+    monkeypatch.setattr(firebase_auth, "AUTH_STATS_LOG_INTERVAL", 0)
+    firebase_auth.verify_firebase_token(make_request(uid="patient-4"))
+    assert "Firebase token cache stats" not in capsys.readouterr().out
+
+
+def test_repeated_token_is_a_cache_hit(verifier):
+    before = verifier.get_stats()["hits"]
+    firebase_auth.verify_firebase_token(make_request(uid="patient-2"))
+    firebase_auth.verify_firebase_token(make_request(uid="patient-2"))
+    assert verifier.get_stats()["hits"] == before + 1
+
+
+class FakeCertsEndpoint:
+    """Stands in for google_requests.Request(): serves `certs` with a max-age, or fails."""
+
+    def __init__(self, certs, max_age=60):
+        self.certs = certs
+        self.max_age = max_age
+        self.status = 200
+        self.fetches = 0
+
+    def __call__(self):
+        def request(url, method="GET"):
+            self.fetches += 1
+            return SimpleNamespace(status=self.status, headers={"cache-control": f"public, max-age={self.max_age}"},
+                                   data=json.dumps(self.certs).encode("utf-8"))
+        return request
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(firebase_auth.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_signing_certs_are_refetched_on_use_once_expired(monkeypatch, clock):
+    endpoint = FakeCertsEndpoint({"key-1": "cert-1"})
+    monkeypatch.setattr(firebase_auth.google_requests, "Request", endpoint)
+    cache = firebase_auth.SigningCertCache() # Background thread not started
+
+    assert cache.get() == {"key-1": "cert-1"}
+    clock[0] += 59
+    assert cache.get() == {"key-1": "cert-1"}
+    assert endpoint.fetches == 1
+
+    endpoint.certs = {"key-2": "cert-2"} # Google rotated the keys
+    clock[0] += 2
+    assert cache.get() == {"key-2": "cert-2"}
+    assert endpoint.fetches == 2
+
+
+def test_failed_cert_fetch_is_retried_after_a_pause(monkeypatch, clock):
+    endpoint = FakeCertsEndpoint({"key-1": "cert-1"})
+    endpoint.status = 503
+    monkeypatch.setattr(firebase_auth.google_requests, "Request", endpoint)
+    cache = firebase_auth.SigningCertCache()
+
+    assert cache.get() == {} # Callers fall back to the SDK
+    assert cache.get() == {}
+    assert endpoint.fetches == 1
+
+    endpoint.status = 200
+    clock[0] += cache.retry_seconds
+    assert cache.get() == {"key-1": "cert-1"}
@@ -0,0 +1,149 @@
+import os
+
+import pytest
+
+from support import load_function_module, FakePublisher
+
+pytest.importorskip("functions_framework")
+pytest.importorskip("google.cloud.pubsub_v1")
+
+# shared.events creates its PublisherClient at import; pointed at an emulator address it
+# needs no credentials and never connects, because the tests swap in FakePublisher.
+os.environ.setdefault("PUBSUB_EMULATOR_HOST", "localhost:8085")
+relay = load_function_module("outboxRelay")
+from shared import events, outbox
+
+
+@pytest.fixture
+def publisher(monkeypatch):
+    fake = FakePublisher()
+    monkeypatch.setattr(events, "publisher", fake)
+    return fake
+
+
+def enqueue(database, patient_events):
+    """Writes (patient_id, event_id) pairs to the outbox in order, as the booking functions do."""
+    conn = database.get_connection()
+    try:
+        with conn.cursor() as cur:
+            outbox.enqueue_events(cur, [
+                {"eventId": event_id, "patientId": patient_id, "eventType": "appointmentBooked"}
+                for patient_id, event_id in patient_events
+            ])
+        conn.commit()
+    finally:
+        database.release_connection(conn)
+
+
+def pending_event_ids(database):
+    conn = database.get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT event_id::text FROM appointment_event_outbox WHERE published_at IS NULL ORDER BY id;")
+            return [row[0] for row in cur.fetchall()]
+    finally:
+        database.release_connection(conn)
+
+
+def event_id(n):
+    return f"00000000-0000-0000-0000-{n:012d}"
+
+
+def drain_once(database, batch_size=100):
+    conn = database.get_connection()
+    try:
+        return relay.drain_once(conn, batch_size=batch_size)
+    finally:
+        database.release_connection(conn)
+
+
+def test_drain_once_publishes_in_outbox_order_and_marks_rows(database, publisher):
+    enqueue(database, [("alice", event_id(1)), ("bob", event_id(2)), ("alice", event_id(3))])
+
+    assert drain_once(database) == (3, 3)
+    assert publisher.event_ids() == [event_id(1), event_id(2), event_id(3)]
+    assert publisher.event_ids("alice") == [event_id(1), event_id(3)]
+    assert pending_event_ids(database) == []
+    assert drain_once(database) == (0, 0)
+
+
+def test_failure_holds_back_that_patients_later_events_only(database, publisher):
+    enqueue(database, [
+        ("alice", event_id(1)), ("alice", event_id(2)), ("bob", event_id(3)), ("alice", event_id(4)),
+    ])
+    publisher.fail_event_ids = {event_id(2)}
+
+    assert drain_once(database) == (4, 2)
+    assert publisher.event_ids() == [event_id(1), event_id(3)]
+    assert pending_event_ids(database) == [event_id(2), event_id(4)]
+
+    # The ordering key was resumed, so the next round re-sends alice's events in order
+    publisher.fail_event_ids = set()
+    assert drain_once(database) == (2, 2)
+    assert publisher.event_ids("alice") == [event_id(1), event_id(2), event_id(4)]
+
+
+def test_held_back_event_is_not_marked_even_if_its_publish_succeeded(database, publisher, monkeypatch):
+    enqueue(database, [("alice", event_id(1)), ("alice", event_id(2))])
+    # A publish that failed without pausing the key: the later event still goes out
+    monkeypatch.setattr(events, "publish_batch", lambda messages: [False, True])
+
+    assert drain_once(database) == (2, 0)
+    assert pending_event_ids(database) == [event_id(1), event_id(2)]
+
+
+def test_drain_once_backs_off_while_another_relay_holds_the_lock(database, publisher):
+    enqueue(database, [("alice", event_id(1))])
+    holder = database.get_connection()
+    try:
+        with holder.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s);", (relay.OUTBOX_ADVISORY_LOCK_ID,))
+        assert drain_once(database) is None
+    finally:
+        holder.rollback()
+        database.release_connection(holder)
+
+    assert drain_once(database) == (1, 1)
+
+
+def test_drain_stops_after_a_partial_batch(database, publisher, monkeypatch):
+    monkeypatch.setattr(relay, "OUTBOX_BATCH_SIZE", 2)
+    enqueue(database, [("alice", event_id(n)) for n in range(1, 6)])
+    publisher.fail_event_ids = {event_id(3)}
+
+    conn = database.get_connection()
+    try:
+        assert relay.drain(conn) == 2
+    finally:
+        database.release_connection(conn)
+    assert pending_event_ids(database) == [event_id(3), event_id(4), event_id(5)]
+
+
+class StopRelay(Exception):
+    pass
+
+
+def test_run_forever_survives_a_failed_connection(database, publisher, monkeypatch):
+    enqueue(database, [("alice", event_id(1))])
+    get_connection = relay.db.get_connection
+    attempts = []
+
+    def flaky_get_connection():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise relay.psycopg2.OperationalError("server closed the connection unexpectedly")
+        return get_connection()
+
+    def wait_for_notify(*args):
+        if len(attempts) == 2:
+            raise StopRelay() # Second round done
+        return [], [], []
+
+    monkeypatch.setattr(relay.db, "get_connection", flaky_get_connection)
+    monkeypatch.setattr(relay.select, "select", wait_for_notify)
+    monkeypatch.setattr(relay.time, "sleep", lambda seconds: None)
+
+    with pytest.raises(StopRelay):
+        relay.run_forever()
+    assert pending_event_ids(database) == []
+    assert publisher.event_ids() == [event_id(1)]
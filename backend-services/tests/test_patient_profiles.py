@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("google.cloud.firestore")
+
+from shared import patient_profiles
+
+
+class FakeQuery:
+    """Captures the listener callback so the test can deliver snapshot changes."""
+
+    def __init__(self):
+        self.callback = None
+
+    def on_snapshot(self, callback):
+        self.callback = callback
+        return SimpleNamespace(unsubscribe=lambda: None)
+
+    def deliver(self, *uids):
+        changes = [SimpleNamespace(document=SimpleNamespace(id=uid)) for uid in uids]
+        self.callback([change.document for change in changes], changes, None)
+
+
+@pytest.fixture
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(patient_profiles, "cache", patient_profiles.ProfileCache(max_size=3, ttl=60))
+    monkeypatch.setattr(patient_profiles, "_listener", None)
+    return patient_profiles.cache
+
+
+def test_listener_evicts_changed_profiles(fresh_cache):
+    fresh_cache.put("alice", {"firstName": "Alice"})
+    fresh_cache.put("bob", {"firstName": "Bob"})
+    query = FakeQuery()
+    patient_profiles.start_invalidation_listener(query)
+
+    query.deliver("alice")
+
+    assert fresh_cache.get("alice") is None
+    assert fresh_cache.get("bob") == {"firstName": "Bob"}
+    assert fresh_cache.stats["invalidations"] == 1
+
+
+def test_listener_is_started_once(fresh_cache):
+    first = patient_profiles.start_invalidation_listener(FakeQuery())
+    assert patient_profiles.start_invalidation_listener(FakeQuery()) is first
+
+
+def test_cache_is_bounded_and_expires(fresh_cache, monkeypatch):
+    for uid in ("a", "b", "c", "d"):
+        fresh_cache.put(uid, {"uid": uid})
+    assert fresh_cache.get("a") is None # Least recently used, evicted at max_size
+
+    now = patient_profiles.time.monotonic()
+    monkeypatch.setattr(patient_profiles.time, "monotonic", lambda: now + 61)
+    assert fresh_cache.get("d") is None
+
+
+class FakeFirestore:
+    """collection().document() and get_all(), recording the size of each get_all batch."""
+
+    def __init__(self, profiles):
+        self.profiles = profiles
+        self.batches = []
+
+    def collection(self, name):
+        return SimpleNamespace(document=lambda uid: uid)
+
+    def get_all(self, uids, field_paths=None):
+        self.batches.append(len(uids))
+        return [SimpleNamespace(id=uid, exists=uid in self.profiles, to_dict=lambda uid=uid: self.profiles[uid])
+                for uid in uids]
+
+
+def test_get_profiles_reads_missing_profiles_in_batches(monkeypatch):
+    monkeypatch.setattr(patient_profiles, "cache", patient_profiles.ProfileCache(max_size=1000, ttl=60))
+    firestore = FakeFirestore({f"p{i}": {"firstName": f"P{i}"} for i in range(200)})
+    monkeypatch.setattr(patient_profiles, "_client", firestore)
+    uids = [f"p{i}" for i in range(250)]
+
+    profiles = patient_profiles.get_profiles(uids + uids[:10]) # Duplicates are read once
+    again = patient_profiles.get_profiles(uids)
+
+    assert firestore.batches == [100, 100, 50]
+    assert profiles["p0"] == {"firstName": "P0"} and profiles["p249"] is None
+    assert again == profiles
+    stats = patient_profiles.get_cache_stats()
+    assert (stats["reads"], stats["size"]) == (250, 250)
@@ -0,0 +1,77 @@
+import pytest
+
+from support import load_function_module, FakeMessaging, FakeTokenRegistry
+
+pytest.importorskip("firebase_admin")
+pytest.importorskip("google.cloud.firestore")
+
+push = load_function_module("sendNotification", "push")
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(push, "PUSH_RETRY_BACKOFF_SECONDS", 0)
+
+
+def sender(tokens, **fake_options):
+    backend = FakeMessaging(**fake_options)
+    registry = FakeTokenRegistry({"patient-1": tokens})
+    return push.PushSender(backend=backend, token_registry=registry), backend, registry
+
+
+def test_multicast_batches_up_to_the_api_limit():
+    tokens = [f"token-{i}" for i in range(1200)]
+    push_sender, backend, _ = sender(tokens)
+
+    assert push_sender.send_to_patient("patient-1", "Title", "Body", "appointmentBooked")
+    assert [len(call) for call in backend.calls] == [500, 500, 200]
+    assert len(backend.delivered) == 1200
+
+
+def test_invalid_tokens_are_pruned_not_retried():
+    push_sender, backend, registry = sender(["good", "gone"], invalid={"gone"})
+
+    assert push_sender.send_to_patient("patient-1", "Title", "Body", "appointmentBooked")
+    assert registry.get_tokens("patient-1") == ["good"]
+    assert backend.calls == [["good", "gone"]]
+
+
+def test_only_failed_tokens_are_retried():
+    push_sender, backend, _ = sender(["a", "b", "c"], flaky={"b": 1})
+
+    assert push_sender.send_to_patient("patient-1", "Title", "Body", "appointmentBooked")
+    assert backend.calls == [["a", "b", "c"], ["b"]]
+    assert sorted(token for token, _ in backend.delivered) == ["a", "b", "c"]
+
+
+def test_devices_that_keep_failing_do_not_cause_a_redelivery_once_others_got_it():
+    push_sender, backend, _ = sender(["a", "b"], flaky={"b": 10})
+
+    assert push_sender.send_to_patient("patient-1", "Title", "Body", "appointmentBooked")
+    assert [token for token, _ in backend.delivered] == ["a"] # Never pushed twice
+    assert push_sender.get_stats()["failed"] == 1
+
+
+def test_total_failure_asks_for_a_redelivery():
+    push_sender, backend, _ = sender(["a", "b"], flaky={"a": 10, "b": 10})
+
+    assert not push_sender.send_to_patient("patient-1", "Title", "Body", "appointmentBooked")
+    assert backend.delivered == []
+
+
+
+def test_a_failed_multicast_call_retries_its_devices():
+    push_sender, backend, _ = sender(["a", "b"])
+    send_each_for_multicast = backend.send_each_for_multicast
+    outages = [ConnectionError("connection reset")]
+
+    def flaky_call(message):
+        if outages:
+            raise outages.pop()
+        return send_each_for_multicast(message)
+
+    backend.send_each_for_multicast = flaky_call
+
+    assert push_sender.send_to_patient("patient-1", "Title", "Body", "appointmentBooked")
+    assert sorted(token for token, _ in backend.delivered) == ["a", "b"]
+    assert push_sender.get_stats()["retried"] == 2
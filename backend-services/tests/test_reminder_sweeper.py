@@ -0,0 +1,94 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from support import load_function_module, FakePublisher
+
+pytest.importorskip("functions_framework")
+pytest.importorskip("google.cloud.pubsub_v1")
+
+# shared.events creates its PublisherClient at import; see test_outbox_relay.py
+os.environ.setdefault("PUBSUB_EMULATOR_HOST", "localhost:8085")
+sweeper = load_function_module("reminderSweeper")
+from shared import events
+
+WINDOWS = [("24h", timedelta(hours=24))]
+
+
+@pytest.fixture
+def publisher(monkeypatch):
+    fake = FakePublisher()
+    monkeypatch.setattr(events, "publisher", fake)
+    return fake
+
+
+def seed_due_appointments(database, count):
+    """`count` appointments for different patients, all inside the current 24h window. Returns their ids."""
+    window_end = datetime.now(sweeper.CLINIC_TIMEZONE).replace(tzinfo=None, second=0, microsecond=0) + timedelta(hours=24)
+    conn = database.get_connection()
+    try:
+        with conn.cursor() as cur:
+            ids = []
+            for i in range(count):
+                starts_at = window_end - timedelta(minutes=2 + i)
+                cur.execute("""
+                    INSERT INTO appointments (patient_id, patient_email, appointment_date, appointment_time, service_type)
+                    VALUES (%s, %s, %s, %s, 'Physiotherapy') RETURNING id;
+                """, (f"patient-{i}", f"patient-{i}@example.com", starts_at.date(), starts_at.time()))
+                ids.append(cur.fetchone()[0])
+        conn.commit()
+        return ids
+    finally:
+        database.release_connection(conn)
+
+
+def sweep(database):
+    read_conn = database.get_connection()
+    write_conn = database.get_connection()
+    try:
+        return sweeper.sweep(read_conn, write_conn, windows=WINDOWS)
+    finally:
+        database.release_connection(read_conn)
+        database.release_connection(write_conn)
+
+
+def reminder_ids(appointment_ids):
+    return [sweeper.reminder_event_id(appointment_id, "24h") for appointment_id in appointment_ids]
+
+
+def test_rerun_of_the_same_window_sends_no_duplicates(database, publisher):
+    appointment_ids = seed_due_appointments(database, 3)
+
+    assert sweep(database) == {"24h": {"due": 3, "published": 3}}
+    assert sweep(database) == {"24h": {"due": 0, "published": 0}}
+    assert sorted(publisher.event_ids()) == sorted(reminder_ids(appointment_ids))
+
+
+def test_due_rows_are_published_in_batch_size_chunks(database, publisher, monkeypatch):
+    monkeypatch.setattr(sweeper, "REMINDER_BATCH_SIZE", 2)
+    batches = []
+    publish_batch = events.publish_batch
+
+    def recording_publish_batch(messages):
+        batches.append(len(messages))
+        return publish_batch(messages)
+
+    monkeypatch.setattr(events, "publish_batch", recording_publish_batch)
+    seed_due_appointments(database, 5)
+
+    assert sweep(database) == {"24h": {"due": 5, "published": 5}}
+    assert batches == [2, 2, 1]
+
+
+def test_failed_publish_is_left_for_the_next_run(database, publisher):
+    appointment_ids = seed_due_appointments(database, 3)
+    failed = reminder_ids(appointment_ids[1:2])
+    publisher.fail_event_ids = set(failed)
+
+    assert sweep(database) == {"24h": {"due": 3, "published": 2}}
+
+    publisher.fail_event_ids = set()
+    assert sweep(database) == {"24h": {"due": 1, "published": 1}}
+    assert publisher.event_ids()[-1:] == failed
+    assert sorted(publisher.event_ids()) == sorted(reminder_ids(appointment_ids))
@@ -0,0 +1,89 @@
+import json
+import random
+import threading
+from datetime import date, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from support import load_http_function, make_request
+
+pytest.importorskip("functions_framework")
+pytest.importorskip("firebase_admin")
+
+book = load_http_function("bookAppointment")
+
+SLOT_DATE = (date.today() + timedelta(days=7)).isoformat()
+
+
+def book_slot(uid, appointment_time, service_type="Physiotherapy"):
+    body, status, _ = book.book_appointment(make_request({
+        "patientId": uid,
+        "appointmentDate": SLOT_DATE,
+        "appointmentTime": appointment_time,
+        "serviceType": service_type,
+    }, uid=uid))
+    return status, json.loads(body)
+
+
+def active_bookings_per_slot(database):
+    conn = database.get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT appointment_date, appointment_time, count(*)
+                FROM appointments WHERE status != 'cancelled'
+                GROUP BY 1, 2;
+            """)
+            return cur.fetchall()
+    finally:
+        database.release_connection(conn)
+
+
+def test_racing_patients_get_one_booking_per_slot(database):
+    barrier = threading.Barrier(20)
+
+    def attempt(i):
+        barrier.wait()
+        return book_slot(f"patient-{i}", "10:00")
+
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        results = list(pool.map(attempt, range(20)))
+
+    statuses = [status for status, _ in results]
+    assert statuses.count(200) == 1
+    assert statuses.count(409) == 19
+    conflict = next(body for status, body in results if status == 409)
+    assert conflict["alternatives"]
+    assert {"appointmentDate": SLOT_DATE, "appointmentTime": "10:00"} not in conflict["alternatives"]
+
+
+def test_same_slot_under_another_service_is_rejected(database):
+    assert book_slot("patient-a", "11:00", "Physiotherapy")[0] == 200
+    assert book_slot("patient-b", "11:00", "Dentistry")[0] == 409
+
+
+def test_availability_and_booking_agree(database):
+    available = load_http_function("getAvailableAppointments")
+    assert book_slot("patient-a", "09:30", "Dentistry")[0] == 200
+
+    body, status, _ = available.get_available_appointments(make_request({"date": SLOT_DATE}, uid="patient-b"))
+    assert status == 200
+    assert "09:30" not in json.loads(body)["slots"]
+
+    body, status, _ = available.get_available_appointments(make_request(
+        {"startDate": SLOT_DATE, "endDate": SLOT_DATE, "serviceType": "Physiotherapy"}, uid="patient-b"
+    ))
+    assert "09:30" not in json.loads(body)["days"][SLOT_DATE]
+
+
+def test_contention_over_many_slots_has_zero_double_bookings(database):
+    times = ["09:00", "09:30", "10:00", "10:30", "11:00", "11:30"]
+    rng = random.Random(4)
+    attempts = [(f"patient-{i}", rng.choice(times), rng.choice(["Physiotherapy", "Dentistry"])) for i in range(120)]
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(lambda a: book_slot(*a)[0], attempts))
+
+    assert results.count(200) == len(set(t for _, t, _ in attempts))
+    assert all(count == 1 for _, _, count in active_bookings_per_slot(database))
@@ -0,0 +1,74 @@
+import smtplib
+import socket
+
+import pytest
+
+from support import load_function_module, LocalSmtpServer
+
+for dependency in ("functions_framework", "firebase_admin", "jinja2", "google.cloud.firestore", "aiosmtpd", "cryptography"):
+    pytest.importorskip(dependency)
+
+main = load_function_module("sendNotification", "main", alias="main")
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    with LocalSmtpServer(refuse={"nobody@example.com"}) as server:
+        # main reads its SMTP settings at import; point them at this server
+        monkeypatch.setattr(main, "SMTP_HOST", "localhost")
+        monkeypatch.setattr(main, "SMTP_PORT", server.port)
+        monkeypatch.setattr(main, "SMTP_USERNAME", "test")
+        monkeypatch.setattr(main, "SMTP_PASSWORD", "test")
+        monkeypatch.setattr(main, "SENDER_EMAIL", "clinic@example.com")
+        yield server
+
+
+def message(recipient):
+    return main.build_email_message(recipient, "Appointment reminder", "<p>See you tomorrow.</p>", "See you tomorrow.")
+
+
+def test_refused_recipient_is_attempted_once(smtp_server):
+    session = main.SmtpSession()
+
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        session.send(message("nobody@example.com"))
+
+    assert smtp_server.recipient_attempts == 1
+    assert session.stats["connects"] == 1
+    assert session.stats["reconnects"] == 0
+
+    # The session is still usable for the next message
+    session.send(message("patient@example.com"))
+    assert smtp_server.messages == 1
+    assert session.stats["connects"] == 1
+
+
+def test_connection_dropped_before_data_is_resent_once(smtp_server):
+    session = main.SmtpSession()
+    session.send(message("patient@example.com"))
+    session._server.sock.shutdown(socket.SHUT_RDWR) # The connection dropped while idle
+
+    session.send(message("patient@example.com"))
+
+    assert smtp_server.messages == 2
+    assert session.stats["reconnects"] == 1
+    assert smtp_server.connections == 2
+
+
+def test_connection_dropped_during_data_is_not_resent(smtp_server, monkeypatch):
+    session = main.SmtpSession()
+    session.send(message("patient@example.com"))
+    original_send = session._server.send
+
+    def drop_after_data(data):
+        if session._server.data_started:
+            session._server.sock.shutdown(socket.SHUT_RDWR)
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        return original_send(data)
+
+    monkeypatch.setattr(session._server, "send", drop_after_data)
+
+    with pytest.raises(smtplib.SMTPServerDisconnected):
+        session.send(message("patient@example.com"))
+    assert session.stats["reconnects"] == 0
+    assert smtp_server.recipient_attempts == 2 # One per message: the second wasn't retried
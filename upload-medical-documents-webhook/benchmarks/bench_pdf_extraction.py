@@ -0,0 +1,125 @@
+"""
+Wall time and peak memory of PDF text extraction for 1, 10 and 100-page reports.
+Compares pdf_extraction.extract_pdf_text on one process and with the process
+pool against the extraction it replaced (whole file in a BytesIO, extract_text()
+twice per page, first 5 pages only). Each measurement runs in a fresh process, so
+peak RSS is not inherited from an earlier run.
+
+    python benchmarks/bench_pdf_extraction.py --pages 1 10 100
+
+Fixture PDFs (text-only lab reports, about 3 KB of text per page) are generated
+into a temporary directory. Needs pdfplumber.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+from pathlib import Path
+
+WEBHOOK_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(WEBHOOK_DIR))
+
+LINES_PER_PAGE = 45
+
+
+def write_fixture_pdf(path, pages):
+    """A minimal valid PDF with `pages` pages of Helvetica text, written without a PDF library."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page in range(pages):
+        lines = [f"Patient 4711  Report page {page + 1}  Test {line:02d}: haemoglobin {120 + line} g/L, "
+                 f"reference 115-165, sample taken 2026-10-{1 + line % 28:02d}" for line in range(LINES_PER_PAGE)]
+        stream = "BT /F1 8 Tf 36 800 Td 10 TL " + " ".join(f"({line}) Tj T*" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        content_id = len(objects)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>")
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {pages} >>"
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1"))
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode("latin-1"))
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1"))
+    Path(path).write_bytes(out.getvalue())
+
+
+def legacy_extract(path):
+    """The extraction before pdf_extraction.py, fed the download as bytes like the old webhook."""
+    import pdfplumber
+    pdf_bytes = Path(path).read_bytes()
+    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+        text = "\n".join([page.extract_text() for page in pdf.pages[:5] if page.extract_text()])
+        page_count = len(pdf.pages)
+    return text, page_count, page_count > 5
+
+
+def measure(variant, path):
+    """Runs in a child process: one extraction, then its wall time and peak RSS as JSON."""
+    if variant == "sequential":
+        os.environ["PDF_EXTRACT_WORKERS"] = "1"
+    elif variant == "pool":
+        # At least two workers, so the pool path runs even on a single-CPU machine
+        os.environ.setdefault("PDF_EXTRACT_WORKERS", str(max(2, os.cpu_count() or 1)))
+    os.environ["PDF_MAX_PAGES"] = "1000" # Larger than any fixture, so the budgets don't cut the 100-page run
+    import pdf_extraction
+
+    started = time.perf_counter()
+    if variant == "legacy":
+        text, page_count, truncated = legacy_extract(path)
+    else:
+        text, page_count, truncated = pdf_extraction.extract_pdf_text(path)
+    elapsed = time.perf_counter() - started
+    if pdf_extraction._pool is not None:
+        pdf_extraction._pool.shutdown() # Reap the workers so RUSAGE_CHILDREN covers them
+
+    kilobytes = 1 if sys.platform != "darwin" else 1 / 1024 # ru_maxrss is KB on Linux, bytes on macOS
+    return {
+        "seconds": round(elapsed, 3),
+        "chars": len(text),
+        "truncated": truncated,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * kilobytes / 1024, 1),
+        "peak_worker_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * kilobytes / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--variants", nargs="+", default=["legacy", "sequential", "pool"])
+    parser.add_argument("--measure", nargs=2, metavar=("VARIANT", "PDF"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        result = measure(*args.measure)
+        sys.stdout.write("\n" + json.dumps(result) + "\n")
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="pdf-bench-") as directory:
+        for pages in args.pages:
+            path = os.path.join(directory, f"report-{pages}.pdf")
+            write_fixture_pdf(path, pages)
+            for variant in args.variants:
+                child = subprocess.run([sys.executable, __file__, "--measure", variant, path],
+                                       capture_output=True, text=True, check=True, cwd=WEBHOOK_DIR)
+                result = json.loads(child.stdout.strip().splitlines()[-1])
+                results.append(dict({"pages": pages, "file_kb": os.path.getsize(path) // 1024, "variant": variant}, **result))
+    print(json.dumps({"cpus": os.cpu_count(), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import os
+import json
+import hashlib
+import datetime
+from tempfile import SpooledTemporaryFile
+from urllib.parse import unquote
+from flask import Request
+from google.cloud import storage
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+BUCKET_NAME = "upload-documents-report1"
+
+# Uploaded files are stored once, under the SHA-256 of their content. The index holds
+# one small JSON object per hash with metadata filled in as we learn it (MIME type at
+# upload, page count and extracted-text location once the webhook has read the file).
+DOCUMENTS_PREFIX = "documents/"
+INDEX_PREFIX = "index/"
+EXTRACTED_TEXT_PREFIX = "extracted/"
+
+# Resumable uploads send the file in chunks of this size, so memory per upload stays
+# at about one chunk. GCS requires a multiple of 256 KiB.
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024)) // (256 * 1024) * (256 * 1024) or 256 * 1024
+
+# Werkzeug parses the whole multipart body (into the spool below) before the upload
+# to GCS starts, and Cloud Run's /tmp is in memory, so /upload is capped at this size.
+# Larger files must go straight to the bucket through /upload-url.
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", 32)) * 1024 * 1024
+
+# Multipart file parts bigger than this are spooled to a temp file instead of memory
+UPLOAD_SPOOL_MAX_MEMORY = int(os.getenv("UPLOAD_SPOOL_MAX_MEMORY", 512 * 1024))
+
+# One client per process: it holds the authenticated HTTP session and connection pool
+storage_client = storage.Client()
+bucket = storage_client.bucket(BUCKET_NAME)
+
+
+class HashingSpooledFile(SpooledTemporaryFile):
+    """Temp file that hashes everything written to it, so the digest is ready when parsing ends."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return super().write(data)
+
+
+class HashingRequest(Request):
+    """Flask request whose uploaded files are SHA-256 hashed while the body streams in."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingSpooledFile(max_size=UPLOAD_SPOOL_MAX_MEMORY)
+
+
+def public_url(object_name):
+    return f"https://storage.googleapis.com/{BUCKET_NAME}/{object_name}"
+
+
+def object_name_from_url(file_url):
+    """Object name if the URL points into our bucket (public or gs:// form), else None."""
+    for prefix in (public_url(""), f"gs://{BUCKET_NAME}/"):
+        if file_url and file_url.startswith(prefix):
+            return unquote(file_url[len(prefix):].split('?', 1)[0]) or None
+    return None
+
+
+def document_object_name(sha256_hex, filename):
+    extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else 'bin'
+    return f"{DOCUMENTS_PREFIX}{sha256_hex}.{extension}"
+
+
+def is_sha256(value):
+    return isinstance(value, str) and len(value) == 64 and all(c in "0123456789abcdef" for c in value)
+
+
+def sha256_from_url(file_url):
+    """The content hash of one of our documents URLs, or None for any other URL."""
+    prefix = public_url(DOCUMENTS_PREFIX)
+    if not file_url or not file_url.startswith(prefix):
+        return None
+    digest = file_url[len(prefix):].split('.', 1)[0]
+    return digest if is_sha256(digest) else None
+
+
+def read_index(sha256_hex):
+    try:
+        return json.loads(bucket.blob(f"{INDEX_PREFIX}{sha256_hex}.json").download_as_bytes())
+    except NotFound:
+        return None
+
+
+def update_index(sha256_hex, **fields):
+    """Merges fields into the hash's index entry (small JSON object next to the documents)."""
+    entry = read_index(sha256_hex) or {"sha256": sha256_hex}
+    entry.update(fields)
+    bucket.blob(f"{INDEX_PREFIX}{sha256_hex}.json").upload_from_string(
+        json.dumps(entry), content_type="application/json"
+    )
+    return entry
+
+
+def store_upload(file_obj, filename):
+    """
+    Stores an uploaded file under its content hash. The hash was computed while the
+    request body streamed in (see HashingRequest), so an existing copy is found with a
+    single metadata lookup and nothing is re-uploaded. New files are sent as a chunked
+    resumable upload with CRC32C verification (DataCorruption on mismatch).
+    Returns (file_url, index_entry, deduplicated).
+    """
+    stream = file_obj.stream
+    sha256_hex = stream.sha256.hexdigest()
+    object_name = document_object_name(sha256_hex, filename)
+    blob = bucket.blob(object_name, chunk_size=UPLOAD_CHUNK_SIZE)
+
+    if blob.exists():
+        return public_url(object_name), read_index(sha256_hex), True
+
+    stream.seek(0)
+    try:
+        # if_generation_match=0: only create, so two concurrent uploads of the same file can't both write
+        blob.upload_from_file(stream, content_type=file_obj.content_type, checksum="crc32c", if_generation_match=0)
+    except PreconditionFailed:
+        return public_url(object_name), read_index(sha256_hex), True
+
+    entry = update_index(
+        sha256_hex,
+        objectName=object_name,
+        mimeType=file_obj.content_type,
+        size=stream.size,
+        crc32c=blob.crc32c,
+        originalFilename=filename,
+        uploadedAt=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    )
+    return public_url(object_name), entry, False
+
+
+def read_extracted_text(entry):
+    """Previously extracted text of an indexed document, or None."""
+    if not entry or not entry.get("textObject"):
+        return None
+    try:
+        return bucket.blob(entry["textObject"]).download_as_text()
+    except NotFound:
+        return None
+
+
+def save_extracted_text(sha256_hex, text, page_count=None):
+    """Stores extracted text next to the document so later webhooks skip extraction."""
+    text_object = f"{EXTRACTED_TEXT_PREFIX}{sha256_hex}.txt"
+    bucket.blob(text_object).upload_from_string(text, content_type="text/plain; charset=utf-8")
+    fields = {"textObject": text_object, "textChars": len(text)}
+    if page_count is not None:
+        fields["pageCount"] = page_count
+    return update_index(sha256_hex, **fields)
+
+
+def find_document(sha256_hex, filename):
+    """Object name of an already stored document with this hash, or None."""
+    object_name = document_object_name(sha256_hex, filename)
+    return object_name if bucket.blob(object_name).exists() else None
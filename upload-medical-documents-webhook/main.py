@@ -1,20 +1,34 @@
 import os
-import io
 import json
+import tempfile
+import datetime
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-from google.cloud import storage
+from google.resumable_media import DataCorruption
+from google.api_core.exceptions import NotFound
+import google.auth
+import google.auth.credentials
+from google.auth.transport import requests as google_auth_requests
 import google.generativeai as genai
 import requests
-import pdfplumber
+from requests.adapters import HTTPAdapter
+import uuid
+import hashlib
+import time
+import documents
+import pdf_extraction
+from documents import bucket, public_url
+from summary_cache import summary_cache, cache_key
 
 app = Flask(__name__)
+app.request_class = documents.HashingRequest # Uploaded files are hashed while they stream in
+app.config['MAX_CONTENT_LENGTH'] = documents.MAX_UPLOAD_BYTES # Bigger requests get a 413 before any body is read
 
 CORS(app, origins=["https://healthcare-poc-477108.web.app"])
 
-BUCKET_NAME = "upload-documents-report1"
 ALLOWED_EXTENSIONS = {'pdf', 'txt', 'doc', 'docx', 'png', 'jpg', 'jpeg'}
+SIGNED_URL_EXPIRY_MINUTES = int(os.getenv("SIGNED_URL_EXPIRY_MINUTES", 15))
 
 GENAI_API_KEY = os.getenv("GEMINI_API_KEY")
 if GENAI_API_KEY:
@@ -37,20 +51,117 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def upload_to_gcs(file_obj, filename):
-    client = storage.Client()
-    bucket = client.bucket(BUCKET_NAME)
-    blob = bucket.blob(filename)
-    blob.upload_from_file(file_obj, content_type=file_obj.content_type)
-    return f"https://storage.googleapis.com/{BUCKET_NAME}/{filename}"
+_signing_credentials = None
 
 
-def extract_text_from_pdf_bytes(pdf_bytes):
-    print("Starting PDF extraction...")
-    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-        text = "\n".join([page.extract_text() for page in pdf.pages[:5] if page.extract_text()])
-    print(f"Extracted text from PDF ({len(text)} chars)")
-    return text
+def signing_credentials():
+    """
+    Cloud Run's default credentials have no private key, so V4 URLs are signed
+    through the IAM signBlob API using the service account's access token.
+    With a key file (local runs) the storage client signs locally instead.
+    """
+    global _signing_credentials
+    if _signing_credentials is None:
+        _signing_credentials, _ = google.auth.default(scopes=["https://www.googleapis.com/auth/cloud-platform"])
+    if isinstance(_signing_credentials, google.auth.credentials.Signing):
+        return {}
+    if not _signing_credentials.valid:
+        _signing_credentials.refresh(google_auth_requests.Request())
+    return {"service_account_email": _signing_credentials.service_account_email,
+            "access_token": _signing_credentials.token}
+
+
+def unique_object_name(filename):
+    # Direct uploads can't be content-addressed (GCS doesn't verify a client-supplied
+    # SHA-256), so they get a collision-free random name instead
+    return f"uploads/{uuid.uuid4().hex}_{secure_filename(filename)}"
+
+
+# --- Report downloads ---
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_REPORT_BYTES = int(os.getenv("MAX_REPORT_MB", 25)) * 1024 * 1024 # Larger reports are refused, not downloaded
+FETCH_CONNECT_TIMEOUT = float(os.getenv("FETCH_CONNECT_TIMEOUT", 5))
+FETCH_READ_TIMEOUT = float(os.getenv("FETCH_READ_TIMEOUT", 30)) # Per read, not for the whole download
+
+# Reports from other hosts: one pooled session so connections (and TLS) are reused.
+# Pool size matches gunicorn's thread count.
+http_session = requests.Session()
+http_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+http_session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
+
+class ReportTooLarge(Exception):
+    pass
+
+
+def _hash_file(tmp):
+    digest = hashlib.sha256()
+    tmp.seek(0)
+    for chunk in iter(lambda: tmp.read(DOWNLOAD_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    tmp.seek(0)
+    return digest.hexdigest()
+
+
+def _download_from_bucket(object_name, tmp):
+    """Reads one of our own objects through the storage client (no public-URL round trip)."""
+    blob = bucket.get_blob(object_name)
+    if blob is None:
+        return 404, None
+    if blob.size is not None and blob.size > MAX_REPORT_BYTES:
+        raise ReportTooLarge(f"Report is larger than {MAX_REPORT_BYTES // (1024 * 1024)} MB")
+    # Pinning the generation means a concurrent overwrite can't mix two versions
+    blob.download_to_file(tmp, if_generation_match=blob.generation, checksum="crc32c",
+                          timeout=(FETCH_CONNECT_TIMEOUT, FETCH_READ_TIMEOUT))
+    tmp.flush()
+    return 200, _hash_file(tmp)
+
+
+def _download_over_http(file_url, tmp):
+    digest = hashlib.sha256()
+    size = 0
+    with http_session.get(file_url, stream=True, timeout=(FETCH_CONNECT_TIMEOUT, FETCH_READ_TIMEOUT)) as response:
+        if response.status_code != 200:
+            return response.status_code, None
+        if int(response.headers.get("Content-Length") or 0) > MAX_REPORT_BYTES:
+            raise ReportTooLarge(f"Report is larger than {MAX_REPORT_BYTES // (1024 * 1024)} MB")
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > MAX_REPORT_BYTES:
+                raise ReportTooLarge(f"Report is larger than {MAX_REPORT_BYTES // (1024 * 1024)} MB")
+            digest.update(chunk)
+            tmp.write(chunk)
+    tmp.flush()
+    tmp.seek(0)
+    return 200, digest.hexdigest()
+
+
+def download_to_tempfile(file_url, tmp):
+    """
+    Streams a report into `tmp` so it is never held in memory. URLs into our own bucket
+    are read directly with the shared storage client; anything else goes through the
+    pooled HTTP session. Both have timeouts and the MAX_REPORT_MB limit.
+    Returns (HTTP status, content SHA-256 or None).
+    """
+    object_name = documents.object_name_from_url(file_url)
+    if object_name:
+        try:
+            return _download_from_bucket(object_name, tmp)
+        except NotFound:
+            return 404, None
+    return _download_over_http(file_url, tmp)
+
+
+def extract_report_text(file_url, tmp):
+    """Returns (text, page count or None) of a downloaded report, within the PDF_MAX_* budgets."""
+    if file_url.lower().endswith('.pdf'):
+        text, page_count, _ = pdf_extraction.extract_pdf_text(tmp.name)
+        return text, page_count
+    # Up to 4 bytes per character in UTF-8, so this read covers the character budget
+    return tmp.read(pdf_extraction.PDF_MAX_CHARS * 4).decode('utf-8', errors='ignore')[:pdf_extraction.PDF_MAX_CHARS], None
+
+
+GEMINI_ERROR_PREFIX = "Error processing the report: "
 
 
 def summarize_with_gemini(prompt: str, model_name=DEFAULT_MODEL):
@@ -66,7 +177,7 @@ def summarize_with_gemini(prompt: str, model_name=DEFAULT_MODEL):
         return summary
     except Exception as e:
         print("Gemini error:", str(e))
-        return f"Error processing the report: {str(e)}"
+        return f"{GEMINI_ERROR_PREFIX}{str(e)}"
 
 
 def ai_summarize(report_content):
@@ -100,8 +211,10 @@ def analyze_consultation_need(doctor_summary: str):
 
     try:
         data = json.loads(raw)
+        parsed = True
     except Exception as e:
         print("JSON parse error:", e)
+        parsed = False
         data = {
             "recommend": True,
             "urgency": "soon",
@@ -111,8 +224,37 @@ def analyze_consultation_need(doctor_summary: str):
     return {
         "recommend": bool(data.get("recommend", False)),
         "urgency": data.get("urgency", "routine"),
-        "short_message": data.get("short_message", "")
+        "short_message": data.get("short_message", ""),
+        "parsed": parsed
+    }
+
+
+def triage_report(report_content, key):
+    """
+    Doctor summary plus consultation advice for a report, memoized by `key`
+    (content hash + model + prompt version). Fallback answers (Gemini error,
+    unparseable triage JSON) are returned but not cached.
+    """
+    started = time.monotonic()
+    doctor_summary = ai_summarize(report_content)
+    consult = analyze_consultation_need(doctor_summary)
+    result = {
+        "doctor_summary": doctor_summary,
+        "recommend": consult["recommend"],
+        "urgency": consult["urgency"],
+        "short_message": consult["short_message"]
     }
+    if doctor_summary and not doctor_summary.startswith(GEMINI_ERROR_PREFIX) and consult["parsed"]:
+        result = summary_cache.put(key, result, time.monotonic() - started)
+    return result
+
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({
+        'error': f'File is larger than {documents.MAX_UPLOAD_BYTES // (1024 * 1024)} MB; request an upload URL from /upload-url instead',
+        'maxBytes': documents.MAX_UPLOAD_BYTES
+    }), 413
 
 
 @app.route('/upload', methods=['POST'])
@@ -127,13 +269,66 @@ def upload_file():
 
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
-        unique_filename = f"{int(round(os.times()[4]*1000))}_{filename}"
-        public_url = upload_to_gcs(file, unique_filename)
-        return jsonify({'fileUrl': public_url})
+        try:
+            file_url, entry, deduplicated = documents.store_upload(file, filename)
+        except DataCorruption as e:
+            print("Upload checksum mismatch:", str(e))
+            return jsonify({'error': 'Upload was corrupted in transit, please try again'}), 502
+        if deduplicated:
+            print(f"Upload of {filename} matches an existing document; not stored again.")
+        return jsonify({'fileUrl': file_url, 'sha256': file.stream.sha256.hexdigest(), 'deduplicated': deduplicated})
 
     return jsonify({'error': 'Invalid file type'}), 400
 
 
+@app.route('/upload-url', methods=['POST'])
+def create_upload_url():
+    """
+    Issues a V4 signed URL so the browser uploads straight to the bucket, without
+    the file passing through this service. With "resumable": true the URL starts a
+    resumable session (POST with x-goog-resumable: start); the Location header of
+    that response is the session URI the client PUTs chunks to.
+    If the client sends the file's "sha256" and we already have it, no URL is issued.
+    """
+    body = request.get_json(silent=True) or {}
+    filename = body.get('filename', '')
+    content_type = body.get('contentType') or 'application/octet-stream'
+    resumable = bool(body.get('resumable'))
+    sha256_hex = str(body.get('sha256') or '').lower()
+    if sha256_hex and not documents.is_sha256(sha256_hex):
+        return jsonify({'error': 'sha256 must be 64 hex characters'}), 400
+
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': 'Invalid file type'}), 400
+
+    if sha256_hex:
+        existing = documents.find_document(sha256_hex, secure_filename(filename))
+        if existing:
+            return jsonify({'fileUrl': public_url(existing), 'sha256': sha256_hex, 'deduplicated': True})
+
+    unique_filename = unique_object_name(filename)
+    blob = bucket.blob(unique_filename)
+    method = 'POST' if resumable else 'PUT'
+    headers = {'x-goog-resumable': 'start'} if resumable else {}
+    expiration = datetime.timedelta(minutes=SIGNED_URL_EXPIRY_MINUTES)
+
+    upload_url = blob.generate_signed_url(
+        version="v4",
+        expiration=expiration,
+        method=method,
+        content_type=content_type,
+        headers=headers or None,
+        **signing_credentials()
+    )
+    return jsonify({
+        'uploadUrl': upload_url,
+        'method': method,
+        'headers': dict(headers, **{'Content-Type': content_type}),
+        'fileUrl': public_url(unique_filename),
+        'expiresInSeconds': int(expiration.total_seconds())
+    })
+
+
 @app.route('/webhook', methods=['POST'])
 def webhook():
     print("Webhook hit")
@@ -149,25 +344,46 @@ def webhook():
 
     if file_url:
         try:
-            response = requests.get(file_url)
-            if response.status_code == 200:
-
-                if file_url.lower().endswith('.pdf'):
-                    report_content = extract_text_from_pdf_bytes(response.content)
-                else:
-                    report_content = response.content.decode('utf-8', errors='ignore')
-
-                if report_content.strip():
-                    doctor_summary = ai_summarize(report_content)
-
-                    consult = analyze_consultation_need(doctor_summary)
-                    should_book_consultation = consult["recommend"]
-                    consultation_urgency = consult["urgency"]
-                    consultation_message = consult["short_message"]
+            # Documents we stored are content-addressed, so a repeat needs no download at all
+            sha256_hex = documents.sha256_from_url(file_url)
+            cached = summary_cache.get(cache_key(sha256_hex, DEFAULT_MODEL)) if sha256_hex else None
+            report_content = None
+            status = None
+
+            if cached is None:
+                index_entry = documents.read_index(sha256_hex) if sha256_hex else None
+                report_content = documents.read_extracted_text(index_entry)
+                if report_content is not None:
+                    print(f"Using stored extracted text for document {sha256_hex}")
                 else:
-                    doctor_summary = "The report file appears empty."
+                    with tempfile.NamedTemporaryFile() as tmp:
+                        status, content_sha256 = download_to_tempfile(file_url, tmp)
+                        if status == 200:
+                            if not sha256_hex:
+                                # Other URLs: key the cache on the downloaded bytes
+                                cached = summary_cache.get(cache_key(content_sha256, DEFAULT_MODEL))
+                            if cached is None:
+                                report_content, page_count = extract_report_text(file_url, tmp)
+                                if sha256_hex:
+                                    try:
+                                        documents.save_extracted_text(sha256_hex, report_content, page_count)
+                                    except Exception as e:
+                                        print("Could not store extracted text:", str(e))
+
+            if cached is None and report_content is not None and report_content.strip():
+                cached = triage_report(report_content, cache_key(sha256_hex or content_sha256, DEFAULT_MODEL))
+            else:
+                print(f"Summary cache hit for {file_url}" if cached is not None else "No report content to summarize")
+
+            if cached is not None:
+                doctor_summary = cached["doctor_summary"]
+                should_book_consultation = cached["recommend"]
+                consultation_urgency = cached["urgency"]
+                consultation_message = cached["short_message"]
+            elif report_content is not None:
+                doctor_summary = "The report file appears empty."
             else:
-                doctor_summary = f"Could not fetch file (HTTP {response.status_code})."
+                doctor_summary = f"Could not fetch file (HTTP {status})."
 
         except Exception as e:
             doctor_summary = f"Error processing file: {str(e)}"
@@ -209,5 +425,10 @@ def webhook():
     })
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return jsonify({'summaryCache': summary_cache.get_stats()})
+
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,112 @@
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import pdfplumber
+
+# Budgets: extraction stops at whichever is reached first, and says so
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", 50))
+PDF_MAX_CHARS = int(os.getenv("PDF_MAX_CHARS", 200000))
+
+# Documents with at least this many pages (within the budget) are split across processes
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 8))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 4)) # Each task opens the file once for this many pages
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", os.cpu_count() or 1))
+
+_pool = None
+
+
+def _get_pool():
+    # "spawn": forking the multi-threaded gunicorn worker (gRPC, HTTP pools) isn't safe.
+    # The pool is created once and its processes are reused across requests.
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PDF_EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _page_text(page):
+    """
+    Text of one page. The page's parsed layout objects and text map are dropped
+    afterwards; pdfplumber otherwise keeps them for every page until the file is
+    closed, so memory grew with the page count.
+    """
+    text = page.extract_text() or ""
+    page.flush_cache()
+    page.get_textmap.cache_clear()
+    return text
+
+
+def _extract_pages(path, start, stop):
+    """Runs in a worker process: text of pages [start, stop), each page extracted once."""
+    with pdfplumber.open(path) as pdf:
+        return [_page_text(page) for page in pdf.pages[start:stop]]
+
+
+def _pooled_chunks(path, pages_to_read):
+    """
+    Yields the text of successive page ranges from the process pool, in page order.
+    Only two tasks per worker are in flight, so when the caller stops at the
+    character budget the pages after it are never extracted.
+    """
+    starts = iter(range(0, pages_to_read, PDF_PAGES_PER_TASK))
+    pending = deque()
+
+    def submit_next():
+        start = next(starts, None)
+        if start is not None:
+            pending.append(_get_pool().submit(_extract_pages, path, start, min(start + PDF_PAGES_PER_TASK, pages_to_read)))
+
+    for _ in range(PDF_EXTRACT_WORKERS * 2):
+        submit_next()
+    try:
+        while pending:
+            future = pending.popleft()
+            submit_next()
+            yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def extract_pdf_text(path, max_pages=PDF_MAX_PAGES, max_chars=PDF_MAX_CHARS):
+    """
+    Extracts text from a PDF on disk (a temp file, never an in-memory copy).
+    Small documents are read in this process; larger ones are split into page ranges
+    handled by a process pool, with results joined in page order. Stops at max_pages
+    or max_chars. Returns (text, page_count, truncated).
+    """
+    with pdfplumber.open(path) as pdf:
+        page_count = len(pdf.pages)
+        pages_to_read = min(page_count, max_pages)
+
+        if pages_to_read < PDF_PARALLEL_MIN_PAGES or PDF_EXTRACT_WORKERS < 2:
+            # Page by page so the character budget can stop early
+            chunks = ([_page_text(page)] for page in pdf.pages[:pages_to_read])
+        else:
+            chunks = _pooled_chunks(path, pages_to_read)
+
+        texts = []
+        chars = 0
+        pages_read = 0
+        truncated = pages_to_read < page_count
+        for chunk in chunks:
+            for page_text in chunk:
+                pages_read += 1
+                if not page_text:
+                    continue
+                if chars + len(page_text) >= max_chars:
+                    texts.append(page_text[:max_chars - chars])
+                    chars = max_chars
+                    truncated = True
+                    break
+                texts.append(page_text)
+                chars += len(page_text) + 1
+            if chars >= max_chars:
+                break
+        chunks.close() # Cancels pool tasks not started yet
+
+    text = "\n".join(texts)
+    print(f"Extracted {len(text)} chars from {pages_read} of {page_count} PDF pages"
+          f"{' (truncated by budget)' if truncated else ''}")
+    return text, page_count, truncated
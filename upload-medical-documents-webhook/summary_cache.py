@@ -0,0 +1,102 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from google.api_core.exceptions import NotFound
+from documents import bucket
+
+# Bump when the summary or triage prompts change, so old answers stop matching
+PROMPT_VERSION = "v1"
+
+# Summaries are stored as summaries/<key>.json. Add a GCS lifecycle rule deleting
+# objects under this prefix after SUMMARY_CACHE_TTL_DAYS to bound the bucket too.
+SUMMARY_CACHE_PREFIX = "summaries/"
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", 512)) # In-memory tier size
+SUMMARY_CACHE_TTL_DAYS = float(os.getenv("SUMMARY_CACHE_TTL_DAYS", 30))
+
+
+def cache_key(content_sha256, model_name, prompt_version=PROMPT_VERSION):
+    return hashlib.sha256(f"{content_sha256}|{model_name}|{prompt_version}".encode("utf-8")).hexdigest()
+
+
+class SummaryCache:
+    """
+    Two-tier cache of summary + triage results. The in-memory LRU answers repeats on
+    this instance; the bucket tier survives restarts and is shared by all instances.
+    Entries older than the TTL are ignored in both tiers.
+    """
+
+    def __init__(self, max_entries=SUMMARY_CACHE_MAX_ENTRIES, ttl_seconds=SUMMARY_CACHE_TTL_DAYS * 86400):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict() # key -> result dict (with cachedAt)
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "persistent_hits": 0, "misses": 0, "stores": 0,
+                      "saved_seconds": 0.0, "errors": 0}
+
+    def _fresh(self, result):
+        return time.time() - result.get("cachedAt", 0) < self.ttl_seconds
+
+    def _remember(self, key, result):
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None and not self._fresh(result):
+                del self._entries[key]
+                result = None
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                self.stats["saved_seconds"] += result.get("computeSeconds", 0)
+                return result
+
+        try:
+            result = json.loads(bucket.blob(f"{SUMMARY_CACHE_PREFIX}{key}.json").download_as_bytes())
+        except NotFound:
+            result = None
+        except Exception as e:
+            print("Summary cache read error:", str(e))
+            self.stats["errors"] += 1
+            result = None
+
+        if result is None or not self._fresh(result):
+            self.stats["misses"] += 1
+            return None
+        self._remember(key, result)
+        self.stats["persistent_hits"] += 1
+        self.stats["saved_seconds"] += result.get("computeSeconds", 0)
+        return result
+
+    def put(self, key, result, compute_seconds):
+        result = dict(result, cachedAt=time.time(), computeSeconds=round(compute_seconds, 3))
+        self._remember(key, result)
+        try:
+            bucket.blob(f"{SUMMARY_CACHE_PREFIX}{key}.json").upload_from_string(
+                json.dumps(result), content_type="application/json"
+            )
+        except Exception as e:
+            print("Summary cache write error:", str(e))
+            self.stats["errors"] += 1
+        self.stats["stores"] += 1
+        return result
+
+    def get_stats(self):
+        hits = self.stats["memory_hits"] + self.stats["persistent_hits"]
+        lookups = hits + self.stats["misses"]
+        return dict(
+            self.stats,
+            saved_seconds=round(self.stats["saved_seconds"], 3),
+            hit_rate=round(hits / lookups, 3) if lookups else 0,
+            memory_entries=len(self._entries),
+        )
+
+
+summary_cache = SummaryCache()